@@ -1,32 +1,190 @@
-from typing import Generator
-from fastapi import Depends, HTTPException, status, Security
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, List, Optional, Tuple
+import hashlib
+import math
+import time
+from fastapi import Depends, HTTPException, Request, status, Security
 from fastapi.security import OAuth2PasswordBearer, APIKeyHeader
 from jose import jwt, JWTError
 from pydantic import ValidationError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.core import metrics, rate_limit, security
+from app.core.cache_invalidation import invalidator
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.db import models
-from app.db.session import SessionLocal
+from app.db import models, session
+from app.db.session import AnySession, AsyncSessionLocal, SessionLocal, run_db
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 api_key_header = APIKeyHeader(name="X-API-KEY", auto_error=False)
 
 
-def get_db() -> Generator:
+@dataclass(frozen=True)
+class ApiKeyUser:
+    """Snapshot of the user behind an API key, safe to cache across requests."""
+
+    id: str
+    is_active: bool
+    rate_limit_per_minute: Optional[int] = None
+    rate_limit_burst: Optional[int] = None
+    recipient_rate_limit_per_hour: Optional[int] = None
+
+
+# API key digest -> ApiKeyUser, per process. With the local invalidation
+# backend a regenerated key keeps working on other workers for up to
+# API_KEY_CACHE_TTL seconds.
+api_key_cache = TTLCache(
+    maxsize=settings.API_KEY_CACHE_SIZE, ttl=settings.API_KEY_CACHE_TTL
+)
+
+
+def _api_key_digest(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+def invalidate_api_key(api_key: str) -> None:
+    """Drop the cached user of an API key, in every worker (see cache_invalidation)."""
+    invalidator.publish("api_key", digest=_api_key_digest(api_key))
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Snapshot of the user behind a bearer token, safe to cache across requests."""
+
+    id: str
+    email: str
+    name: Optional[str]
+    api_key: str
+    is_active: bool
+
+
+# Token digest -> verified claims, kept until the token's exp
+token_cache = TTLCache(
+    maxsize=settings.TOKEN_CACHE_SIZE, ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
+# User id -> CurrentUser, short lived so profile changes show up quickly
+current_user_cache = TTLCache(
+    maxsize=settings.CURRENT_USER_CACHE_SIZE, ttl=settings.CURRENT_USER_CACHE_TTL
+)
+
+
+def invalidate_user(user_id: str, revoke_tokens: bool = False) -> None:
+    """
+    Drop the cached snapshot of a user, e.g. after its API key changed. With
+    ``revoke_tokens`` also forget every verified token of that user, so they
+    are checked again on next use (deactivation, password reset). Applies to
+    every worker (see cache_invalidation) and may block on a Redis round-trip.
+    """
+    invalidator.publish("user", user_id=user_id, revoke_tokens=revoke_tokens)
+
+
+def _evict_user(message: dict) -> None:
+    user_id = message["user_id"]
+    current_user_cache.pop(user_id)
+    if message.get("revoke_tokens"):
+        token_cache.discard_where(lambda _, claims: claims.get("sub") == user_id)
+
+
+invalidator.register("api_key", lambda message: api_key_cache.pop(message["digest"]))
+invalidator.register("user", _evict_user)
+
+
+@asynccontextmanager
+async def _open_session(
+    factory: Callable[[], Session], async_factory: Optional[Callable[[], Any]]
+) -> AsyncIterator[AnySession]:
+    if async_factory is not None:
+        async with async_factory() as db:
+            yield db
+        return
+
+    db = factory()
     try:
-        db = SessionLocal()
         yield db
     finally:
-        db.close()
+        await run_in_threadpool(db.close)
 
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> models.User:
-    try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+async def get_db() -> AsyncGenerator[AnySession, None]:
+    """
+    Yield an AsyncSession when DB_ASYNC is enabled, a sync Session otherwise.
+    Endpoints hand it to ``run_db`` and don't need to know which one they got.
+    """
+    async with _open_session(SessionLocal, AsyncSessionLocal) as db:
+        yield db
+
+
+async def get_read_db() -> AsyncGenerator[AnySession, None]:
+    """
+    Like get_db, but on the read replica while session.replica_router allows
+    it (the primary otherwise). Only for read-only endpoints that can show
+    data up to DB_REPLICA_MAX_LAG_SECONDS old; never for read-your-writes.
+    """
+    router = session.replica_router
+    if router is not None and router.use_replica():
+        factories = (session.ReplicaSessionLocal, session.AsyncReplicaSessionLocal)
+    else:
+        factories = (SessionLocal, AsyncSessionLocal)
+    async with _open_session(*factories) as db:
+        yield db
+
+
+def _get_user_by_id(db: Session, user_id: str) -> Optional[CurrentUser]:
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if user is None:
+        return None
+    return CurrentUser(
+        id=user.id,
+        email=user.email,
+        name=user.name,
+        api_key=user.api_key,
+        is_active=bool(user.is_active),
+    )
+
+
+def _decode_token(token: str) -> dict:
+    # Keyed by a digest of the whole token rather than just its signature, so a
+    # cached entry can never be reached with a tampered header or payload.
+    key = hashlib.sha256(token.encode()).hexdigest()
+    claims = token_cache.get(key)
+    if claims is None:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        exp = claims.get("exp")
+        if exp is not None:
+            token_cache.set(key, claims, ttl=exp - time.time())
+    return claims
+
+
+def _get_user_by_api_key(db: Session, api_key: str) -> Optional[ApiKeyUser]:
+    row = (
+        db.query(
+            models.User.id,
+            models.User.is_active,
+            models.User.rate_limit_per_minute,
+            models.User.rate_limit_burst,
+            models.User.recipient_rate_limit_per_hour,
         )
+        .filter(models.User.api_key == api_key)
+        .first()
+    )
+    if row is None:
+        return None
+    return ApiKeyUser(
+        id=row.id,
+        is_active=bool(row.is_active),
+        rate_limit_per_minute=row.rate_limit_per_minute,
+        rate_limit_burst=row.rate_limit_burst,
+        recipient_rate_limit_per_hour=row.recipient_rate_limit_per_hour,
+    )
+
+
+async def get_current_user(
+    db: AnySession = Depends(get_db), token: str = Depends(oauth2_scheme)
+) -> CurrentUser:
+    try:
+        payload = _decode_token(token)
         token_data = payload.get("sub")
         if token_data is None:
             raise HTTPException(
@@ -38,7 +196,11 @@ def get_current_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = db.query(models.User).filter(models.User.id == token_data).first()
+    user = current_user_cache.get(token_data)
+    if user is None:
+        user = await run_db(db, _get_user_by_id, token_data)
+        if user is not None:
+            current_user_cache.set(token_data, user)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -46,15 +208,22 @@ def get_current_user(
     return user
 
 
-def get_api_key_user(
-    api_key: str = Security(api_key_header), db: Session = Depends(get_db)
-) -> models.User:
+async def get_api_key_user(
+    request: Request,
+    api_key: str = Security(api_key_header),
+    db: AnySession = Depends(get_db),
+) -> ApiKeyUser:
     if not api_key:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="API Key header missing",
         )
-    user = db.query(models.User).filter(models.User.api_key == api_key).first()
+    key = _api_key_digest(api_key)
+    user = api_key_cache.get(key)
+    if user is None:
+        user = await run_db(db, _get_user_by_api_key, api_key)
+        if user is not None:
+            api_key_cache.set(key, user)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -62,4 +231,81 @@ def get_api_key_user(
         )
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    metrics.set_user(request.scope, user.id)
     return user
+
+
+def too_many_requests(wait: float, detail: str) -> HTTPException:
+    headers = None
+    if math.isfinite(wait):
+        headers = {"Retry-After": str(math.ceil(wait))}
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=detail, headers=headers
+    )
+
+
+def service_unavailable(detail: str, retry_after: int = 1) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=detail,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+async def hash_password(password: str) -> str:
+    try:
+        return await security.password_hasher.hash(password)
+    except security.PasswordHasherBusy:
+        raise service_unavailable("Server busy, please retry")
+
+
+async def verify_password(
+    password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """Returns whether it matched and, if the cost changed, the new hash."""
+    try:
+        return await security.password_hasher.verify_and_update(
+            password, hashed_password
+        )
+    except security.PasswordHasherBusy:
+        raise service_unavailable("Server busy, please retry")
+
+
+async def check_send_rate_limit(
+    user: ApiKeyUser, recipients: List[str]
+) -> List[float]:
+    """
+    Charge the user's API key bucket one token per recipient, raising 429 when
+    it runs dry, then take a token from each recipient's bucket and refund the
+    API key for the recipients rejected there. Returns the wait per recipient
+    (0 when allowed); callers decide how to reject those.
+    """
+    limiter = rate_limit.limiter
+    if limiter is None:
+        return [0.0] * len(recipients)
+
+    async def call(fn, *args):
+        if limiter.blocking:
+            return await run_in_threadpool(fn, *args)
+        return fn(*args)
+
+    key_limit = rate_limit.api_key_limit(
+        user.rate_limit_per_minute, user.rate_limit_burst
+    )
+    wait = await call(
+        limiter.hit, rate_limit.API_KEY_SCOPE, user.id, key_limit, len(recipients)
+    )
+    if wait:
+        raise too_many_requests(wait, "Rate limit exceeded for this API key")
+    waits = await call(
+        limiter.hit_many,
+        rate_limit.RECIPIENT_SCOPE,
+        [f"{user.id}:{email.lower()}" for email in recipients],
+        rate_limit.recipient_limit(user.recipient_rate_limit_per_hour),
+    )
+    rejected = sum(1 for wait in waits if wait)
+    if rejected:
+        await call(
+            limiter.refund, rate_limit.API_KEY_SCOPE, user.id, key_limit, rejected
+        )
+    return waits
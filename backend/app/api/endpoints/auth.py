@@ -1,13 +1,15 @@
 from datetime import timedelta
-from typing import Any
+from typing import Any, Optional, Tuple
 import secrets
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from app.api import deps
 from app.core import security
 from app.core.config import settings
 from app.db import models
+from app.db.session import AnySession, run_db
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter()
@@ -36,32 +38,34 @@ class Token(BaseModel):
     user: UserResponse
 
 
-@router.post("/register", response_model=UserResponse)
-def register(
-    user_in: UserCreate,
-    db: Session = Depends(deps.get_db),
-) -> Any:
-    """
-    Create new user.
-    """
-    user = db.query(models.User).filter(models.User.email == user_in.email).first()
-    if user:
+def _generate_api_key(db: Session) -> str:
+    # Generate unique API Key
+    while True:
+        api_key = f"otp_{secrets.token_urlsafe(32)}"
+        if not db.query(models.User).filter(models.User.api_key == api_key).first():
+            return api_key
+
+
+def _check_email_available(db: Session, email: str) -> None:
+    taken = db.query(models.User.id).filter(models.User.email == email).first()
+    # End the read so the connection goes back to the pool during bcrypt
+    db.rollback()
+    if taken:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system",
         )
 
-    # Generate unique API Key
-    while True:
-        api_key = f"otp_{secrets.token_urlsafe(32)}"
-        if not db.query(models.User).filter(models.User.api_key == api_key).first():
-            break
+
+def _create_user(db: Session, user_in: UserCreate, hashed_password: str) -> models.User:
+    # Checked again: another registration may have taken it during bcrypt
+    _check_email_available(db, user_in.email)
 
     user = models.User(
         email=user_in.email,
         name=user_in.name,
-        hashed_password=security.get_password_hash(user_in.password),
-        api_key=api_key,
+        hashed_password=hashed_password,
+        api_key=_generate_api_key(db),
     )
     db.add(user)
     db.commit()
@@ -69,21 +73,57 @@ def register(
     return user
 
 
+@router.post("/register", response_model=UserResponse)
+async def register(
+    user_in: UserCreate,
+    db: AnySession = Depends(deps.get_db),
+) -> Any:
+    """
+    Create new user.
+    """
+    # Before hashing, so repeated sign-ups of a taken email don't occupy the
+    # password hashing pool (bcrypt is CPU bound)
+    await run_db(db, _check_email_available, user_in.email)
+    hashed_password = await deps.hash_password(user_in.password)
+    return await run_db(db, _create_user, user_in, hashed_password)
+
+
+def _get_user_by_email(db: Session, email: str) -> Optional[models.User]:
+    user = db.query(models.User).filter(models.User.email == email).first()
+    if user:
+        db.expunge(user)
+    # End the read so the connection goes back to the pool during bcrypt
+    db.rollback()
+    return user
+
+
+def _update_password_hash(db: Session, user_id: str, new_hash: str) -> None:
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.hashed_password: new_hash}, synchronize_session=False
+    )
+    db.commit()
+
+
 @router.post("/login", response_model=Token)
-def login(
-    db: Session = Depends(deps.get_db),
+async def login(
+    db: AnySession = Depends(deps.get_db),
     form_data: OAuth2PasswordRequestForm = Depends(),
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not security.verify_password(
-        form_data.password, user.hashed_password
-    ):
+    user = await run_db(db, _get_user_by_email, form_data.username)
+    verified, new_hash = False, None
+    if user:
+        verified, new_hash = await deps.verify_password(
+            form_data.password, user.hashed_password
+        )
+    if not verified:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    if new_hash:
+        await run_db(db, _update_password_hash, user.id, new_hash)
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(
@@ -92,30 +132,34 @@ def login(
     return {"access_token": access_token, "token_type": "bearer", "user": user}
 
 
+def _regenerate_api_key(db: Session, user_id: str) -> Tuple[models.User, str]:
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    old_api_key = user.api_key
+    user.api_key = _generate_api_key(db)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user, old_api_key
+
+
 @router.post("/regenerate-api-key", response_model=UserResponse)
-def regenerate_api_key(
-    db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(deps.get_current_user),
+async def regenerate_api_key(
+    db: AnySession = Depends(deps.get_db),
+    current_user: deps.CurrentUser = Depends(deps.get_current_user),
 ) -> Any:
     """
     Regenerate API Key for current user.
     """
-    # Generate new unique API Key
-    while True:
-        new_api_key = f"otp_{secrets.token_urlsafe(32)}"
-        if not db.query(models.User).filter(models.User.api_key == new_api_key).first():
-            break
-
-    current_user.api_key = new_api_key
-    db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    user, old_api_key = await run_db(db, _regenerate_api_key, current_user.id)
+    # Publishing may wait on Redis, so it runs on the threadpool, not in run_db
+    await run_in_threadpool(deps.invalidate_api_key, old_api_key)
+    await run_in_threadpool(deps.invalidate_user, user.id)
+    return user
 
 
 @router.get("/me", response_model=UserResponse)
-def read_users_me(
-    current_user: models.User = Depends(deps.get_current_user),
+async def read_users_me(
+    current_user: deps.CurrentUser = Depends(deps.get_current_user),
 ) -> Any:
     """
     Get current user.
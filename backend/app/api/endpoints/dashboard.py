@@ -1,9 +1,19 @@
-from typing import List, Any
-from datetime import datetime
-from fastapi import APIRouter, Depends
+from typing import Iterator, List, Any, Optional, Tuple
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import base64
+import csv
+import io
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, case, func, or_, select, tuple_
 from sqlalchemy.orm import Session
 from app.api import deps
+from app.core import metrics
+from app.core.config import settings
 from app.db import models
+from app.db.session import AnySession, read_session, run_db, set_local_timeouts
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -29,109 +39,257 @@ class Stats(BaseModel):
     total_requests: int
     success_rate: str
     avg_response: str
+    # Latency of the user's API-key requests served by this worker process
+    # only (latency_samples of them), not across workers
+    p50_response: str = "N/A"
+    p95_response: str = "N/A"
+    p99_response: str = "N/A"
+    latency_samples: int = 0
     active_users: int
     chart_data: List[GraphPoint] = []
 
 
-@router.get("/stats", response_model=Stats)
-def get_stats(
-    db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(deps.get_current_user),
-) -> Any:
+def _get_stats(db: Session, user_id: str, tz: str) -> dict:
     """
-    Get real stats for the dashboard.
+    All dashboard numbers in one round-trip, read from usage_rollups only: the
+    all-time totals come from the daily buckets, the last 7 days from the
+    hourly buckets regrouped into ``tz`` days (zones with a non-whole-hour
+    offset are approximated to the hour), both in one GROUPING SETS pass, and
+    the active user count from a scalar subquery.
     """
-    # Total requests
-    total_requests = (
-        db.query(models.UsageLog)
-        .filter(models.UsageLog.user_id == current_user.id)
-        .count()
-    )
+    zone = ZoneInfo(tz)
+    today = datetime.now(timezone.utc).astimezone(zone).date()
+    first_day = today - timedelta(days=6)
+    since = datetime.combine(first_day, time.min, tzinfo=zone)
 
-    # Success rate
-    success_requests = (
-        db.query(models.UsageLog)
-        .filter(
-            models.UsageLog.user_id == current_user.id,
-            models.UsageLog.status == "success",
+    rollup = models.UsageRollup
+    buckets = (
+        select(
+            case(
+                (
+                    rollup.granularity == "hour",
+                    func.date_trunc("day", func.timezone(tz, rollup.bucket_start)),
+                ),
+            ).label("day"),
+            rollup.granularity,
+            rollup.status,
+            rollup.count,
         )
-        .count()
+        .where(
+            rollup.user_id == user_id,
+            or_(
+                rollup.granularity == "day",
+                and_(rollup.granularity == "hour", rollup.bucket_start >= since),
+            ),
+        )
+        .subquery()
+    )
+    active_users = (
+        select(func.count())
+        .select_from(models.User)
+        .where(models.User.is_active.is_(True))
+        .scalar_subquery()
     )
+    is_daily = buckets.c.granularity == "day"
+    rows = db.execute(
+        select(
+            buckets.c.day,
+            func.grouping(buckets.c.day).label("is_total"),
+            func.coalesce(func.sum(buckets.c.count).filter(is_daily), 0).label(
+                "total"
+            ),
+            func.coalesce(
+                func.sum(buckets.c.count).filter(
+                    is_daily, buckets.c.status == "success"
+                ),
+                0,
+            ).label("success"),
+            func.coalesce(func.sum(buckets.c.count), 0).label("in_day"),
+            active_users.label("active_users"),
+        ).group_by(func.grouping_sets(tuple_(buckets.c.day), tuple_()))
+    ).all()
+
+    total_requests = success_requests = active_count = 0
+    per_day = {}
+    for row in rows:
+        active_count = row.active_users
+        if row.is_total:
+            total_requests, success_requests = int(row.total), int(row.success)
+        elif row.day is not None:
+            per_day[row.day.date()] = int(row.in_day)
 
     success_rate = "0%"
     if total_requests > 0:
         rate = (success_requests / total_requests) * 100
         success_rate = f"{rate:.1f}%"
 
-    # Active users
-    active_users = db.query(models.User).filter(models.User.is_active.is_(True)).count()
-
-    # Generate Chart Data (Last 7 days for simplicity, or 24h)
-    # For a real app, do group_by in SQL. Here we'll just mock safe defaults if empty or simple aggregation.
-    # We will simulate a "Last 7 Days" view for better visualization than 24h which might be too granular for new users.
-    from datetime import timedelta
-
     chart_data = []
-    today = datetime.now()
-
-    for i in range(6, -1, -1):
-        day = today - timedelta(days=i)
-        day_str = day.strftime("%a")  # Mon, Tue...
-
-        # Count logs for this day (simplified, not optimized for scale but fine for MVP)
-        # Note: In production use distinct SQL extraction
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-        count = (
-            db.query(models.UsageLog)
-            .filter(
-                models.UsageLog.user_id == current_user.id,
-                models.UsageLog.timestamp >= day_start,
-                models.UsageLog.timestamp <= day_end,
-            )
-            .count()
-        )
-
-        chart_data.append({"name": day_str, "value": count})
+    for i in range(7):
+        day = first_day + timedelta(days=i)
+        chart_data.append({"name": day.strftime("%a"), "value": per_day.get(day, 0)})
 
     return {
         "total_requests": total_requests,
         "success_rate": success_rate,
-        "avg_response": "124ms",
-        "active_users": active_users,
+        "active_users": active_count,
         "chart_data": chart_data,
     }
 
 
+def encode_cursor(timestamp: datetime, log_id: str) -> str:
+    raw = f"{timestamp.isoformat()}|{log_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, log_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), log_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _logs_query(user_id: str, before: Optional[Tuple[datetime, str]] = None):
+    # Newest first, (timestamp, id) as a stable keyset
+    query = (
+        select(
+            models.UsageLog.id,
+            models.UsageLog.endpoint,
+            models.UsageLog.status,
+            models.UsageLog.timestamp,
+        )
+        .where(models.UsageLog.user_id == user_id)
+        .order_by(models.UsageLog.timestamp.desc(), models.UsageLog.id.desc())
+    )
+    if before is not None:
+        query = query.where(
+            tuple_(models.UsageLog.timestamp, models.UsageLog.id) < tuple_(*before)
+        )
+    return query
+
+
+def _get_logs(
+    db: Session, user_id: str, limit: int, before: Optional[Tuple[datetime, str]]
+) -> list:
+    return db.execute(_logs_query(user_id, before).limit(limit)).all()
+
+
+@router.get("/stats", response_model=Stats)
+async def get_stats(
+    db: AnySession = Depends(deps.get_read_db),
+    current_user: deps.CurrentUser = Depends(deps.get_current_user),
+    tz: str = "UTC",
+) -> Any:
+    """
+    Get real stats for the dashboard. Daily buckets follow the ``tz`` time zone.
+    """
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail="Unknown time zone")
+    stats = await run_db(db, _get_stats, current_user.id, tz)
+    latency = metrics.latency.user_summary(current_user.id)
+    stats["latency_samples"] = latency["count"]
+    stats["avg_response"] = metrics.format_ms(latency["mean"])
+    for quantile in ("p50", "p95", "p99"):
+        stats[f"{quantile}_response"] = metrics.format_ms(latency[quantile])
+    return stats
+
+
 @router.get("/logs", response_model=List[UsageLog])
-def get_logs(
-    db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(deps.get_current_user),
-    limit: int = 10,
+async def get_logs(
+    response: Response,
+    db: AnySession = Depends(deps.get_read_db),
+    current_user: deps.CurrentUser = Depends(deps.get_current_user),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
 ) -> Any:
     """
-    Get recent usage logs for the user.
+    Get recent usage logs for the user, newest first. When more logs exist,
+    the X-Next-Cursor header holds the ``cursor`` for the next page.
     """
-    logs = (
-        db.query(models.UsageLog)
-        .filter(models.UsageLog.user_id == current_user.id)
-        .order_by(models.UsageLog.timestamp.desc())
-        .limit(limit)
-        .all()
-    )
+    before = decode_cursor(cursor) if cursor else None
+    rows = await run_db(db, _get_logs, current_user.id, limit, before)
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            rows[-1].timestamp, rows[-1].id
+        )
 
-    # Manually construct response to include email from relationship
-    result = []
-    for log in logs:
-        result.append(
-            {
-                "id": log.id,
-                "endpoint": log.endpoint,
-                "status": log.status,
-                "timestamp": log.timestamp,
-                "email": log.user.email if log.user else "Unknown",
-            }
+    # Logs are filtered to the current user, so its email needs no lookup
+    return [
+        {
+            "id": row.id,
+            "endpoint": row.endpoint,
+            "status": row.status,
+            "timestamp": row.timestamp,
+            "email": current_user.email,
+        }
+        for row in rows
+    ]
+
+
+EXPORT_FIELDS = ("id", "endpoint", "status", "timestamp", "email")
+
+
+def _export_logs(user_id: str, email: str, fmt: str) -> Iterator[str]:
+    # Runs after the request's session is gone, so it owns its session (on
+    # the replica when allowed). Rows come from a server-side cursor,
+    # EXPORT_BATCH_SIZE at a time.
+    db = read_session()
+    try:
+        # The transaction stays open while a slow client reads the stream
+        set_local_timeouts(db, idle_in_transaction_ms=0)
+        result = db.execute(
+            _logs_query(user_id).execution_options(
+                yield_per=settings.EXPORT_BATCH_SIZE
+            )
         )
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_FIELDS)
+            for rows in result.partitions():
+                for row in rows:
+                    writer.writerow(
+                        (row.id, row.endpoint, row.status, row.timestamp.isoformat(), email)
+                    )
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for rows in result.partitions():
+                yield "".join(
+                    json.dumps(
+                        {
+                            "id": row.id,
+                            "endpoint": row.endpoint,
+                            "status": row.status,
+                            "timestamp": row.timestamp.isoformat(),
+                            "email": email,
+                        }
+                    )
+                    + "\n"
+                    for row in rows
+                )
+    finally:
+        db.close()
 
-    return result
+
+@router.get("/logs/export")
+async def export_logs(
+    current_user: deps.CurrentUser = Depends(deps.get_current_user),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+) -> Any:
+    """
+    Stream every usage log of the user as NDJSON or CSV, newest first.
+    """
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_logs(current_user.id, current_user.email, format),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="usage_logs.{format}"'
+        },
+    )
@@ -0,0 +1,24 @@
+from typing import Any
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.core import warmup
+
+router = APIRouter()
+
+
+@router.get("/live")
+async def live() -> Any:
+    """
+    The process is up and serving requests.
+    """
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def ready() -> Any:
+    """
+    This worker has finished its warmup and is not shutting down.
+    """
+    if not warmup.is_ready():
+        return JSONResponse({"status": "warming up"}, status_code=503)
+    return {"status": "ready"}
@@ -0,0 +1,146 @@
+from typing import Any, List, Optional
+import hmac
+import ipaddress
+from fastapi import APIRouter, Depends, HTTPException, Request, Security
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from app.api import deps
+from app.core import metrics, rate_limit, security, smtp_pool, usage
+from app.core.cache_invalidation import invalidator
+from app.core.config import settings
+from app.db import pool, session
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+metrics_bearer = HTTPBearer(auto_error=False)
+
+
+def _from_allowed_network(request: Request) -> bool:
+    try:
+        address = ipaddress.ip_address(request.client.host)
+    except (AttributeError, ValueError):
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in settings.METRICS_ALLOWED_NETWORKS
+    )
+
+
+def authorize_scrape(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Security(metrics_bearer),
+) -> None:
+    """Let through allowed networks and holders of METRICS_TOKEN."""
+    if _from_allowed_network(request):
+        return
+    if (
+        settings.METRICS_TOKEN
+        and credentials is not None
+        and hmac.compare_digest(
+            credentials.credentials.encode(), settings.METRICS_TOKEN.encode()
+        )
+    ):
+        return
+    raise HTTPException(status_code=403, detail="Not allowed to read metrics")
+
+
+def _component_lines() -> List[str]:
+    """Counters the hot-path components already keep, as gauges."""
+    caches = {
+        "api_key": deps.api_key_cache,
+        "token": deps.token_cache,
+        "current_user": deps.current_user_cache,
+    }
+    cache_stats = {name: cache.stats() for name, cache in caches.items()}
+    lines = []
+    for field in ("size", "hits", "misses"):
+        lines += metrics.gauge_lines(
+            f"cache_{field}",
+            f"In-process cache {field}.",
+            (({"cache": name}, stats[field]) for name, stats in cache_stats.items()),
+        )
+
+    for field, value in invalidator.stats().items():
+        lines += metrics.gauge_lines(
+            f"cache_invalidations_{field}",
+            f"Cache invalidation messages {field}.",
+            [({"backend": invalidator.name}, value)],
+        )
+
+    if usage.usage_buffer is not None:
+        for field, value in usage.usage_buffer.stats().items():
+            lines += metrics.gauge_lines(
+                f"usage_buffer_{field}", f"Usage log buffer {field}.", [({}, value)]
+            )
+
+    if rate_limit.limiter is not None:
+        lines += metrics.gauge_lines(
+            "rate_limit_decisions",
+            "Rate limit decisions since start.",
+            (
+                ({"scope": scope, "decision": decision}, count)
+                for scope, counts in rate_limit.limiter.stats().items()
+                for decision, count in counts.items()
+            ),
+        )
+
+    for field, value in security.password_hasher.stats().items():
+        lines += metrics.gauge_lines(
+            f"password_hasher_{field}", f"Password hashing pool {field}.", [({}, value)]
+        )
+
+    db_pools = pool.pool_stats()
+    for field in (
+        "size",
+        "capacity",
+        "checked_out",
+        "idle",
+        "saturation",
+        "peak_checked_out",
+        "checkouts",
+        "timeouts",
+        "connects",
+        "invalidations",
+        "pings",
+        "ping_failures",
+    ):
+        lines += metrics.gauge_lines(
+            f"db_pool_{field}",
+            f"Database connection pool {field}.",
+            (({"engine": engine}, stats[field]) for engine, stats in db_pools.items()),
+        )
+    lines += metrics.histogram_lines(
+        "db_pool_checkout_wait_seconds",
+        "Time spent waiting for a database connection.",
+        (({"engine": engine}, wait) for engine, wait in pool.wait_histograms().items()),
+    )
+
+    if session.replica_router is not None:
+        for field, value in session.replica_router.stats().items():
+            lines += metrics.gauge_lines(
+                f"db_replica_{field}", f"Read replica routing {field}.", [({}, value)]
+            )
+
+    pools = smtp_pool.pool_stats()
+    for field in ("idle", "connections_opened", "messages_sent"):
+        lines += metrics.gauge_lines(
+            f"smtp_pool_{field}",
+            f"SMTP connection pool {field}.",
+            (({"account": account}, stats[field]) for account, stats in pools.items()),
+        )
+    return lines
+
+
+@router.get(
+    "/metrics", include_in_schema=False, dependencies=[Depends(authorize_scrape)]
+)
+async def get_metrics() -> Any:
+    """
+    Latency histograms and component counters of this worker process, in the
+    Prometheus text format. Each series is labelled with the worker.
+    """
+    body = metrics.latency.render(include_users=settings.METRICS_EXPORT_USERS)
+    body += "\n".join(_component_lines()) + "\n"
+    return PlainTextResponse(body, media_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,16 +1,25 @@
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, List, Optional, Tuple
+import asyncio
 import secrets
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from app.api import deps
-from app.db import models
-from app.core import email_utils
-from pydantic import BaseModel, EmailStr
-from passlib.context import CryptContext
+from app.db.session import AnySession, run_db
+from app.core import (
+    email_templates,
+    email_utils,
+    otp_hashing,
+    otp_store,
+    outbox,
+    usage,
+)
+from app.core.config import settings
+from pydantic import BaseModel, EmailStr, TypeAdapter, ValidationError
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 class OTPRequest(BaseModel):
@@ -26,153 +35,281 @@ class OTPResponse(BaseModel):
     message: str
 
 
-def send_smtp_email(to_email: str, otp_code: str):
+class OTPBatchRequest(BaseModel):
+    emails: List[str]
+
+
+class OTPBatchResult(BaseModel):
+    email: str
+    status: str  # sent, invalid, duplicate, rate_limited
+    detail: Optional[str] = None
+
+
+class OTPBatchResponse(BaseModel):
+    sent: int
+    failed: int
+    results: List[OTPBatchResult]
+
+
+_email_adapter = TypeAdapter(EmailStr)
+
+
+def generate_otp_code() -> str:
+    return "".join([str(secrets.randbelow(10)) for _ in range(6)])
+
+
+def build_otp_email(otp_code: str) -> Tuple[str, str, Optional[str]]:
+    """Subject, HTML body and plain-text alternative of the OTP email"""
     subject = "Your OTP Code"
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Your OTP Code</title>
-        <style>
-            * {{ box-sizing: border-box; }}
-            body {{ font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; background-color: #f6f9fc; margin: 0; padding: 0; color: #333333; -webkit-text-size-adjust: 100%; }}
-            .wrapper {{ width: 100%; table-layout: fixed; background-color: #f6f9fc; padding-bottom: 40px; }}
-            .container {{ max-width: 600px; margin: 0 auto; background-color: #ffffff; padding: 40px; border-radius: 8px; box-shadow: 0 4px 12px rgba(0, 0, 0, 0.05); margin-top: 40px; }}
-            .header {{ text-align: center; padding-bottom: 20px; border-bottom: 1px solid #eeeeee; margin-bottom: 30px; }}
-            .header h1 {{ margin: 0; color: #2c3e50; font-size: 24px; font-weight: 600; }}
-            .content {{ text-align: center; }}
-            .otp-code {{ font-size: 32px; font-weight: bold; letter-spacing: 5px; color: #007bff; background-color: #f0f7ff; padding: 15px 30px; border-radius: 6px; display: inline-block; margin: 20px 0; border: 1px solid #cce5ff; }}
-            .text {{ font-size: 16px; line-height: 1.6; color: #555555; margin-bottom: 20px; }}
-            .footer {{ text-align: center; font-size: 12px; color: #999999; margin-top: 30px; border-top: 1px solid #eeeeee; padding-top: 20px; }}
-            .footer p {{ margin: 5px 0; }}
-            
-            @media only screen and (max-width: 600px) {{
-                .container {{ width: 100% !important; border-radius: 0 !important; margin-top: 0 !important; padding: 30px 20px !important; box-shadow: none !important; }}
-                .wrapper {{ padding-bottom: 0 !important; }}
-                .otp-code {{ font-size: 28px !important; padding: 12px 20px !important; letter-spacing: 2px !important; width: 100% !important; }}
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="wrapper">
-            <div class="container">
-                <div class="header">
-                    <h1>OTP Verification</h1>
-                </div>
-                <div class="content">
-                    <p class="text">Hello,</p>
-                    <p class="text">Please use the verification code below to complete your secure login request.</p>
-                    
-                    <div class="otp-code">{otp_code}</div>
-                    
-                    <p class="text">This code is valid for <strong>5 minutes</strong>. <br>If you did not request this code, please ignore this email.</p>
-                </div>
-                <div class="footer">
-                    <p>&copy; {datetime.now().year} OTPify Service. All rights reserved.</p>
-                    <p>This is an automated message, please do not reply.</p>
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    email_utils.send_email(
-        recipient=to_email, subject=subject, html_content=html_content
+    html_content, text_content = email_templates.render_email("otp", otp_code=otp_code)
+    return subject, html_content, text_content
+
+
+async def send_smtp_email(to_email: str, otp_code: str):
+    subject, html_content, text_content = build_otp_email(otp_code)
+    await email_utils.send_email_async(
+        recipient=to_email,
+        subject=subject,
+        html_content=html_content,
+        text_content=text_content,
+    )
+
+
+async def _call_store(db: AnySession, method: str, *args) -> Any:
+    """Call an OtpStore method the way its backend needs to be called."""
+    store = otp_store.store
+    fn = getattr(store, method)
+    if store.uses_db:
+        return await run_db(db, fn, *args)
+    if store.blocking:
+        return await run_in_threadpool(fn, None, *args)
+    return fn(None, *args)
+
+
+async def _hash_codes(codes: List[Tuple[str, str]]) -> List[str]:
+    """Hash (email, code) pairs, on the threadpool when the scheme is slow."""
+
+    def hash_all() -> List[str]:
+        return [otp_hashing.hash_code(email, code) for email, code in codes]
+
+    if otp_hashing.get_hasher().slow:
+        return await run_in_threadpool(hash_all)
+    return hash_all()
+
+
+async def _verify(db: AnySession, email: str, otp: str) -> otp_store.VerifyResult:
+    store = otp_store.store
+    if not (store.uses_db and isinstance(db, AsyncSession)):
+        return await _call_store(db, "verify", email, otp)
+    # run_sync runs on the event loop, so a hash that has to be compared in
+    # Python (bcrypt) is checked on the threadpool between the two halves
+    found = await run_db(db, store.lock_for_verify, email, otp)
+    if isinstance(found, otp_store.VerifyResult):
+        return found
+    matched = await run_in_threadpool(
+        otp_hashing.verify_code, email, otp, found.otp_hash
     )
+    return await run_db(db, store.record_attempt, found, matched)
+
+
+def _store_otp(
+    db: Session,
+    user_id: str,
+    record: otp_store.OtpRecord,
+    outbox_email: Optional[Tuple[str, str, Optional[str]]] = None,
+) -> None:
+    if otp_store.store.uses_db:
+        otp_store.store.put(db, record)
+
+    usage.log_usage(db, user_id, "/api/otp/send", "success")
+
+    if outbox_email:
+        outbox.enqueue_email(db, record.email, *outbox_email)
+    db.commit()
 
 
 @router.post("/send", response_model=OTPResponse)
-def send_otp(
+async def send_otp(
     otp_in: OTPRequest,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(deps.get_api_key_user),
+    db: AnySession = Depends(deps.get_db),
+    current_user: deps.ApiKeyUser = Depends(deps.get_api_key_user),
 ) -> Any:
     """
     Send OTP to email. Requires API Key.
     """
+    # 0. Rate limits, before anything is written
+    (wait,) = await deps.check_send_rate_limit(current_user, [otp_in.email])
+    if wait:
+        raise deps.too_many_requests(wait, "Too many OTPs sent to this email")
+
     # 1. Generate 6 digit OTP
-    otp_code = "".join([str(secrets.randbelow(10)) for _ in range(6)])
-    otp_hash = pwd_context.hash(otp_code)
+    otp_code = generate_otp_code()
+    (otp_hash,) = await _hash_codes([(otp_in.email, otp_code)])
 
     # 2. Expiry 5 mins
     expires_at = datetime.now(timezone.utc) + timedelta(minutes=5)
 
-    # 3. Store in DB
-    otp_obj = models.OTP(
-        email=otp_in.email,
-        otp_hash=otp_hash,
-        expires_at=expires_at,
-        is_verified=False,
-        attempts=0,
-    )
-    db.add(otp_obj)
-
-    # 4. Log usage
-    log_obj = models.UsageLog(
-        user_id=current_user.id, endpoint="/api/otp/send", status="success"
-    )
-    db.add(log_obj)
-    db.commit()
+    # 3. Store the code and log usage (with the email itself when the outbox
+    # is on). Stores outside the database are written first, so a queued email
+    # never refers to a code that wasn't saved.
+    record = otp_store.OtpRecord(otp_in.email, otp_hash, expires_at)
+    if not otp_store.store.uses_db:
+        await _call_store(db, "put", record)
+    outbox_email = None
+    if settings.EMAIL_OUTBOX_ENABLED:
+        outbox_email = build_otp_email(otp_code)
+    await run_db(db, _store_otp, current_user.id, record, outbox_email)
 
-    # 5. Send Email (Background task)
-    background_tasks.add_task(send_smtp_email, otp_in.email, otp_code)
+    # 4. Send Email (Background task) unless the outbox delivers it
+    if not outbox_email:
+        background_tasks.add_task(send_smtp_email, otp_in.email, otp_code)
 
     return {"message": "OTP sent successfully"}
 
 
-@router.post("/verify", response_model=OTPResponse)
-def verify_otp(
-    otp_in: OTPVerify,
-    db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(deps.get_api_key_user),
+async def send_smtp_emails(messages: List[Tuple[str, str]]):
+    """Deliver a batch of (email, otp_code) pairs over the shared client."""
+    semaphore = asyncio.Semaphore(settings.EMAIL_HTTP_MAX_CONNECTIONS)
+
+    async def send_one(to_email: str, otp_code: str):
+        async with semaphore:
+            await send_smtp_email(to_email, otp_code)
+
+    await asyncio.gather(*(send_one(email, code) for email, code in messages))
+
+
+def _store_otp_batch(
+    db: Session,
+    records: List[otp_store.OtpRecord],
+    usage_records: List[usage.UsageEvent],
+    outbox_emails: List[Tuple[str, str, str, Optional[str]]],
+) -> None:
+    # One multi-row INSERT per table, one commit for the whole batch
+    if otp_store.store.uses_db:
+        otp_store.store.put_many(db, records)
+    usage.log_usage_many(db, usage_records)
+    outbox.enqueue_emails(db, outbox_emails)
+    db.commit()
+
+
+@router.post("/send-batch", response_model=OTPBatchResponse)
+async def send_otp_batch(
+    batch_in: OTPBatchRequest,
+    background_tasks: BackgroundTasks,
+    db: AnySession = Depends(deps.get_db),
+    current_user: deps.ApiKeyUser = Depends(deps.get_api_key_user),
 ) -> Any:
     """
-    Verify OTP. Requires API Key.
+    Send OTPs to up to OTP_BATCH_MAX_SIZE emails in one call. Requires API Key.
     """
-    # 1. Find latest unverified OTP for email
-    otp_obj = (
-        db.query(models.OTP)
-        .filter(models.OTP.email == otp_in.email, models.OTP.is_verified.is_(False))
-        .order_by(models.OTP.created_at.desc())
-        .first()
-    )
-
-    if not otp_obj:
+    if not batch_in.emails:
+        raise HTTPException(status_code=400, detail="No emails provided")
+    if len(batch_in.emails) > settings.OTP_BATCH_MAX_SIZE:
         raise HTTPException(
-            status_code=400, detail="No active OTP found for this email"
+            status_code=413,
+            detail=f"Batch size exceeds maximum of {settings.OTP_BATCH_MAX_SIZE}",
         )
 
-    # 2. Check attempts
-    if otp_obj.attempts >= 5:
-        raise HTTPException(
-            status_code=400, detail="Too many attempts. Request a new OTP."
-        )
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(minutes=5)
+
+    results = []
+    seen = set()
+    accepted = []
+    for raw_email in batch_in.emails:
+        try:
+            email = _email_adapter.validate_python(raw_email)
+        except ValidationError:
+            results.append(
+                {"email": raw_email, "status": "invalid", "detail": "Invalid email"}
+            )
+            continue
+        if email in seen:
+            results.append(
+                {"email": raw_email, "status": "duplicate", "detail": "Duplicate email"}
+            )
+            continue
+        seen.add(email)
+        accepted.append((len(results), raw_email, email))
+        results.append(None)
 
-    # 3. Check expiry
-    if datetime.now(timezone.utc) > otp_obj.expires_at:
-        raise HTTPException(status_code=400, detail="OTP expired")
+    waits = []
+    if accepted:
+        waits = await deps.check_send_rate_limit(
+            current_user, [email for _, _, email in accepted]
+        )
 
-    # 4. Verify hash
-    if not pwd_context.verify(otp_in.otp, otp_obj.otp_hash):
-        otp_obj.attempts += 1
+    codes = []
+    for (index, raw_email, email), wait in zip(accepted, waits):
+        if wait:
+            results[index] = {
+                "email": raw_email,
+                "status": "rate_limited",
+                "detail": "Too many OTPs sent to this email",
+            }
+            continue
+        codes.append((email, generate_otp_code()))
+        results[index] = {"email": raw_email, "status": "sent"}
 
-        log_obj = models.UsageLog(
-            user_id=current_user.id, endpoint="/api/otp/verify", status="failed"
+    hashes = await _hash_codes(codes)
+    records, usage_records, outbox_emails, deliveries = [], [], [], []
+    for (email, otp_code), otp_hash in zip(codes, hashes):
+        records.append(otp_store.OtpRecord(email, otp_hash, expires_at))
+        usage_records.append(
+            (current_user.id, "/api/otp/send-batch", "success", now, 1)
         )
-        db.add(log_obj)
-        db.commit()
-        raise HTTPException(status_code=400, detail="Invalid OTP")
+        if settings.EMAIL_OUTBOX_ENABLED:
+            outbox_emails.append((email, *build_otp_email(otp_code)))
+        else:
+            deliveries.append((email, otp_code))
+
+    if records:
+        if not otp_store.store.uses_db:
+            await _call_store(db, "put_many", records)
+        await run_db(db, _store_otp_batch, records, usage_records, outbox_emails)
+    if deliveries:
+        background_tasks.add_task(send_smtp_emails, deliveries)
+
+    return {
+        "sent": len(records),
+        "failed": len(results) - len(records),
+        "results": results,
+    }
 
-    # 5. Success
-    otp_obj.is_verified = True
 
-    log_obj = models.UsageLog(
-        user_id=current_user.id, endpoint="/api/otp/verify", status="success"
+# Refusals that are reported without being logged as a verify attempt
+_REFUSED = {
+    otp_store.VerifyResult.NOT_FOUND: "No active OTP found for this email",
+    otp_store.VerifyResult.TOO_MANY_ATTEMPTS: "Too many attempts. Request a new OTP.",
+    otp_store.VerifyResult.EXPIRED: "OTP expired",
+}
+
+
+def _log_verify(db: Session, user_id: str, verified: bool) -> None:
+    usage.log_usage(
+        db, user_id, "/api/otp/verify", "success" if verified else "failed"
     )
-    db.add(log_obj)
     db.commit()
 
+
+@router.post("/verify", response_model=OTPResponse)
+async def verify_otp(
+    otp_in: OTPVerify,
+    db: AnySession = Depends(deps.get_db),
+    current_user: deps.ApiKeyUser = Depends(deps.get_api_key_user),
+) -> Any:
+    """
+    Verify OTP. Requires API Key.
+    """
+    result = await _verify(db, otp_in.email, otp_in.otp)
+    if result in _REFUSED:
+        raise HTTPException(status_code=400, detail=_REFUSED[result])
+
+    # Also commits the database store's attempt/is_verified update
+    verified = result == otp_store.VerifyResult.VERIFIED
+    await run_db(db, _log_verify, current_user.id, verified)
+    if not verified:
+        raise HTTPException(status_code=400, detail="Invalid OTP")
+
     return {"message": "OTP verified successfully"}
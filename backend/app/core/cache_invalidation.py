@@ -0,0 +1,145 @@
+"""
+Invalidation of the per-process auth caches (API key users, current-user
+snapshots, verified tokens) across worker processes.
+
+Callers publish a message such as ``("api_key", {"digest": ...})`` and every
+process applies the handler registered for its kind. CACHE_INVALIDATION_BACKEND
+selects how far messages reach:
+
+- ``local``: only the publishing process. Other workers keep their entries
+  until API_KEY_CACHE_TTL / CURRENT_USER_CACHE_TTL run out, so keep those short
+  when running several workers.
+- ``redis``: also broadcast on a Redis pub/sub channel (REDIS_URL) that every
+  worker subscribes to. Messages published while a worker is disconnected are
+  lost, so the TTLs remain the upper bound on staleness.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], None]
+
+
+class Invalidator:
+    """Applies published messages in this process only."""
+
+    name = "local"
+
+    def __init__(self):
+        self._handlers: Dict[str, Handler] = {}
+        self.published = 0
+        self.received = 0
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    def _apply(self, kind: str, fields: dict) -> None:
+        handler = self._handlers.get(kind)
+        if handler is not None:
+            handler(fields)
+
+    def publish(self, kind: str, **fields) -> None:
+        self.published += 1
+        self._apply(kind, fields)
+
+    def start(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"published": self.published, "received": self.received}
+
+
+class RedisInvalidator(Invalidator):
+    """
+    Also broadcasts messages to the other processes. Publishing blocks on a
+    Redis round-trip; a failed publish is logged and only the TTLs apply.
+    """
+
+    name = "redis"
+    channel = "otpify:cache-invalidation"
+
+    def __init__(self, client):
+        super().__init__()
+        self._client = client
+        # Our own messages come back through the subscription; skip them
+        self._origin = uuid.uuid4().hex
+        self._pubsub = None
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisInvalidator":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "CACHE_INVALIDATION_BACKEND=redis requires the 'redis' package"
+            ) from None
+        return cls(
+            redis.Redis.from_url(
+                url, decode_responses=True, socket_connect_timeout=2, socket_timeout=2
+            )
+        )
+
+    def publish(self, kind: str, **fields) -> None:
+        super().publish(kind, **fields)
+        message = json.dumps({"origin": self._origin, "kind": kind, "fields": fields})
+        try:
+            self._client.publish(self.channel, message)
+        except Exception as exc:
+            logger.warning("Cache invalidation not broadcast: %s", exc)
+
+    def _on_message(self, message: dict) -> None:
+        try:
+            data = json.loads(message["data"])
+        except (TypeError, ValueError):
+            return
+        if data.get("origin") == self._origin:
+            return
+        self.received += 1
+        self._apply(data.get("kind"), data.get("fields") or {})
+
+    def _on_error(self, exc, pubsub, thread) -> None:
+        # The thread keeps polling and redis-py resubscribes on reconnect
+        logger.warning("Cache invalidation subscription failed: %s", exc)
+        time.sleep(1)
+
+    def start(self) -> None:
+        """Subscribe in a background thread. Called per worker, after the fork."""
+        if self._thread is not None:
+            return
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: self._on_message})
+        self._thread = self._pubsub.run_in_thread(
+            sleep_time=1.0, daemon=True, exception_handler=self._on_error
+        )
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub = None
+        self._client.close()
+
+
+def create_invalidator(backend: str) -> Invalidator:
+    if backend == Invalidator.name:
+        return Invalidator()
+    if backend == RedisInvalidator.name:
+        return RedisInvalidator.from_url(settings.REDIS_URL)
+    raise ValueError(f"Unknown CACHE_INVALIDATION_BACKEND: {backend}")
+
+
+invalidator = create_invalidator(settings.CACHE_INVALIDATION_BACKEND)
@@ -0,0 +1,146 @@
+"""
+Email templates, loaded from app/templates/email.
+
+Every email is mostly static: a few KB of markup and CSS around one or two
+values. Templates are therefore rendered once per process with the static
+context (the year) and a marker in place of every other variable, and the
+output is split on those markers. Rendering an email is then a join of the
+literal chunks with the escaped values.
+
+That only works for templates that print their variables as-is. Each compiled
+template is checked against a plain Jinja render, and templates that filter or
+branch on their variables fall back to being rendered by Jinja every time.
+
+``<name>.html`` is the body; an optional ``<name>.txt`` next to it is the
+plain-text alternative.
+"""
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, meta
+from jinja2 import TemplateNotFound, select_autoescape
+from markupsafe import escape
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "templates" / "email"
+
+# Never produced by a template, left alone by HTML escaping
+MARKER = "\x00"
+
+environment = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+    undefined=StrictUndefined,
+    auto_reload=False,
+    keep_trailing_newline=True,
+)
+
+
+def _static_context() -> dict:
+    return {"year": datetime.now().year}
+
+
+class CompiledTemplate:
+    """A template pre-rendered around its variables."""
+
+    def __init__(self, name: str, static_context: dict):
+        self.name = name
+        self.static_context = static_context
+        self._template = environment.get_template(name)
+        self._autoescape = environment.autoescape(name)
+
+        source = environment.loader.get_source(environment, name)[0]
+        self.variables = sorted(
+            meta.find_undeclared_variables(environment.parse(source))
+            - set(static_context)
+        )
+        rendered = self._template.render(
+            **static_context,
+            **{var: f"{MARKER}{var}{MARKER}" for var in self.variables},
+        )
+        parts = rendered.split(MARKER)
+        self._literals: List[str] = parts[0::2]
+        self._names: List[str] = parts[1::2]
+
+        probe = {var: f"<{var}&{index}>" for index, var in enumerate(self.variables)}
+        self.precompiled = (
+            set(self._names) <= set(self.variables)
+            and self._join(probe) == self._template.render(**static_context, **probe)
+        )
+        if not self.precompiled:
+            logger.warning(
+                f"Email template {name} transforms its variables; "
+                "rendering it with Jinja on every call"
+            )
+
+    def _join(self, values: dict) -> str:
+        quote = escape if self._autoescape else str
+        chunks = [self._literals[0]]
+        for name, literal in zip(self._names, self._literals[1:]):
+            chunks.append(quote(values[name]))
+            chunks.append(literal)
+        return "".join(chunks)
+
+    def render(self, **values) -> str:
+        missing = set(self.variables) - set(values)
+        if missing:
+            raise ValueError(f"Missing values for {self.name}: {sorted(missing)}")
+        if self.precompiled:
+            return self._join(values)
+        return self._template.render(**self.static_context, **values)
+
+
+_compiled: Dict[str, CompiledTemplate] = {}
+_missing = set()
+_lock = threading.Lock()
+
+
+def get_template(name: str) -> Optional[CompiledTemplate]:
+    """The compiled template, or None when the file doesn't exist."""
+    static_context = _static_context()
+    template = _compiled.get(name)
+    if template is not None and template.static_context == static_context:
+        return template
+    if name in _missing:
+        return None
+    with _lock:
+        try:
+            template = CompiledTemplate(name, static_context)
+        except TemplateNotFound:
+            _missing.add(name)
+            return None
+        _compiled[name] = template
+        return template
+
+
+def load_templates() -> None:
+    """Compile every template up front, so no request pays for it."""
+    for name in environment.list_templates(extensions=["html", "txt"]):
+        get_template(name)
+
+
+def render(name: str, **values) -> str:
+    template = get_template(name)
+    if template is None:
+        raise TemplateNotFound(name)
+    return template.render(**values)
+
+
+def render_email(name: str, **values) -> Tuple[str, Optional[str]]:
+    """
+    Render ``<name>.html`` and, when it exists and EMAIL_TEXT_ALTERNATIVE is
+    on, the ``<name>.txt`` plain-text alternative.
+    """
+    html_content = render(f"{name}.html", **values)
+    text_content = None
+    if settings.EMAIL_TEXT_ALTERNATIVE:
+        text_template = get_template(f"{name}.txt")
+        if text_template is not None:
+            text_content = text_template.render(**values)
+    return html_content, text_content
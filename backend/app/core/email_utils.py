@@ -1,90 +1,220 @@
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import Optional
 import httpx
+from starlette.concurrency import run_in_threadpool
+from app.core import email_templates, smtp_balancer, smtp_pool
 from app.core.config import settings
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared HTTP clients for Brevo. Keeping them around means DNS, TCP and TLS are
+# paid once per pooled connection instead of once per email.
+_async_client: Optional[httpx.AsyncClient] = None
+_client: Optional[httpx.Client] = None
+
+
+def _client_options() -> dict:
+    return {
+        "http2": settings.EMAIL_HTTP2,
+        "limits": httpx.Limits(
+            max_connections=settings.EMAIL_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.EMAIL_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.EMAIL_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(
+            settings.EMAIL_HTTP_TIMEOUT, connect=settings.EMAIL_HTTP_CONNECT_TIMEOUT
+        ),
+    }
+
+
+async def open_http_client() -> httpx.AsyncClient:
+    """Create the shared async client. Called on app startup."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(**_client_options())
+    return _async_client
+
+
+async def close_http_client() -> None:
+    """Close the shared clients. Called on app shutdown."""
+    global _async_client, _client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def _get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        _client = httpx.Client(**_client_options())
+    return _client
+
+
+def _brevo_request(
+    recipient: str,
+    subject: str,
+    html_content: str,
+    text_content: Optional[str] = None,
+) -> dict:
+    request = {
+        "url": settings.BREVO_API_URL,
+        "headers": {
+            "accept": "application/json",
+            "api-key": settings.BREVO_API_KEY,
+            "content-type": "application/json",
+        },
+        "json": {
+            "sender": {
+                "name": settings.EMAILS_FROM_NAME,
+                "email": settings.EMAILS_FROM_EMAIL,
+            },
+            "to": [{"email": recipient, "name": recipient.split("@")[0]}],
+            "subject": subject,
+            "htmlContent": html_content,
+        },
+    }
+    if text_content:
+        request["json"]["textContent"] = text_content
+    return request
+
+
+def _check_brevo_response(response: httpx.Response, recipient: str) -> bool:
+    if response.status_code in [201, 200, 202]:
+        logger.info(f"Email sent successfully via Brevo to {recipient}")
+        return True
+    logger.error(
+        f"Failed to send email via Brevo: {response.text} Code: {response.status_code}"
+    )
+    return False
+
+
+def _smtp_message(
+    recipient: str,
+    subject: str,
+    html_content: str,
+    text_content: Optional[str],
+    from_email: Optional[str] = None,
+) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["From"] = formataddr(
+        (
+            settings.EMAILS_FROM_NAME,
+            from_email or settings.EMAILS_FROM_EMAIL or settings.SMTP_USER,
+        )
+    )
+    message["To"] = recipient
+    if text_content:
+        message.set_content(text_content)
+        message.add_alternative(html_content, subtype="html")
+    else:
+        message.set_content(html_content, subtype="html")
+    return message
+
+
+def _smtp_configured() -> bool:
+    return bool(settings.SMTP_USER and settings.SMTP_PASSWORD)
+
+
+def _send_smtp(
+    recipient: str,
+    subject: str,
+    html_content: str,
+    text_content: Optional[str] = None,
+) -> bool:
+    try:
+        if settings.SMTP_BALANCER_ENABLED:
+            try:
+                # Providers like Gmail only send as the authenticated account
+                smtp_balancer.send(
+                    lambda from_email: _smtp_message(
+                        recipient, subject, html_content, text_content, from_email
+                    )
+                )
+                logger.info(f"Email sent successfully to {recipient}")
+                return True
+            except smtp_balancer.NoAccountAvailable:
+                if not _smtp_configured():
+                    raise
+                logger.warning("No SMTP account available, using SMTP_USER")
+        message = _smtp_message(recipient, subject, html_content, text_content)
+        smtp_pool.get_pool().send(message)
+        logger.info(f"Email sent successfully to {recipient}")
+        return True
+    except smtp_balancer.NoAccountAvailable as e:
+        logger.error(f"Email to {recipient} not sent: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"Exception sending email: {str(e)}", exc_info=True)
+        return False
+
 
 def send_email(
     recipient: str,
     subject: str,
     html_content: str,
-) -> None:
+    text_content: Optional[str] = None,
+) -> bool:
     """
     Send an email using Brevo API (or SMTP as fallback if configured).
+    Returns True if the provider accepted the message.
     """
     if settings.BREVO_API_KEY:
         try:
-            url = "https://api.brevo.com/v3/smtp/email"
-            headers = {
-                "accept": "application/json",
-                "api-key": settings.BREVO_API_KEY,
-                "content-type": "application/json",
-            }
-            payload = {
-                "sender": {
-                    "name": settings.EMAILS_FROM_NAME,
-                    "email": settings.EMAILS_FROM_EMAIL,
-                },
-                "to": [{"email": recipient, "name": recipient.split("@")[0]}],
-                "subject": subject,
-                "htmlContent": html_content,
-            }
-
-            with httpx.Client() as client:
-                response = client.post(url, headers=headers, json=payload, timeout=10.0)
-
-            if response.status_code in [201, 200, 202]:
-                logger.info(f"Email sent successfully via Brevo to {recipient}")
-            else:
-                logger.error(
-                    f"Failed to send email via Brevo: {response.text} Code: {response.status_code}"
-                )
-
+            request = _brevo_request(recipient, subject, html_content, text_content)
+            response = _get_client().post(**request)
+            return _check_brevo_response(response, recipient)
         except Exception as e:
             logger.error(f"Exception sending email via Brevo: {str(e)}", exc_info=True)
+            return False
 
-    elif settings.SMTP_USER and settings.SMTP_PASSWORD:
+    elif settings.SMTP_BALANCER_ENABLED or _smtp_configured():
         # Fallback to old SMTP logic if Brevo key not present
-        import emails
+        return _send_smtp(recipient, subject, html_content, text_content)
+
+    logger.warning(
+        "No email credentials configured (Brevo or SMTP). Email will not be sent."
+    )
+    return False
+
 
+async def send_email_async(
+    recipient: str,
+    subject: str,
+    html_content: str,
+    text_content: Optional[str] = None,
+) -> bool:
+    """
+    Async variant of send_email, using the shared pooled client for Brevo.
+    """
+    if settings.BREVO_API_KEY:
         try:
-            message = emails.Message(
-                subject=subject,
-                html=html_content,
-                mail_from=(
-                    settings.EMAILS_FROM_NAME,
-                    settings.EMAILS_FROM_EMAIL or settings.SMTP_USER,
-                ),
-            )
-            response = message.send(
-                to=recipient,
-                smtp={
-                    "host": settings.SMTP_HOST,
-                    "port": settings.SMTP_PORT,
-                    "tls": settings.SMTP_TLS,
-                    "user": settings.SMTP_USER,
-                    "password": settings.SMTP_PASSWORD,
-                    "timeout": 10,
-                },
-            )
-            if response.status_code not in [250, 200]:
-                logger.error(
-                    f"Failed to send email: {response} Code: {response.status_code} Error: {response.error}"
-                )
-            else:
-                logger.info(f"Email sent successfully to {recipient}")
+            client = await open_http_client()
+            request = _brevo_request(recipient, subject, html_content, text_content)
+            response = await client.post(**request)
+            return _check_brevo_response(response, recipient)
         except Exception as e:
-            logger.error(f"Exception sending email: {str(e)}", exc_info=True)
+            logger.error(f"Exception sending email via Brevo: {str(e)}", exc_info=True)
+            return False
 
-    else:
-        logger.warning(
-            "No email credentials configured (Brevo or SMTP). Email will not be sent."
+    elif settings.SMTP_BALANCER_ENABLED or _smtp_configured():
+        # SMTP library is blocking, keep it off the event loop
+        return await run_in_threadpool(
+            _send_smtp, recipient, subject, html_content, text_content
         )
 
+    logger.warning(
+        "No email credentials configured (Brevo or SMTP). Email will not be sent."
+    )
+    return False
+
 
 def render_email_template(template_name: str, **kwargs) -> str:
-    # Simulating template rendering if we had files, for now just strings
-    # In a full app, you'd load .html files from a directory
-    pass
+    """Render a template from app/templates/email, e.g. ``otp.html``."""
+    return email_templates.render(template_name, **kwargs)
@@ -0,0 +1,252 @@
+"""
+In-process request latency histograms.
+
+``TimingMiddleware`` times every HTTP request, from the moment it reaches the
+app to the last byte of the response (background tasks run after that and
+are not counted), into one histogram per method, route template and status, and one
+per API-key user (set by ``deps.get_api_key_user`` through ``set_user``).
+
+Histograms have fixed log-scale buckets, so recording is a bisect and an
+increment, and quantiles are interpolated linearly within a bucket (buckets
+are a factor of sqrt(2) wide). They are only updated from the event loop, so
+they need no lock. Numbers are per process: with several workers each reports its
+own share of the traffic, so every series on /metrics carries a ``worker``
+label (the pid) and totals come from summing over it, e.g.
+``sum without (worker) (...)``.
+"""
+import math
+import os
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+# Upper bounds in seconds: 0.5ms to ~23s, two buckets per doubling
+BUCKETS: Tuple[float, ...] = tuple(0.0005 * 2 ** (i / 2) for i in range(32))
+
+# Key of the API-key user in the ASGI scope state (request.state)
+USER_STATE_KEY = "metrics_user_id"
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        # One slot per bucket plus +Inf
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Interpolated ``q`` quantile in seconds, None when empty."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                if i == len(BUCKETS):
+                    return lower
+                return lower + (BUCKETS[i] - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+
+class LatencyMetrics:
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self.routes: Dict[Tuple[str, str, str], Histogram] = {}
+        self.users: Dict[str, Histogram] = {}
+
+    def observe(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        seconds: float,
+        user_id: Optional[str] = None,
+    ) -> None:
+        key = (method, route, str(status))
+        histogram = self.routes.get(key)
+        if histogram is None:
+            histogram = self.routes[key] = Histogram()
+        histogram.observe(seconds)
+
+        if user_id is not None:
+            histogram = self.users.get(user_id)
+            if histogram is None:
+                # Past max_users, new users are only counted per route
+                if len(self.users) >= self.max_users:
+                    return
+                histogram = self.users[user_id] = Histogram()
+            histogram.observe(seconds)
+
+    def user_summary(self, user_id: str) -> Dict[str, Optional[float]]:
+        """Mean and p50/p95/p99 in seconds of the user's API-key requests."""
+        histogram = self.users.get(user_id) or Histogram()
+        return {
+            "count": histogram.count,
+            "mean": histogram.mean(),
+            "p50": histogram.quantile(0.50),
+            "p95": histogram.quantile(0.95),
+            "p99": histogram.quantile(0.99),
+        }
+
+    def render(self, include_users: bool = False) -> str:
+        """The histograms in the Prometheus text exposition format."""
+        lines = [
+            "# HELP http_request_duration_seconds HTTP request latency.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route, status), histogram in sorted(self.routes.items()):
+            _histogram_lines(
+                lines,
+                "http_request_duration_seconds",
+                {"method": method, "route": route, "status": status},
+                histogram,
+            )
+        if include_users:
+            lines.append(
+                "# HELP api_key_request_duration_seconds Request latency per "
+                "API-key user."
+            )
+            lines.append("# TYPE api_key_request_duration_seconds histogram")
+            for user_id, histogram in sorted(self.users.items()):
+                _histogram_lines(
+                    lines,
+                    "api_key_request_duration_seconds",
+                    {"user_id": user_id},
+                    histogram,
+                )
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        self.routes.clear()
+        self.users.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+    return "{" + inner + "}"
+
+
+def _histogram_lines(
+    lines: List[str], name: str, labels: Dict[str, str], histogram: Histogram
+) -> None:
+    labels = {**labels, "worker": worker_id()}
+    cumulative = 0
+    for bound, count in zip(BUCKETS, histogram.counts):
+        cumulative += count
+        bucket_labels = format_labels({**labels, "le": f"{bound:.6g}"})
+        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+    bucket_labels = format_labels({**labels, "le": "+Inf"})
+    lines.append(f"{name}_bucket{bucket_labels} {histogram.count}")
+    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+
+def histogram_lines(
+    name: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], Histogram]]
+) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, histogram in samples:
+        _histogram_lines(lines, name, labels, histogram)
+    return lines
+
+
+def gauge_lines(
+    name: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]
+) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        labels = {**labels, "worker": worker_id()}
+        lines.append(f"{name}{format_labels(labels)} {value}")
+    return lines
+
+
+def worker_id() -> str:
+    """The ``worker`` label of this process's series."""
+    return str(os.getpid())
+
+
+def set_user(scope: Scope, user_id: str) -> None:
+    """Attribute the request's latency to ``user_id``."""
+    scope.setdefault("state", {})[USER_STATE_KEY] = user_id
+
+
+def format_ms(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "N/A"
+    return f"{seconds * 1000:.0f}ms"
+
+
+class TimingMiddleware:
+    """Pure ASGI middleware recording into ``latency``."""
+
+    def __init__(self, app: ASGIApp, metrics: "LatencyMetrics" = None):
+        self.app = app
+        self.metrics = metrics or latency
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        recorded = False
+
+        def record() -> None:
+            nonlocal recorded
+            recorded = True
+            route = scope.get("route")
+            state = scope.get("state") or {}
+            self.metrics.observe(
+                scope["method"],
+                # The template (/api/otp/send), never the raw path
+                getattr(route, "path", "unmatched"),
+                status,
+                time.perf_counter() - start,
+                state.get(USER_STATE_KEY),
+            )
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if (
+                message["type"] == "http.response.body"
+                and not message.get("more_body", False)
+                and not recorded
+            ):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not recorded:
+                record()
+
+
+latency = LatencyMetrics(settings.METRICS_MAX_USERS)
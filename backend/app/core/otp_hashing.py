@@ -0,0 +1,118 @@
+"""
+Hashing for one-time codes.
+
+A 6-digit code that lives for 5 minutes gets nothing from a slow password
+hash: the keyspace is a million values, so bcrypt only costs us CPU on every
+send/verify. Instead codes are digested with HMAC-SHA256 under a server-side
+key (bound to the recipient email), which can't be brute-forced offline
+without the key and is a few microseconds per call.
+
+Every stored hash carries a scheme prefix, so rows written by an older scheme
+(plain bcrypt from before this module existed) keep verifying until they
+expire.
+"""
+import hashlib
+import hmac
+from typing import Dict, Optional
+
+from passlib.context import CryptContext
+
+from app.core.config import settings
+
+
+class OtpHasher:
+    """Base class for an OTP hashing scheme."""
+
+    name: str = ""
+    # Slow schemes take long enough to be kept off the event loop
+    slow: bool = False
+
+    def identify(self, otp_hash: str) -> bool:
+        raise NotImplementedError
+
+    def hash(self, email: str, otp_code: str) -> str:
+        raise NotImplementedError
+
+    def verify(self, email: str, otp_code: str, otp_hash: str) -> bool:
+        raise NotImplementedError
+
+
+class HmacOtpHasher(OtpHasher):
+    """
+    Keyed HMAC-SHA256 digest, stored as ``$otp-hmac-sha256$v1$<hex>``.
+
+    The digest is deterministic for a given (key, email, code), which also lets
+    the database compare it directly.
+    """
+
+    name = "hmac-sha256"
+    version = "v1"
+
+    def __init__(self, key: str):
+        self._key = key.encode()
+        self.prefix = f"$otp-{self.name}${self.version}$"
+
+    def identify(self, otp_hash: str) -> bool:
+        return otp_hash.startswith(self.prefix)
+
+    def _digest(self, email: str, otp_code: str) -> str:
+        message = f"{email}:{otp_code}".encode()
+        return hmac.new(self._key, message, hashlib.sha256).hexdigest()
+
+    def hash(self, email: str, otp_code: str) -> str:
+        return self.prefix + self._digest(email, otp_code)
+
+    def verify(self, email: str, otp_code: str, otp_hash: str) -> bool:
+        return hmac.compare_digest(
+            otp_hash.encode(), self.hash(email, otp_code).encode()
+        )
+
+
+class BcryptOtpHasher(OtpHasher):
+    """Legacy scheme: plain bcrypt of the code, as written by older releases."""
+
+    name = "bcrypt"
+    slow = True
+
+    def __init__(self):
+        self._context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+    def identify(self, otp_hash: str) -> bool:
+        return self._context.identify(otp_hash) == "bcrypt"
+
+    def hash(self, email: str, otp_code: str) -> str:
+        return self._context.hash(otp_code)
+
+    def verify(self, email: str, otp_code: str, otp_hash: str) -> bool:
+        return self._context.verify(otp_code, otp_hash)
+
+
+hashers: Dict[str, OtpHasher] = {
+    HmacOtpHasher.name: HmacOtpHasher(settings.OTP_HASH_KEY or settings.SECRET_KEY),
+    BcryptOtpHasher.name: BcryptOtpHasher(),
+}
+
+
+def get_hasher(otp_hash: Optional[str] = None) -> OtpHasher:
+    """
+    Return the hasher for a stored hash, or the configured default when no
+    hash is given.
+    """
+    if otp_hash is None:
+        return hashers[settings.OTP_HASH_SCHEME]
+    for hasher in hashers.values():
+        if hasher.identify(otp_hash):
+            return hasher
+    raise ValueError("Unrecognized OTP hash format")
+
+
+def hash_code(email: str, otp_code: str) -> str:
+    return get_hasher().hash(email, otp_code)
+
+
+def verify_code(email: str, otp_code: str, otp_hash: str) -> bool:
+    try:
+        hasher = get_hasher(otp_hash)
+    except ValueError:
+        return False
+    return hasher.verify(email, otp_code, otp_hash)
@@ -0,0 +1,244 @@
+"""
+Reclaiming old rows from ``otps``.
+
+Codes are only useful for a few minutes, but nothing else ever deletes them.
+When otps is partitioned by day (OTP_PARTITIONING_ENABLED at migration
+time) maintenance creates the partitions for the coming days and drops whole
+partitions once they are older than OTP_RETENTION_DAYS. Otherwise it falls
+back to deleting old rows in small batches so no single statement holds
+locks for long.
+
+Rows that land in the DEFAULT partition (their day had no partition yet)
+are moved into the day's partition when it is created, and swept like the
+unpartitioned table once they are past retention.
+
+Run it from cron with ``python -m app.workers.otp_maintenance``, or set
+OTP_MAINTENANCE_INTERVAL_SECONDS to run it inside the API process; an
+advisory lock keeps concurrent runs from overlapping either way. The lock is
+session level, so the whole run happens on one ``Connection`` rather than on
+a Session, which would hand its connection back to the pool on every commit.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.session import engine
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_try_advisory_lock, shared by every maintenance runner
+ADVISORY_LOCK_KEY = 0x0_7F_0001
+PARTITION_PREFIX = "otps_p"
+DEFAULT_PARTITION = "otps_default"
+OTP_COLUMNS = "id, email, otp_hash, expires_at, attempts, created_at, is_verified"
+
+
+@dataclass
+class MaintenanceReport:
+    mode: str = ""
+    partitions_created: List[str] = field(default_factory=list)
+    partitions_dropped: List[str] = field(default_factory=list)
+    rows_reclaimed: int = 0
+    rows_moved: int = 0
+    seconds: float = 0.0
+    skipped: bool = False
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def is_partitioned(db: Connection) -> bool:
+    # Resolved through search_path, like the unqualified names below
+    return bool(
+        db.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table "
+                "WHERE partrelid = to_regclass('otps')"
+            )
+        ).scalar()
+    )
+
+
+def _existing_partitions(db: Connection) -> List[str]:
+    return list(
+        db.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass('otps')"
+            )
+        ).scalars()
+    )
+
+
+def _create_partition(
+    db: Connection, report: MaintenanceReport, day: date, has_default: bool
+) -> None:
+    name = partition_name(day)
+    start, end = f"{day:%Y-%m-%d}", f"{day + timedelta(days=1):%Y-%m-%d}"
+    values = f"FROM ('{start}') TO ('{end}')"
+    in_range = f"created_at >= '{start}' AND created_at < '{end}'"
+
+    stray = 0
+    if has_default:
+        # CREATE ... PARTITION OF fails while DEFAULT holds rows of that day;
+        # the lock keeps more from arriving until the partition exists
+        db.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE"))
+        stray = db.execute(
+            text(f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE {in_range}")
+        ).scalar()
+    if not stray:
+        db.execute(text(f"CREATE TABLE {name} PARTITION OF otps FOR VALUES {values}"))
+    else:
+        # Move them into a plain table and attach that as the partition
+        db.execute(text(f"CREATE TABLE {name} (LIKE otps INCLUDING DEFAULTS)"))
+        db.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_range} "
+                f"RETURNING {OTP_COLUMNS}) "
+                f"INSERT INTO {name} ({OTP_COLUMNS}) SELECT {OTP_COLUMNS} FROM moved"
+            )
+        )
+        db.execute(text(f"ALTER TABLE otps ATTACH PARTITION {name} FOR VALUES {values}"))
+        report.rows_moved += stray
+    db.commit()
+    report.partitions_created.append(name)
+
+
+def maintain_partitions(
+    db: Connection, report: MaintenanceReport, today: date
+) -> None:
+    existing = set(_existing_partitions(db))
+    has_default = DEFAULT_PARTITION in existing
+
+    for offset in range(settings.OTP_PARTITION_PREMAKE_DAYS + 1):
+        day = today + timedelta(days=offset)
+        if partition_name(day) not in existing:
+            _create_partition(db, report, day, has_default)
+
+    oldest_day = today - timedelta(days=settings.OTP_RETENTION_DAYS)
+    oldest_kept = partition_name(oldest_day)
+    for name in sorted(existing):
+        # Names sort chronologically; the DEFAULT partition has no date suffix
+        if not name[len(PARTITION_PREFIX):].isdigit() or name >= oldest_kept:
+            continue
+        rows = db.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+        db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        report.partitions_dropped.append(name)
+        report.rows_reclaimed += rows
+
+    if has_default:
+        cutoff = datetime.combine(oldest_day, datetime.min.time(), timezone.utc)
+        sweep_rows(db, report, cutoff, table=DEFAULT_PARTITION)
+
+
+def sweep_rows(
+    db: Connection, report: MaintenanceReport, cutoff: datetime, table: str = "otps"
+) -> None:
+    while True:
+        deleted = db.execute(
+            text(
+                f"DELETE FROM {table} WHERE id IN ("
+                f"SELECT id FROM {table} WHERE created_at < :cutoff LIMIT :batch)"
+            ),
+            {"cutoff": cutoff, "batch": settings.OTP_SWEEP_BATCH_SIZE},
+        ).rowcount
+        db.commit()
+        report.rows_reclaimed += deleted
+        if deleted < settings.OTP_SWEEP_BATCH_SIZE:
+            return
+
+
+def _unlock(db: Connection) -> None:
+    try:
+        db.rollback()
+        unlocked = db.execute(
+            text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY}
+        ).scalar()
+        db.commit()
+    except Exception:
+        # Closing the server session is the only other way to release it
+        logger.exception("OTP maintenance could not release its lock")
+        db.invalidate()
+        return
+    if not unlocked:
+        logger.warning("OTP maintenance lock was not held by this connection")
+
+
+def run_maintenance(db: Connection) -> MaintenanceReport:
+    """
+    Create upcoming partitions and reclaim expired rows. Takes, uses and
+    releases the advisory lock on ``db``, committing as it goes.
+    """
+    report = MaintenanceReport()
+    start = time.perf_counter()
+    locked = db.execute(
+        text("SELECT pg_try_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY}
+    ).scalar()
+    db.commit()
+    if not locked:
+        report.skipped = True
+        return report
+    try:
+        now = datetime.now(timezone.utc)
+        if is_partitioned(db):
+            report.mode = "partitions"
+            maintain_partitions(db, report, now.date())
+        else:
+            report.mode = "sweep"
+            sweep_rows(db, report, now - timedelta(days=settings.OTP_RETENTION_DAYS))
+    finally:
+        _unlock(db)
+    report.seconds = time.perf_counter() - start
+    logger.info(
+        f"OTP maintenance ({report.mode}): reclaimed {report.rows_reclaimed} rows, "
+        f"created {len(report.partitions_created)} and dropped "
+        f"{len(report.partitions_dropped)} partitions, moved {report.rows_moved} "
+        f"rows out of the default partition in {report.seconds:.2f}s"
+    )
+    return report
+
+
+def _run_once() -> MaintenanceReport:
+    with engine.connect() as connection:
+        return run_maintenance(connection)
+
+
+class MaintenanceTask:
+    """Runs maintenance every ``interval`` seconds inside the API process."""
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or settings.OTP_MAINTENANCE_INTERVAL_SECONDS
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await run_in_threadpool(_run_once)
+            except Exception as e:
+                logger.error(f"OTP maintenance error: {str(e)}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
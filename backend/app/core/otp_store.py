@@ -0,0 +1,339 @@
+"""
+Where active OTPs live between send and verify.
+
+Codes live for a few minutes and are read back at most a handful of times, so
+they don't need to sit in Postgres. OTP_STORE_BACKEND selects one of:
+
+- ``database``: the ``otps`` table (default). Writes join the request's
+  transaction and verification is a single atomic statement.
+- ``memory``: a per-process dict with TTL eviction. Only for single-process
+  deployments, since other workers can't see the codes.
+- ``redis``: one hash per email in Redis (or anything speaking its protocol),
+  expired natively by the server, verified atomically by a Lua script.
+
+Stores keep the newest code per email. Entries outlive their code by
+EXPIRED_GRACE_SECONDS so a late verify still reports "expired" rather than
+"not found".
+"""
+import enum
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional, Union
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from app.core import otp_hashing
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db import models
+
+MAX_VERIFY_ATTEMPTS = 5
+EXPIRED_GRACE_SECONDS = 300
+
+
+class VerifyResult(str, enum.Enum):
+    VERIFIED = "verified"
+    INVALID = "invalid"
+    NOT_FOUND = "not_found"
+    TOO_MANY_ATTEMPTS = "too_many_attempts"
+    EXPIRED = "expired"
+
+
+@dataclass
+class OtpRecord:
+    email: str
+    otp_hash: str
+    expires_at: datetime
+
+
+class OtpStore:
+    """
+    Base class for OTP stores. Every method takes the request's Session, which
+    only stores with ``uses_db`` touch; they never commit it themselves.
+    ``blocking`` stores do network I/O or slow hashing and are called off the
+    event loop.
+    """
+
+    name: str = ""
+    uses_db: bool = False
+    blocking: bool = True
+
+    def put(self, db: Optional[Session], record: OtpRecord) -> None:
+        self.put_many(db, [record])
+
+    def put_many(self, db: Optional[Session], records: List[OtpRecord]) -> None:
+        raise NotImplementedError
+
+    def verify(self, db: Optional[Session], email: str, otp: str) -> VerifyResult:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+def _check_live(attempts: int, expired: bool) -> Optional[VerifyResult]:
+    if attempts >= MAX_VERIFY_ATTEMPTS:
+        return VerifyResult.TOO_MANY_ATTEMPTS
+    if expired:
+        return VerifyResult.EXPIRED
+    return None
+
+
+class DatabaseOtpStore(OtpStore):
+    name = "database"
+    uses_db = True
+
+    # Locks the newest live code for the email and, when it is an HMAC digest
+    # that is neither expired nor out of attempts, compares and updates it in
+    # the same statement. The outer join keeps the target visible when nothing
+    # was updated so the caller can tell why. Comparing digests in SQL is not
+    # constant-time, which is fine: they are keyed, so a timing leak says
+    # nothing about the code.
+    _verify_sql = text(
+        """
+        WITH target AS (
+            SELECT id, created_at, otp_hash, expires_at,
+                   COALESCE(attempts, 0) AS attempts
+            FROM otps
+            WHERE email = :email AND is_verified = false
+            ORDER BY created_at DESC
+            LIMIT 1
+            FOR UPDATE
+        ),
+        updated AS (
+            UPDATE otps
+            SET is_verified = (otps.otp_hash = :candidate),
+                attempts = COALESCE(otps.attempts, 0)
+                    + CASE WHEN otps.otp_hash = :candidate THEN 0 ELSE 1 END
+            FROM target
+            WHERE otps.id = target.id
+              AND otps.created_at = target.created_at
+              AND target.attempts < :max_attempts
+              AND target.expires_at >= now()
+              AND starts_with(target.otp_hash, :prefix)
+            RETURNING otps.is_verified
+        )
+        SELECT target.attempts, target.expires_at >= now() AS live,
+               updated.is_verified
+        FROM target LEFT JOIN updated ON true
+        """
+    )
+
+    def put_many(self, db: Session, records: List[OtpRecord]) -> None:
+        db.execute(
+            insert(models.OTP),
+            [
+                {
+                    "email": r.email,
+                    "otp_hash": r.otp_hash,
+                    "expires_at": r.expires_at,
+                    "is_verified": False,
+                    "attempts": 0,
+                }
+                for r in records
+            ],
+        )
+
+    def verify(self, db: Session, email: str, otp: str) -> VerifyResult:
+        found = self.lock_for_verify(db, email, otp)
+        if isinstance(found, VerifyResult):
+            return found
+        matched = otp_hashing.verify_code(email, otp, found.otp_hash)
+        return self.record_attempt(db, found, matched)
+
+    def lock_for_verify(
+        self, db: Session, email: str, otp: str
+    ) -> Union[VerifyResult, models.OTP]:
+        """
+        First half of verify. Returns the result when it is already known, or
+        the locked row when its hash has to be compared in Python; pass the
+        outcome of that comparison to record_attempt.
+        """
+        result = None
+        if db.get_bind().dialect.name == "postgresql":
+            result = self._verify_atomic(db, email, otp)
+        if result is None:
+            result = self._lock_live(db, email)
+        return result
+
+    def record_attempt(
+        self, db: Session, otp_obj: models.OTP, matched: bool
+    ) -> VerifyResult:
+        if not matched:
+            otp_obj.attempts = (otp_obj.attempts or 0) + 1
+            return VerifyResult.INVALID
+        otp_obj.is_verified = True
+        return VerifyResult.VERIFIED
+
+    def _verify_atomic(
+        self, db: Session, email: str, otp: str
+    ) -> Optional[VerifyResult]:
+        """
+        Verify in one round-trip on PostgreSQL. Returns None when the code has
+        to be checked in Python instead (legacy bcrypt hashes).
+        """
+        hasher = otp_hashing.hashers[otp_hashing.HmacOtpHasher.name]
+        row = db.execute(
+            self._verify_sql,
+            {
+                "email": email,
+                "candidate": hasher.hash(email, otp),
+                "prefix": hasher.prefix,
+                "max_attempts": MAX_VERIFY_ATTEMPTS,
+            },
+        ).first()
+        if row is None:
+            return VerifyResult.NOT_FOUND
+        refused = _check_live(row.attempts, not row.live)
+        if refused:
+            return refused
+        if row.is_verified is None:
+            return None
+        return VerifyResult.VERIFIED if row.is_verified else VerifyResult.INVALID
+
+    def _lock_live(self, db: Session, email: str) -> Union[VerifyResult, models.OTP]:
+        otp_obj = (
+            db.query(models.OTP)
+            .filter(models.OTP.email == email, models.OTP.is_verified.is_(False))
+            .order_by(models.OTP.created_at.desc())
+            .with_for_update()
+            .first()
+        )
+        if not otp_obj:
+            return VerifyResult.NOT_FOUND
+        refused = _check_live(
+            otp_obj.attempts or 0, datetime.now(timezone.utc) > otp_obj.expires_at
+        )
+        return refused or otp_obj
+
+
+@dataclass
+class _MemoryEntry:
+    otp_hash: str
+    expires_at: float
+    attempts: int = 0
+
+
+class MemoryOtpStore(OtpStore):
+    name = "memory"
+
+    def __init__(self, maxsize: int):
+        # Only a bcrypt compare is slow enough to need the threadpool
+        self.blocking = otp_hashing.get_hasher().slow
+        # The cache ttl is only an upper bound; each entry gets its own
+        self._codes = TTLCache(maxsize=maxsize, ttl=24 * 3600)
+        self._lock = threading.Lock()
+
+    def put_many(self, db: Optional[Session], records: List[OtpRecord]) -> None:
+        now = time.time()
+        for r in records:
+            expires_at = r.expires_at.timestamp()
+            self._codes.set(
+                r.email,
+                _MemoryEntry(r.otp_hash, expires_at),
+                ttl=expires_at - now + EXPIRED_GRACE_SECONDS,
+            )
+
+    def verify(self, db: Optional[Session], email: str, otp: str) -> VerifyResult:
+        with self._lock:
+            entry = self._codes.get(email)
+            if entry is None:
+                return VerifyResult.NOT_FOUND
+            refused = _check_live(entry.attempts, time.time() > entry.expires_at)
+            if refused:
+                return refused
+            # Reserve the attempt before comparing, so a slow (bcrypt) compare
+            # doesn't hold the lock and concurrent guesses still count
+            entry.attempts += 1
+
+        if not otp_hashing.verify_code(email, otp, entry.otp_hash):
+            return VerifyResult.INVALID
+        with self._lock:
+            if self._codes.get(email) is entry:
+                self._codes.pop(email)
+        return VerifyResult.VERIFIED
+
+    def __len__(self) -> int:
+        return self._codes.stats()["size"]
+
+
+class RedisOtpStore(OtpStore):
+    name = "redis"
+
+    key_prefix = "otp:"
+
+    # KEYS[1] = code key; ARGV = candidate hash, now, max attempts
+    _verify_script = """
+    local code = redis.call('HMGET', KEYS[1], 'otp_hash', 'expires_at', 'attempts')
+    if not code[1] then return 'not_found' end
+    if tonumber(code[3]) >= tonumber(ARGV[3]) then return 'too_many_attempts' end
+    if tonumber(code[2]) < tonumber(ARGV[2]) then return 'expired' end
+    if code[1] == ARGV[1] then
+        redis.call('DEL', KEYS[1])
+        return 'verified'
+    end
+    redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+    return 'invalid'
+    """
+
+    def __init__(self, client):
+        # The script compares digests, so the hash has to be deterministic
+        if not isinstance(otp_hashing.get_hasher(), otp_hashing.HmacOtpHasher):
+            raise ValueError(
+                "The redis OTP store requires OTP_HASH_SCHEME=hmac-sha256"
+            )
+        self._client = client
+        self._verify = client.register_script(self._verify_script)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisOtpStore":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "OTP_STORE_BACKEND=redis requires the 'redis' package"
+            ) from None
+        return cls(redis.Redis.from_url(url, decode_responses=True))
+
+    def put_many(self, db: Optional[Session], records: List[OtpRecord]) -> None:
+        pipe = self._client.pipeline(transaction=True)
+        for r in records:
+            key = self.key_prefix + r.email
+            expires_at = r.expires_at.timestamp()
+            pipe.hset(
+                key,
+                mapping={
+                    "otp_hash": r.otp_hash,
+                    "expires_at": expires_at,
+                    "attempts": 0,
+                },
+            )
+            pipe.expireat(key, int(expires_at) + EXPIRED_GRACE_SECONDS)
+        pipe.execute()
+
+    def verify(self, db: Optional[Session], email: str, otp: str) -> VerifyResult:
+        candidate = otp_hashing.get_hasher().hash(email, otp)
+        result = self._verify(
+            keys=[self.key_prefix + email],
+            args=[candidate, time.time(), MAX_VERIFY_ATTEMPTS],
+        )
+        return VerifyResult(result)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def create_store(backend: str) -> OtpStore:
+    if backend == DatabaseOtpStore.name:
+        return DatabaseOtpStore()
+    if backend == MemoryOtpStore.name:
+        return MemoryOtpStore(settings.OTP_STORE_MEMORY_MAX_SIZE)
+    if backend == RedisOtpStore.name:
+        return RedisOtpStore.from_url(settings.REDIS_URL)
+    raise ValueError(f"Unknown OTP_STORE_BACKEND: {backend}")
+
+
+store: OtpStore = create_store(settings.OTP_STORE_BACKEND)
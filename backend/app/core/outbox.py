@@ -0,0 +1,252 @@
+"""
+Transactional email outbox.
+
+Emails are written to ``email_outbox`` in the same transaction as the row that
+triggered them (an OTP, a reset token), so nothing is lost if the process dies
+before delivery. An ``OutboxWorker`` drains the table:
+
+* rows are claimed in batches with ``FOR UPDATE SKIP LOCKED``, so any number
+  of workers (in the API process or ``python -m app.workers.outbox``) can run
+  side by side without handing out the same email twice;
+* claiming pushes ``next_attempt_at`` forward by a lease, so a worker that
+  dies mid-batch only delays its rows, it doesn't lose them;
+* failures are retried with exponential backoff and dead-lettered
+  (``status = "dead"``) after EMAIL_OUTBOX_MAX_ATTEMPTS;
+* delivered rows are deleted, since their bodies contain live OTP codes.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core import email_utils
+from app.core.config import settings
+from app.db import models
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class OutboxMessage:
+    id: str
+    recipient: str
+    subject: str
+    html_content: str
+    attempts: int
+    text_content: Optional[str] = None
+
+
+def enqueue_email(
+    db: Session,
+    recipient: str,
+    subject: str,
+    html_content: str,
+    text_content: Optional[str] = None,
+) -> models.EmailOutbox:
+    """
+    Add an email to the outbox. Does not commit: the caller's transaction
+    decides whether the email exists.
+    """
+    message = models.EmailOutbox(
+        recipient=recipient,
+        subject=subject,
+        html_content=html_content,
+        text_content=text_content,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.now(timezone.utc),
+    )
+    db.add(message)
+    return message
+
+
+def enqueue_emails(
+    db: Session,
+    messages: Sequence[Tuple[str, str, str, Optional[str]]],
+) -> None:
+    """
+    Add (recipient, subject, html_content, text_content) emails to the outbox
+    with one multi-row INSERT. Like enqueue_email, does not commit.
+    """
+    if not messages:
+        return
+    now = datetime.now(timezone.utc)
+    db.execute(
+        insert(models.EmailOutbox),
+        [
+            {
+                "recipient": recipient,
+                "subject": subject,
+                "html_content": html_content,
+                "text_content": text_content,
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+            }
+            for recipient, subject, html_content, text_content in messages
+        ],
+    )
+
+
+def claim_batch(db: Session, limit: int) -> List[OutboxMessage]:
+    now = datetime.now(timezone.utc)
+    rows = (
+        db.query(models.EmailOutbox)
+        .filter(
+            models.EmailOutbox.status == "pending",
+            models.EmailOutbox.next_attempt_at <= now,
+        )
+        .order_by(models.EmailOutbox.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    lease_until = now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS)
+    for row in rows:
+        row.attempts += 1
+        row.next_attempt_at = lease_until
+    db.commit()
+    return [
+        OutboxMessage(
+            id=row.id,
+            recipient=row.recipient,
+            subject=row.subject,
+            html_content=row.html_content,
+            attempts=row.attempts,
+            text_content=row.text_content,
+        )
+        for row in rows
+    ]
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    seconds = settings.EMAIL_OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1))
+    return timedelta(seconds=min(seconds, settings.EMAIL_OUTBOX_BACKOFF_MAX))
+
+
+def record_results(
+    db: Session, messages: List[OutboxMessage], results: Dict[str, Optional[str]]
+) -> None:
+    """
+    Apply delivery outcomes for a claimed batch. ``results`` maps message id to
+    None on success or an error string on failure.
+    """
+    now = datetime.now(timezone.utc)
+    sent_ids = [m.id for m in messages if results.get(m.id) is None]
+    if sent_ids:
+        db.query(models.EmailOutbox).filter(
+            models.EmailOutbox.id.in_(sent_ids)
+        ).delete(synchronize_session=False)
+
+    for message in messages:
+        error = results.get(message.id)
+        if error is None:
+            continue
+        values = {"last_error": error}
+        if message.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            values["status"] = "dead"
+            logger.error(
+                f"Outbox email {message.id} to {message.recipient} dead-lettered "
+                f"after {message.attempts} attempts: {error}"
+            )
+        else:
+            values["next_attempt_at"] = now + backoff_delay(message.attempts)
+        db.query(models.EmailOutbox).filter(
+            models.EmailOutbox.id == message.id
+        ).update(values, synchronize_session=False)
+    db.commit()
+
+
+def _claim(limit: int) -> List[OutboxMessage]:
+    db = SessionLocal()
+    try:
+        return claim_batch(db, limit)
+    finally:
+        db.close()
+
+
+def _record(messages: List[OutboxMessage], results: Dict[str, Optional[str]]) -> None:
+    db = SessionLocal()
+    try:
+        record_results(db, messages, results)
+    finally:
+        db.close()
+
+
+class OutboxWorker:
+    """
+    Drains the outbox with at most ``concurrency`` deliveries in flight.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = None,
+        batch_size: int = None,
+        poll_interval: float = None,
+    ):
+        self.concurrency = concurrency or settings.EMAIL_OUTBOX_CONCURRENCY
+        self.batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+        self.poll_interval = poll_interval or settings.EMAIL_OUTBOX_POLL_INTERVAL
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _deliver(self, message: OutboxMessage) -> Optional[str]:
+        async with self._semaphore:
+            try:
+                sent = await email_utils.send_email_async(
+                    recipient=message.recipient,
+                    subject=message.subject,
+                    html_content=message.html_content,
+                    text_content=message.text_content,
+                )
+            except Exception as e:
+                return str(e) or e.__class__.__name__
+        return None if sent else "Delivery failed"
+
+    async def drain_once(self) -> int:
+        """Claim and deliver one batch. Returns the number of emails claimed."""
+        messages = await run_in_threadpool(_claim, self.batch_size)
+        if not messages:
+            return 0
+        errors = await asyncio.gather(*(self._deliver(m) for m in messages))
+        results = {m.id: error for m, error in zip(messages, errors)}
+        await run_in_threadpool(_record, messages, results)
+        return len(messages)
+
+    async def run(self) -> None:
+        logger.info(
+            f"Outbox worker started (concurrency={self.concurrency}, "
+            f"batch_size={self.batch_size})"
+        )
+        while not self._stopping.is_set():
+            try:
+                claimed = await self.drain_once()
+            except Exception as e:
+                logger.error(f"Outbox worker error: {str(e)}", exc_info=True)
+                claimed = 0
+            if claimed < self.batch_size:
+                try:
+                    await asyncio.wait_for(
+                        self._stopping.wait(), timeout=self.poll_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        logger.info("Outbox worker stopped")
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        """Finish the batch in flight, then stop."""
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
@@ -0,0 +1,217 @@
+"""
+Token-bucket rate limiting for OTP sends.
+
+Two buckets guard every send, both checked before anything is written:
+
+- ``api_key``: all sends of an API key (a batch costs one token per recipient)
+- ``recipient``: sends of one API key to one email address
+
+Each user can override the defaults through the ``rate_limit_*`` columns on
+``users``. RATE_LIMIT_BACKEND selects where buckets live: ``memory`` (per
+process, so the effective limit grows with the number of workers) or
+``redis`` (shared at REDIS_URL, updated atomically by a Lua script).
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+API_KEY_SCOPE = "api_key"
+RECIPIENT_SCOPE = "recipient"
+
+
+@dataclass(frozen=True)
+class Limit:
+    """``rate`` tokens per second, at most ``burst`` tokens saved up."""
+
+    rate: float
+    burst: int
+
+
+def api_key_limit(
+    per_minute: Optional[int] = None, burst: Optional[int] = None
+) -> Limit:
+    if per_minute is None:
+        per_minute = settings.RATE_LIMIT_PER_MINUTE
+    if burst is None:
+        burst = settings.RATE_LIMIT_BURST
+    return Limit(rate=per_minute / 60, burst=burst)
+
+
+def recipient_limit(per_hour: Optional[int] = None) -> Limit:
+    if per_hour is None:
+        per_hour = settings.RATE_LIMIT_RECIPIENT_PER_HOUR
+    return Limit(rate=per_hour / 3600, burst=settings.RATE_LIMIT_RECIPIENT_BURST)
+
+
+class RateLimiter:
+    """
+    Base class for bucket storage. ``hit`` takes ``cost`` tokens and returns 0
+    when allowed, otherwise the seconds until enough tokens are available
+    (``math.inf`` when ``cost`` exceeds the burst or the rate is 0, which
+    blocks the key). ``refund`` gives back tokens of a hit whose work was not
+    done. ``blocking`` limiters do network I/O and are called off the event
+    loop.
+    """
+
+    name: str = ""
+    blocking: bool = True
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"allowed": 0, "rejected": 0}
+        )
+        self._counts_lock = threading.Lock()
+
+    def hit(self, scope: str, key: str, limit: Limit, cost: int = 1) -> float:
+        return self.hit_many(scope, [key], limit, cost)[0]
+
+    def hit_many(
+        self, scope: str, keys: List[str], limit: Limit, cost: int = 1
+    ) -> List[float]:
+        if cost > limit.burst or limit.rate <= 0:
+            waits = [math.inf] * len(keys)
+        else:
+            waits = self._take(scope, keys, limit, cost)
+        with self._counts_lock:
+            counts = self._counts[scope]
+            for wait in waits:
+                counts["rejected" if wait else "allowed"] += 1
+        return waits
+
+    def refund(self, scope: str, key: str, limit: Limit, cost: int = 1) -> None:
+        # A negative cost always fits; buckets never refill past the burst
+        if cost > 0 and limit.rate > 0:
+            self._take(scope, [key], limit, -cost)
+
+    def _take(
+        self, scope: str, keys: List[str], limit: Limit, cost: int
+    ) -> List[float]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._counts_lock:
+            return {scope: dict(counts) for scope, counts in self._counts.items()}
+
+    def close(self) -> None:
+        pass
+
+
+def _refill(tokens: float, elapsed: float, limit: Limit) -> float:
+    return min(limit.burst, tokens + max(0.0, elapsed) * limit.rate)
+
+
+class MemoryRateLimiter(RateLimiter):
+    name = "memory"
+    blocking = False
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        # A bucket that has refilled completely is the same as no bucket, so
+        # each entry expires once it would be full again
+        self._buckets = TTLCache(maxsize=maxsize, ttl=7 * 24 * 3600)
+        self._lock = threading.Lock()
+
+    def _take(
+        self, scope: str, keys: List[str], limit: Limit, cost: int
+    ) -> List[float]:
+        now = time.monotonic()
+        waits = []
+        with self._lock:
+            for key in keys:
+                bucket_key = (scope, key)
+                bucket = self._buckets.get(bucket_key)
+                tokens = limit.burst
+                if bucket is not None:
+                    tokens = _refill(bucket[0], now - bucket[1], limit)
+                if tokens >= cost:
+                    tokens = min(limit.burst, tokens - cost)
+                    waits.append(0.0)
+                else:
+                    waits.append((cost - tokens) / limit.rate)
+                if tokens >= limit.burst:
+                    self._buckets.pop(bucket_key)
+                else:
+                    self._buckets.set(
+                        bucket_key,
+                        (tokens, now),
+                        ttl=(limit.burst - tokens) / limit.rate,
+                    )
+        return waits
+
+
+class RedisRateLimiter(RateLimiter):
+    name = "redis"
+
+    key_prefix = "ratelimit:"
+
+    # KEYS[1] = bucket; ARGV = rate, burst, cost, now. Returns the wait as a
+    # string, since Lua numbers are truncated to integers in replies.
+    _take_script = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= cost then
+        tokens = math.min(burst, tokens - cost)
+    else
+        wait = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+    return tostring(wait)
+    """
+
+    def __init__(self, client):
+        super().__init__()
+        self._client = client
+        self._take_bucket = client.register_script(self._take_script)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisRateLimiter":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "RATE_LIMIT_BACKEND=redis requires the 'redis' package"
+            ) from None
+        return cls(redis.Redis.from_url(url, decode_responses=True))
+
+    def _take(
+        self, scope: str, keys: List[str], limit: Limit, cost: int
+    ) -> List[float]:
+        now = time.time()
+        pipe = self._client.pipeline(transaction=False)
+        for key in keys:
+            self._take_bucket(
+                keys=[f"{self.key_prefix}{scope}:{key}"],
+                args=[limit.rate, limit.burst, cost, now],
+                client=pipe,
+            )
+        return [float(wait) for wait in pipe.execute()]
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def create_limiter(backend: str) -> RateLimiter:
+    if backend == MemoryRateLimiter.name:
+        return MemoryRateLimiter(settings.RATE_LIMIT_MEMORY_MAX_SIZE)
+    if backend == RedisRateLimiter.name:
+        return RedisRateLimiter.from_url(settings.REDIS_URL)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+
+limiter: Optional[RateLimiter] = None
+if settings.RATE_LIMIT_ENABLED:
+    limiter = create_limiter(settings.RATE_LIMIT_BACKEND)
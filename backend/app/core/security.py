@@ -1,10 +1,19 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta, timezone
-from typing import Any, Union
+from typing import Any, Dict, Optional, Tuple, Union
 from jose import jwt
 from passlib.context import CryptContext
 from app.core.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes with a different cost than BCRYPT_ROUNDS "need update" and are
+# rehashed on the next successful login
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
 
 
 def create_access_token(
@@ -30,3 +39,113 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """Verify; on success also return a new hash if the cost changed."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def _ready() -> bool:
+    return True
+
+
+class PasswordHasherBusy(Exception):
+    """More password hashes are queued than PASSWORD_HASH_MAX_QUEUE allows."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated pool of PASSWORD_HASH_WORKERS processes, so a
+    burst of logins neither holds the shared threadpool nor competes for the
+    GIL with the rest of the API. At most PASSWORD_HASH_MAX_QUEUE calls wait
+    for a free worker; past that, calls fail fast with PasswordHasherBusy
+    rather than queueing for seconds. With 0 workers bcrypt runs on two
+    threads instead (bcrypt releases the GIL, so that still helps).
+    """
+
+    def __init__(self, workers: int = None, max_queue: int = None):
+        self.workers = settings.PASSWORD_HASH_WORKERS if workers is None else workers
+        self.max_queue = (
+            settings.PASSWORD_HASH_MAX_QUEUE if max_queue is None else max_queue
+        )
+        self._size = self.workers or 2
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.workers > 0:
+                    # forkserver: workers don't inherit the server's threads,
+                    # sockets or database connections
+                    self._executor = ProcessPoolExecutor(
+                        self.workers,
+                        mp_context=multiprocessing.get_context("forkserver"),
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        self._size, thread_name_prefix="password-hash"
+                    )
+            return self._executor
+
+    async def _run(self, fn, *args):
+        # Only called from the event loop, so the counters need no lock
+        if self.in_flight >= self._size + self.max_queue:
+            self.rejected += 1
+            raise PasswordHasherBusy("Too many password checks in progress")
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_executor(), fn, *args)
+        except BrokenProcessPool:
+            # A worker died (OOM killer, ...): start a fresh pool next time
+            self.failed += 1
+            with self._lock:
+                self._executor = None
+            raise PasswordHasherBusy("Password hashing pool restarted") from None
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        self.completed += 1
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update_password, password, hashed_password)
+
+    def start(self) -> None:
+        """Start the workers up front, so the first logins don't pay for it."""
+        executor = self._get_executor()
+        for _ in range(self._size):
+            executor.submit(_ready)
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+password_hasher = PasswordHasher()
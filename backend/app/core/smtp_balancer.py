@@ -0,0 +1,200 @@
+"""
+Spread SMTP delivery over the accounts in ``smtp_configs``.
+
+Every send reserves one unit of an account's daily quota with a single
+``UPDATE ... RETURNING``, so concurrent senders in any number of processes
+never push an account past ``daily_limit``. The account picked is the one
+with the lowest ``used_today / weight``: weighted least-used, which keeps
+accounts with spare quota busy and shares traffic by weight. Counters reset
+lazily in the same statement on the first send of a new (UTC) day.
+
+An account that fails SMTP_ACCOUNT_MAX_FAILURES sends in a row (or rejects
+its credentials once) is marked unhealthy and skipped until
+``unhealthy_until``, which backs off exponentially while it keeps failing.
+After a failure the message is retried on another account, up to
+SMTP_BALANCER_MAX_ATTEMPTS accounts. Refused recipients say nothing about
+the account and are not retried.
+"""
+import logging
+import smtplib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from typing import Callable, Optional, Set
+
+from sqlalchemy import text
+
+from app.core import smtp_pool
+from app.core.config import settings
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class NoAccountAvailable(Exception):
+    """Every account is unhealthy or out of quota for today."""
+
+
+@dataclass(frozen=True)
+class Reservation:
+    id: str
+    email: str
+    account: smtp_pool.SmtpAccount
+    consecutive_failures: int
+
+
+# The candidate is locked so the quota check and the increment can't
+# interleave with another sender. The first attempt skips accounts other
+# senders hold, spreading concurrent sends; if every account is held it waits.
+_reserve_sql = """
+    WITH candidate AS (
+        SELECT id
+        FROM smtp_configs
+        WHERE (is_healthy OR unhealthy_until <= now())
+          AND weight > 0
+          AND CASE WHEN last_reset < :day_start THEN 0 ELSE used_today END
+              < daily_limit
+          AND id <> ALL(:exclude)
+        ORDER BY
+            (CASE WHEN last_reset < :day_start THEN 0 ELSE used_today END)::float
+                / weight,
+            random()
+        LIMIT 1
+        FOR UPDATE {skip_locked}
+    )
+    UPDATE smtp_configs
+    SET used_today = CASE WHEN last_reset < :day_start
+                          THEN 1 ELSE used_today + 1 END,
+        last_reset = CASE WHEN last_reset < :day_start
+                          THEN now() ELSE last_reset END
+    FROM candidate
+    WHERE smtp_configs.id = candidate.id
+    RETURNING smtp_configs.id, smtp_email, smtp_host, smtp_port, smtp_password,
+              consecutive_failures
+"""
+_reserve_skip_locked = text(_reserve_sql.format(skip_locked="SKIP LOCKED"))
+_reserve_wait = text(_reserve_sql.format(skip_locked=""))
+
+# The message never left, so the quota unit is handed back
+_failure_sql = text(
+    """
+    UPDATE smtp_configs
+    SET used_today = GREATEST(used_today - 1, 0),
+        consecutive_failures = consecutive_failures + :increment,
+        last_error = :error,
+        is_healthy = consecutive_failures + :increment < :max_failures,
+        unhealthy_until = CASE
+            WHEN consecutive_failures + :increment >= :max_failures
+            THEN now() + make_interval(secs => LEAST(
+                :cooldown * power(2, consecutive_failures + :increment
+                                     - :max_failures),
+                :cooldown_max))
+            ELSE unhealthy_until
+        END
+    WHERE id = :id
+    """
+)
+
+_recovered_sql = text(
+    """
+    UPDATE smtp_configs
+    SET consecutive_failures = 0, is_healthy = true,
+        unhealthy_until = NULL, last_error = NULL
+    WHERE id = :id
+    """
+)
+
+
+def _execute(statement, params: dict):
+    # A short session per statement: no connection is held during the send
+    db = SessionLocal()
+    try:
+        result = db.execute(statement, params)
+        row = result.first() if result.returns_rows else None
+        db.commit()
+        return row
+    finally:
+        db.close()
+
+
+def _day_start() -> datetime:
+    return datetime.now(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+def reserve(exclude: Set[str] = frozenset()) -> Optional[Reservation]:
+    """Take one unit of quota from the best account, or None if none has any."""
+    params = {"day_start": _day_start(), "exclude": list(exclude)}
+    row = _execute(_reserve_skip_locked, params) or _execute(_reserve_wait, params)
+    if row is None:
+        return None
+    return Reservation(
+        id=row.id,
+        email=row.smtp_email,
+        account=smtp_pool.SmtpAccount(
+            host=row.smtp_host,
+            port=row.smtp_port,
+            username=row.smtp_email,
+            password=row.smtp_password,
+            use_tls=settings.SMTP_TLS,
+        ),
+        consecutive_failures=row.consecutive_failures,
+    )
+
+
+def record_failure(reservation: Reservation, error: Exception) -> None:
+    # Bad credentials won't fix themselves on the next message
+    increment = 1
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        increment = settings.SMTP_ACCOUNT_MAX_FAILURES
+    _execute(
+        _failure_sql,
+        {
+            "id": reservation.id,
+            "increment": increment,
+            "error": str(error)[:1000],
+            "max_failures": settings.SMTP_ACCOUNT_MAX_FAILURES,
+            "cooldown": settings.SMTP_ACCOUNT_COOLDOWN_SECONDS,
+            "cooldown_max": settings.SMTP_ACCOUNT_COOLDOWN_MAX_SECONDS,
+        },
+    )
+
+
+def record_success(reservation: Reservation) -> None:
+    # Healthy accounts, the common case, cost no extra write
+    if reservation.consecutive_failures:
+        _execute(_recovered_sql, {"id": reservation.id})
+
+
+def send(build_message: Callable[[str], EmailMessage]) -> str:
+    """
+    Send ``build_message(from_email)`` through the balanced accounts and
+    return the id of the account that sent it. Raises NoAccountAvailable
+    when no account could take it, or the error of the last attempt.
+    """
+    tried: Set[str] = set()
+    error: Optional[Exception] = None
+    for _ in range(settings.SMTP_BALANCER_MAX_ATTEMPTS):
+        reservation = reserve(tried)
+        if reservation is None:
+            break
+        tried.add(reservation.id)
+        message = build_message(reservation.email)
+        try:
+            smtp_pool.get_pool(reservation.account).send(message)
+        except smtplib.SMTPRecipientsRefused:
+            # The account did its job
+            record_success(reservation)
+            raise
+        except Exception as e:
+            logger.warning(f"SMTP account {reservation.email} failed: {e}")
+            record_failure(reservation, e)
+            error = e
+            continue
+        record_success(reservation)
+        return reservation.id
+
+    if error is not None:
+        raise error
+    raise NoAccountAvailable("No SMTP account with quota left")
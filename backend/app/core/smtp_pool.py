@@ -0,0 +1,220 @@
+"""
+Pooled SMTP connections for the SMTP delivery path.
+
+Opening an SMTP session costs a TCP handshake, EHLO, STARTTLS and AUTH, which
+is far more than sending one small message over it. Each SMTPPool keeps up to
+``size`` authenticated connections per account and sends many messages over
+each. Connections are recycled after ``max_messages`` messages (providers
+cap messages per session) or ``max_idle`` seconds without use; a connection
+idle for more than ``check_after`` seconds is probed with NOOP before reuse,
+and a send that fails because the server dropped the connection is retried
+once on a fresh one.
+"""
+import hashlib
+import hmac
+import smtplib
+import threading
+import time
+from dataclasses import dataclass
+from email.message import EmailMessage
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+# Errors meaning the connection is gone, not that the message was refused
+# (SMTPException itself is an OSError, so OSError is too broad here)
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+@dataclass(frozen=True)
+class SmtpAccount:
+    host: str
+    port: int
+    username: str = ""
+    password: str = ""
+    use_tls: bool = True
+
+    @property
+    def label(self) -> str:
+        """
+        Stable opaque id for metrics: the same in every worker, but neither
+        the login nor the server can be read back from it.
+        """
+        name = f"{self.username}@{self.host}:{self.port}".encode()
+        digest = hmac.new(settings.SECRET_KEY.encode(), name, hashlib.sha256)
+        return digest.hexdigest()[:12]
+
+
+def default_account() -> SmtpAccount:
+    return SmtpAccount(
+        host=settings.SMTP_HOST,
+        port=settings.SMTP_PORT,
+        username=settings.SMTP_USER,
+        password=settings.SMTP_PASSWORD,
+        use_tls=settings.SMTP_TLS,
+    )
+
+
+class _Connection:
+    def __init__(self, account: SmtpAccount, timeout: float):
+        self.smtp = smtplib.SMTP(account.host, account.port, timeout=timeout)
+        try:
+            self.smtp.ehlo()
+            if account.use_tls:
+                self.smtp.starttls()
+                self.smtp.ehlo()
+            if account.username:
+                self.smtp.login(account.username, account.password)
+        except Exception:
+            self.close()
+            raise
+        self.messages = 0
+        self.last_used = time.monotonic()
+
+    def is_alive(self) -> bool:
+        try:
+            return self.smtp.noop()[0] == 250
+        except OSError:
+            return False
+
+    def close(self) -> None:
+        try:
+            self.smtp.quit()
+        except Exception:
+            self.smtp.close()
+
+
+class SMTPPool:
+    def __init__(
+        self,
+        account: SmtpAccount,
+        size: int = None,
+        max_messages: int = None,
+        max_idle: float = None,
+        check_after: float = None,
+        timeout: float = None,
+    ):
+        self.account = account
+        self.size = size or settings.SMTP_POOL_SIZE
+        self.max_messages = max_messages or settings.SMTP_POOL_MAX_MESSAGES
+        self.max_idle = max_idle or settings.SMTP_POOL_MAX_IDLE_SECONDS
+        self.check_after = check_after or settings.SMTP_POOL_CHECK_AFTER_SECONDS
+        self.timeout = timeout or settings.SMTP_TIMEOUT
+        self._idle: List[_Connection] = []
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.messages_sent = 0
+
+    def _connect(self) -> _Connection:
+        connection = _Connection(self.account, self.timeout)
+        with self._lock:
+            self.connections_opened += 1
+        return connection
+
+    def _checkout(self) -> _Connection:
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                return self._connect()
+            idle = time.monotonic() - connection.last_used
+            if idle > self.max_idle:
+                connection.close()
+            elif idle > self.check_after and not connection.is_alive():
+                connection.close()
+            else:
+                return connection
+
+    def _checkin(self, connection: _Connection) -> None:
+        connection.last_used = time.monotonic()
+        if connection.messages >= self.max_messages:
+            connection.close()
+            return
+        with self._lock:
+            self._idle.append(connection)
+
+    def _reset(self, connection: _Connection) -> None:
+        try:
+            connection.smtp.rset()
+        except OSError:
+            connection.close()
+            return
+        self._checkin(connection)
+
+    def send(self, message: EmailMessage) -> None:
+        """Send one message, blocking while all connections are busy."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("No SMTP connection available")
+        try:
+            connection = self._checkout()
+            try:
+                try:
+                    connection.smtp.send_message(message)
+                except _CONNECTION_ERRORS:
+                    # Dropped in a way NOOP didn't catch: retry once on a new
+                    # connection, errors from that one propagate
+                    connection.close()
+                    connection = self._connect()
+                    connection.smtp.send_message(message)
+            except _CONNECTION_ERRORS:
+                connection.close()
+                raise
+            except smtplib.SMTPException:
+                # Refused message (bad recipient, ...): the session is fine,
+                # but reset it so the next message starts clean
+                self._reset(connection)
+                raise
+            except Exception:
+                connection.close()
+                raise
+            connection.messages += 1
+            with self._lock:
+                self.messages_sent += 1
+            self._checkin(connection)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "idle": len(self._idle),
+                "size": self.size,
+                "connections_opened": self.connections_opened,
+                "messages_sent": self.messages_sent,
+            }
+
+
+_pools: Dict[SmtpAccount, SMTPPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(account: Optional[SmtpAccount] = None) -> SMTPPool:
+    """The shared pool for ``account`` (the SMTP_* settings by default)."""
+    account = account or default_account()
+    pool = _pools.get(account)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(account, SMTPPool(account))
+    return pool
+
+
+def close_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """``stats()`` of every pool, by account label."""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {account.label: pool.stats() for account, pool in pools}
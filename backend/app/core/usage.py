@@ -0,0 +1,298 @@
+"""
+Usage logging and the incrementally maintained ``usage_rollups`` counters.
+
+Every usage_logs row also bumps two counters in usage_rollups: the UTC hour
+and the UTC day it falls in. Dashboards read those counters, so their cost
+depends on the number of buckets rather than on request volume. Each counter
+is striped over USAGE_ROLLUP_SHARDS rows: the upsert runs in the request
+transaction and keeps its row locks until commit, so every session writes to
+one randomly picked stripe and concurrent requests of a user rarely wait on
+each other. Readers sum the stripes; a rebuild folds them back into one. The
+``rebuild_rollups`` / ``prune_hourly_rollups`` helpers back the compactor
+(``python -m app.workers.usage_rollups``) used for backfills and repairs.
+
+With USAGE_LOG_BUFFERED the rows skip the request transaction entirely: they
+go into an in-process ring buffer that a background thread writes out in
+bulk. This trades durability (a crash loses what is still buffered) for
+latency on the hot path.
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db import models
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_GRANULARITIES = ("hour", "day")
+
+# (user_id, endpoint, status, timestamp, count)
+UsageEvent = Tuple[str, str, str, datetime, int]
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    timestamp = timestamp.astimezone(timezone.utc)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _rollup_shard(db: Session) -> int:
+    # One stripe per session, so a transaction never holds locks in two
+    # stripes of a counter (which could deadlock against another one)
+    shard = db.info.get("usage_rollup_shard")
+    if shard is None:
+        shard = random.randrange(max(1, settings.USAGE_ROLLUP_SHARDS))
+        db.info["usage_rollup_shard"] = shard
+    return shard
+
+
+def increment_rollups(db: Session, events: Iterable[UsageEvent]) -> None:
+    """
+    Add ``events`` to the hourly and daily counters, in this session's stripe,
+    with one multi-row upsert. Does not commit.
+    """
+    counts = Counter()
+    for user_id, endpoint, status, timestamp, count in events:
+        for granularity in ROLLUP_GRANULARITIES:
+            key = (user_id, granularity, bucket_start(timestamp, granularity), endpoint, status)
+            counts[key] += count
+    if not counts:
+        return
+
+    # Sorted so concurrent writers lock rows in the same order
+    shard = _rollup_shard(db)
+    rows = [
+        {
+            "user_id": user_id,
+            "granularity": granularity,
+            "bucket_start": bucket,
+            "endpoint": endpoint,
+            "status": status,
+            "shard": shard,
+            "count": count,
+        }
+        for (user_id, granularity, bucket, endpoint, status), count in sorted(
+            counts.items()
+        )
+    ]
+    dialect = db.get_bind().dialect.name
+    insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    stmt = insert(models.UsageRollup).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[c.name for c in models.UsageRollup.__table__.primary_key],
+        set_={"count": models.UsageRollup.count + stmt.excluded.count},
+    )
+    db.execute(stmt)
+
+
+def write_usage(db: Session, records: List[UsageEvent]) -> None:
+    """Insert usage_logs rows and bump their rollups in bulk. Does not commit."""
+    db.execute(
+        insert(models.UsageLog),
+        [
+            {
+                "user_id": user_id,
+                "endpoint": endpoint,
+                "status": status,
+                "timestamp": timestamp,
+            }
+            for user_id, endpoint, status, timestamp, _ in records
+        ],
+    )
+    increment_rollups(db, records)
+
+
+def rebuild_rollups(db: Session, since: datetime) -> int:
+    """
+    Recompute every rollup bucket starting at or after ``since`` (truncated to
+    the UTC day) from usage_logs, into a single stripe. Returns the number of
+    rollup rows written. Does not commit.
+    """
+    since = bucket_start(since, "day")
+    db.query(models.UsageRollup).filter(
+        models.UsageRollup.bucket_start >= since
+    ).delete(synchronize_session=False)
+    written = 0
+    for granularity in ROLLUP_GRANULARITIES:
+        result = db.execute(
+            text(
+                """
+                INSERT INTO usage_rollups
+                    (user_id, granularity, bucket_start, endpoint, status, count)
+                SELECT user_id, :granularity,
+                       date_trunc(:granularity, timestamp AT TIME ZONE 'UTC')
+                           AT TIME ZONE 'UTC',
+                       endpoint, status, count(*)
+                FROM usage_logs
+                WHERE user_id IS NOT NULL AND timestamp >= :since
+                GROUP BY 1, 2, 3, 4, 5
+                """
+            ),
+            {"granularity": granularity, "since": since},
+        )
+        written += result.rowcount
+    return written
+
+
+def prune_hourly_rollups(db: Session, before: datetime) -> int:
+    """
+    Delete hourly buckets older than ``before``; daily buckets are kept.
+    Does not commit.
+    """
+    return (
+        db.query(models.UsageRollup)
+        .filter(
+            models.UsageRollup.granularity == "hour",
+            models.UsageRollup.bucket_start < before,
+        )
+        .delete(synchronize_session=False)
+    )
+
+
+class UsageLogBuffer:
+    """
+    Bounded ring buffer of usage records drained by a background thread.
+
+    The flusher writes everything buffered every ``flush_interval`` seconds,
+    or as soon as ``flush_size`` records are waiting. When the buffer is full
+    the oldest records are overwritten and counted in ``dropped``.
+    """
+
+    def __init__(self, capacity: int, flush_interval: float, flush_size: int):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.dropped = 0
+        self.flushed = 0
+        self.flush_errors = 0
+        self.last_flush_seconds = 0.0
+        self._records: deque = deque(maxlen=capacity)
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._flush_lock = threading.Lock()
+
+    def push(self, record: UsageEvent) -> None:
+        with self._wakeup:
+            if len(self._records) == self.capacity:
+                self.dropped += 1
+            self._records.append(record)
+            if len(self._records) >= self.flush_size:
+                self._wakeup.notify()
+
+    def flush(self) -> int:
+        """Write out everything currently buffered. Returns records written."""
+        with self._flush_lock:
+            with self._wakeup:
+                records = list(self._records)
+                self._records.clear()
+            if not records:
+                return 0
+            start = time.perf_counter()
+            db = SessionLocal()
+            try:
+                write_usage(db, records)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                self.flush_errors += 1
+                self._requeue(records)
+                logger.error(f"Usage log flush failed: {str(e)}", exc_info=True)
+                return 0
+            finally:
+                db.close()
+            self.flushed += len(records)
+            self.last_flush_seconds = time.perf_counter() - start
+            return len(records)
+
+    def _requeue(self, records: List[UsageEvent]) -> None:
+        # Put a failed batch back in front of newer records, as room allows
+        with self._wakeup:
+            room = self.capacity - len(self._records)
+            keep = records[-room:] if room > 0 else []
+            self.dropped += len(records) - len(keep)
+            self._records.extendleft(reversed(keep))
+
+    def _run(self) -> None:
+        while True:
+            with self._wakeup:
+                if not self._stopping and len(self._records) < self.flush_size:
+                    self._wakeup.wait(self.flush_interval)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name="usage-log-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flusher after a final flush."""
+        if self._thread is not None:
+            with self._wakeup:
+                self._stopping = True
+                self._wakeup.notify()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> Dict[str, float]:
+        with self._wakeup:
+            depth = len(self._records)
+        return {
+            "depth": depth,
+            "capacity": self.capacity,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "flush_errors": self.flush_errors,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
+
+
+usage_buffer: Optional[UsageLogBuffer] = None
+if settings.USAGE_LOG_BUFFERED:
+    usage_buffer = UsageLogBuffer(
+        capacity=settings.USAGE_LOG_BUFFER_CAPACITY,
+        flush_interval=settings.USAGE_LOG_FLUSH_INTERVAL_MS / 1000,
+        flush_size=settings.USAGE_LOG_FLUSH_SIZE,
+    )
+
+
+def log_usage_many(db: Session, records: List[UsageEvent]) -> None:
+    """
+    Record API calls: into the buffer when buffering is on, otherwise into
+    usage_logs and the rollups within the caller's transaction (no commit).
+    """
+    if usage_buffer is not None:
+        for record in records:
+            usage_buffer.push(record)
+        return
+    write_usage(db, records)
+
+
+def log_usage(
+    db: Session,
+    user_id: str,
+    endpoint: str,
+    status: str,
+    timestamp: Optional[datetime] = None,
+) -> None:
+    """Record one API call. See log_usage_many."""
+    timestamp = timestamp or datetime.now(timezone.utc)
+    log_usage_many(db, [(user_id, endpoint, status, timestamp, 1)])
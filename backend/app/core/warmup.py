@@ -0,0 +1,128 @@
+"""
+Per-process warmup, and the readiness flag behind /health/ready.
+
+Without it the first requests a fresh worker serves pay for the database
+connections, the TLS handshake to the email provider, the template compiles
+and the ORM mapper setup. The lifespan runs ``warm_up`` before the worker
+accepts requests; when a step fails (the database is still starting, say)
+the worker keeps retrying in the background and only reports ready once a
+run succeeds.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+from starlette.concurrency import run_in_threadpool
+
+from app.core import email_templates, email_utils, security
+from app.core.config import settings
+from app.db import session
+
+logger = logging.getLogger(__name__)
+
+RETRY_INTERVAL_SECONDS = 5.0
+
+_ready = False
+
+
+def is_ready() -> bool:
+    return _ready
+
+
+def mark_not_ready() -> None:
+    """Called on shutdown, so load balancers stop routing here first."""
+    global _ready
+    _ready = False
+
+
+def _warm_database(engine, connections: int) -> None:
+    # Hold them all at once, otherwise the pool hands back the same one
+    held = []
+    try:
+        for _ in range(connections):
+            connection = engine.connect()
+            held.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in held:
+            connection.close()
+
+
+def _warm_replica(connections: int) -> None:
+    # Best effort: without the replica, dashboard reads use the primary
+    try:
+        _warm_database(session.replica_engine, connections)
+    except Exception as exc:
+        logger.warning("Replica warmup failed: %s", exc)
+    session.replica_router.check()
+
+
+async def _warm_async_database(connections: int) -> None:
+    async def ping(connection) -> None:
+        await connection.execute(text("SELECT 1"))
+
+    held = []
+    try:
+        for _ in range(connections):
+            held.append(await session.async_engine.connect())
+        await asyncio.gather(*(ping(connection) for connection in held))
+    finally:
+        for connection in held:
+            await connection.close()
+
+
+async def _warm_email_client() -> None:
+    client = await email_utils.open_http_client()
+    if not settings.BREVO_API_KEY:
+        return
+    # Any answer will do: it leaves a TLS connection in the client's pool
+    try:
+        await client.head(settings.BREVO_API_URL)
+    except httpx.HTTPError as exc:
+        logger.info("Email client warmup request failed: %s", exc)
+
+
+async def warm_up() -> None:
+    global _ready
+    started = time.perf_counter()
+    email_templates.load_templates()
+    security.password_hasher.start()
+    # Otherwise the first ORM query of the process sets up every mapper
+    configure_mappers()
+    connections = settings.WARMUP_DB_CONNECTIONS
+    if connections > 0:
+        await run_in_threadpool(_warm_database, session.engine, connections)
+        if session.async_engine is not None:
+            await _warm_async_database(connections)
+    if session.replica_router is not None:
+        await run_in_threadpool(_warm_replica, connections)
+    if settings.WARMUP_EMAIL_CONNECTION:
+        await _warm_email_client()
+    _ready = True
+    logger.info("Warmup finished in %.0f ms", (time.perf_counter() - started) * 1000)
+
+
+async def _retry_until_ready() -> None:
+    while not _ready:
+        await asyncio.sleep(RETRY_INTERVAL_SECONDS)
+        try:
+            await warm_up()
+        except Exception as exc:
+            logger.warning("Warmup failed, retrying: %s", exc)
+
+
+async def start() -> Optional[asyncio.Task]:
+    """
+    Warm up before the first request. On failure, return the task that keeps
+    retrying (the caller cancels it on shutdown) instead of failing startup.
+    """
+    try:
+        await warm_up()
+        return None
+    except Exception:
+        logger.exception("Warmup failed, not ready yet")
+        return asyncio.create_task(_retry_until_ready())
@@ -1,4 +1,16 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    Integer,
+    SmallInteger,
+    String,
+    DateTime,
+    ForeignKey,
+    Index,
+    Text,
+    text,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base import Base
@@ -21,6 +33,10 @@ class User(Base):
     reset_token = Column(String, nullable=True, index=True)
     reset_token_expires = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Per-user send limits; NULL falls back to the RATE_LIMIT_* settings
+    rate_limit_per_minute = Column(Integer, nullable=True)
+    rate_limit_burst = Column(Integer, nullable=True)
+    recipient_rate_limit_per_hour = Column(Integer, nullable=True)
 
     usage_logs = relationship("UsageLog", back_populates="user")
 
@@ -33,9 +49,21 @@ class OTP(Base):
     otp_hash = Column(String, nullable=False)
     expires_at = Column(DateTime(timezone=True), nullable=False)
     attempts = Column(Integer, default=0)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     is_verified = Column(Boolean, default=False)
 
+    __table_args__ = (
+        # Serves the verify lookup (newest live code for an email) from the
+        # index alone; verified rows are left out to keep it small.
+        Index(
+            "ix_otps_email_created_at_live",
+            "email",
+            text("created_at DESC"),
+            postgresql_include=["otp_hash", "attempts", "expires_at"],
+            postgresql_where=text("is_verified = false"),
+        ),
+    )
+
 
 class SMTPConfig(Base):
     __tablename__ = "smtp_configs"
@@ -48,6 +76,16 @@ class SMTPConfig(Base):
     daily_limit = Column(Integer, default=100)
     used_today = Column(Integer, default=0)
     last_reset = Column(DateTime(timezone=True), server_default=func.now())
+    # Share of the traffic relative to the other accounts
+    weight = Column(Integer, nullable=False, default=1, server_default="1")
+    # Set by the balancer after SMTP_ACCOUNT_MAX_FAILURES errors in a row; the
+    # account is tried again once unhealthy_until has passed
+    is_healthy = Column(Boolean, nullable=False, default=True, server_default="true")
+    unhealthy_until = Column(DateTime(timezone=True), nullable=True)
+    consecutive_failures = Column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    last_error = Column(Text, nullable=True)
 
 
 class UsageLog(Base):
@@ -60,3 +98,43 @@ class UsageLog(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", back_populates="usage_logs")
+
+    __table_args__ = (
+        Index("ix_usage_logs_user_id_timestamp", "user_id", "timestamp"),
+    )
+
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id = Column(String, primary_key=True, index=True, default=generate_uuid)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    html_content = Column(Text, nullable=False)
+    text_content = Column(Text, nullable=True)
+    status = Column(String, nullable=False, default="pending")  # pending, dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+
+class UsageRollup(Base):
+    """Pre-aggregated usage_logs counters per user/endpoint/status and bucket."""
+
+    __tablename__ = "usage_rollups"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    granularity = Column(String, primary_key=True)  # hour, day
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    endpoint = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    # Each bucket's count is spread over USAGE_ROLLUP_SHARDS rows; sum them
+    shard = Column(SmallInteger, primary_key=True, default=0, server_default="0")
+    count = Column(BigInteger, nullable=False, default=0)
@@ -0,0 +1,228 @@
+"""
+Engine construction: pool sizing, server-side timeouts, pre-ping and pool
+instrumentation, from the DB_* settings.
+
+Checkout waits are timed inside the pool (the time a caller spends in
+``QueuePool._do_get``, which includes opening a new connection when the
+pool grows) into a latency histogram; pool events count new connections,
+invalidations and pings. ``pool_stats`` / ``wait_histograms`` feed /metrics.
+Both sync and async pools are used from several threads, so the counters
+are behind a lock.
+
+Pre-ping strategies:
+
+- ``always``: SQLAlchemy's pool_pre_ping, one extra round-trip per checkout
+- ``idle``: ping only connections idle for DB_POOL_PRE_PING_IDLE_SECONDS or
+  longer, which is when the server or a proxy may have dropped them
+- ``never``: rely on DB_POOL_RECYCLE and on errors invalidating the pool
+"""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import sqlalchemy
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.config import settings
+from app.core.metrics import Histogram
+
+# Engines by name ("sync", "async"), for the pool gauges
+engines: Dict[str, Engine] = {}
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.wait = Histogram()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.peak_checked_out = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.pings = 0
+        self.ping_failures = 0
+
+    def checked_out(self, seconds: float, checked_out: int) -> None:
+        with self._lock:
+            self.wait.observe(seconds)
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+
+    def count(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self) -> Tuple[Dict[str, int], Histogram]:
+        with self._lock:
+            wait = Histogram()
+            wait.counts, wait.sum, wait.count = (
+                list(self.wait.counts),
+                self.wait.sum,
+                self.wait.count,
+            )
+            counters = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "peak_checked_out": self.peak_checked_out,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "pings": self.pings,
+                "ping_failures": self.ping_failures,
+            }
+        return counters, wait
+
+
+class _InstrumentedPoolMixin:
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.count("timeouts")
+            raise
+        self.metrics.checked_out(time.perf_counter() - started, self.checkedout())
+        return record
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool; keep counting into the same place
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _server_settings() -> Dict[str, str]:
+    # 0 means "leave the server / role default alone", not "disable"
+    values = {
+        "statement_timeout": settings.DB_STATEMENT_TIMEOUT_MS,
+        "idle_in_transaction_session_timeout": settings.DB_IDLE_IN_TRANSACTION_TIMEOUT_MS,
+    }
+    return {name: str(value) for name, value in values.items() if value > 0}
+
+
+def _pool_options(pre_ping: str) -> dict:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": pre_ping == "always",
+    }
+
+
+def _instrument(engine: Engine, name: str, pre_ping: str) -> None:
+    metrics = engine.pool.metrics = PoolMetrics()
+    idle_seconds = settings.DB_POOL_PRE_PING_IDLE_SECONDS
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, record):
+        metrics.count("connects")
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, record, exception):
+        metrics.count("invalidations")
+
+    if pre_ping == "idle":
+
+        @event.listens_for(engine, "checkin")
+        def on_checkin(dbapi_connection, record):
+            record.info["checked_in_at"] = time.monotonic()
+
+        @event.listens_for(engine, "checkout")
+        def on_checkout(dbapi_connection, record, proxy):
+            checked_in_at = record.info.pop("checked_in_at", None)
+            if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+                return
+            metrics.count("pings")
+            try:
+                alive = engine.dialect.do_ping(dbapi_connection)
+            except Exception:
+                alive = False
+            if not alive:
+                metrics.count("ping_failures")
+                # The pool discards the connection and checks out another
+                raise exc.DisconnectionError("Connection failed its idle ping")
+
+    engines[name] = engine
+
+
+def make_engine(
+    url: str,
+    name: str = "sync",
+    pre_ping: Optional[str] = None,
+    connect_timeout: Optional[int] = None,
+) -> Engine:
+    """A psycopg2 engine configured from the DB_* settings."""
+    pre_ping = pre_ping or settings.DB_POOL_PRE_PING
+    connect_args = {}
+    options = " ".join(f"-c {key}={value}" for key, value in _server_settings().items())
+    if options:
+        connect_args["options"] = options
+    if connect_timeout:
+        connect_args["connect_timeout"] = connect_timeout
+    engine = sqlalchemy.create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        connect_args=connect_args,
+        **_pool_options(pre_ping),
+    )
+    _instrument(engine, name, pre_ping)
+    return engine
+
+
+def make_async_engine(
+    url: str,
+    name: str = "async",
+    pre_ping: Optional[str] = None,
+    connect_timeout: Optional[int] = None,
+) -> AsyncEngine:
+    """An asyncpg engine configured from the DB_* settings."""
+    pre_ping = pre_ping or settings.DB_POOL_PRE_PING
+    connect_args = {"server_settings": _server_settings()}
+    if connect_timeout:
+        connect_args["timeout"] = connect_timeout
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedAsyncQueuePool,
+        connect_args=connect_args,
+        **_pool_options(pre_ping),
+    )
+    _instrument(engine.sync_engine, name, pre_ping)
+    return engine
+
+
+def pool_stats() -> Dict[str, Dict[str, float]]:
+    """Occupancy and counters of every engine's pool, by engine name."""
+    stats = {}
+    for name, engine in engines.items():
+        pool = engine.pool
+        counters, _ = pool.metrics.snapshot()
+        # max_overflow -1 means no limit, and no meaningful saturation
+        overflow = settings.DB_MAX_OVERFLOW
+        capacity = pool.size() + overflow if overflow >= 0 else 0
+        checked_out = pool.checkedout()
+        stats[name] = {
+            "size": pool.size(),
+            "capacity": capacity,
+            "checked_out": checked_out,
+            "idle": pool.checkedin(),
+            "saturation": checked_out / capacity if capacity else 0.0,
+            **counters,
+        }
+    return stats
+
+
+def wait_histograms() -> Dict[str, Histogram]:
+    return {name: engine.pool.metrics.snapshot()[1] for name, engine in engines.items()}
@@ -1,6 +1,231 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, TypeVar, Union
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
 from app.core.config import settings
+from app.db.pool import make_async_engine, make_engine
 
-engine = create_engine(str(settings.DATABASE_URL), pool_pre_ping=True)
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+AnySession = Union[Session, AsyncSession]
+
+engine = make_engine(str(settings.DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine (asyncpg), only created when DB_ASYNC is enabled
+async_engine = None
+AsyncSessionLocal = None
+if settings.DB_ASYNC:
+    async_engine = make_async_engine(settings.async_database_url)
+    # Objects must stay readable outside run_sync() after a commit
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+
+
+# Read replica, only when DATABASE_REPLICA_URL is set. Read-only endpoints
+# get sessions on it through deps.get_read_db while replica_router allows.
+# A short connect timeout, so an unreachable replica fails checks quickly.
+REPLICA_CONNECT_TIMEOUT_SECONDS = 2
+replica_engine = None
+ReplicaSessionLocal = None
+AsyncReplicaSessionLocal = None
+if settings.DATABASE_REPLICA_URL is not None:
+    replica_engine = make_engine(
+        str(settings.DATABASE_REPLICA_URL),
+        name="replica",
+        connect_timeout=REPLICA_CONNECT_TIMEOUT_SECONDS,
+    )
+    ReplicaSessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, bind=replica_engine
+    )
+    if settings.DB_ASYNC:
+        AsyncReplicaSessionLocal = async_sessionmaker(
+            make_async_engine(
+                settings.async_replica_url,
+                name="replica_async",
+                connect_timeout=REPLICA_CONNECT_TIMEOUT_SECONDS,
+            ),
+            autoflush=False,
+            expire_on_commit=False,
+        )
+
+PRIMARY_POSITION_SQL = text("SELECT pg_current_wal_lsn()::text")
+REPLICA_POSITION_SQL = text(
+    """
+    SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn()::text,
+           EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    """
+)
+# Primary positions kept while the replica is behind, one per check
+MAX_PENDING_POSITIONS = 10000
+
+
+def _lsn(value: str) -> int:
+    high, low = value.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class ReplicaRouter:
+    """
+    Decides whether read-only sessions go to the replica: only while its last
+    lag check answered within ``max_lag`` seconds. Until the first check, and
+    while the replica is unreachable or behind, reads fall back to the
+    primary. Checks run in the background every ``interval`` seconds, so no
+    request ever waits on one. Read-your-writes paths must keep using get_db.
+
+    Lag is measured against the primary rather than from the replica alone:
+    each check records the primary's current WAL position, and the lag is the
+    age of the oldest recorded position the replica hasn't replayed yet. A
+    standby that stopped receiving WAL (its upstream connection dropped) has
+    replayed everything it got and would otherwise look caught up forever.
+    Before the replica has replayed any recorded position, the lag is at
+    least the time since its last replayed transaction.
+    """
+
+    def __init__(self, max_lag: float = None, interval: float = None):
+        self.max_lag = (
+            settings.DB_REPLICA_MAX_LAG_SECONDS if max_lag is None else max_lag
+        )
+        self.interval = interval or settings.DB_REPLICA_CHECK_INTERVAL
+        self.lag: Optional[float] = None
+        self.healthy = False
+        self.replica_reads = 0
+        self.primary_reads = 0
+        # (monotonic time, primary WAL position) not yet replayed
+        self._pending: Deque[Tuple[float, int]] = deque()
+        self._caught_up = False
+        self._stopping: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _measure(self) -> float:
+        sampled_at = time.monotonic()
+        with engine.connect() as connection:
+            primary = _lsn(connection.execute(PRIMARY_POSITION_SQL).scalar())
+        with replica_engine.connect() as connection:
+            in_recovery, replayed, replay_age = connection.execute(
+                REPLICA_POSITION_SQL
+            ).one()
+        if not in_recovery:
+            # Not a standby (pointed at the primary itself, say)
+            return 0.0
+
+        pending = self._pending
+        # An equal position is covered by the older entry
+        newer = not pending or pending[-1][1] < primary
+        if newer and len(pending) < MAX_PENDING_POSITIONS:
+            pending.append((sampled_at, primary))
+        replayed = _lsn(replayed)
+        while pending and pending[0][1] <= replayed:
+            pending.popleft()
+            self._caught_up = True
+        if not pending:
+            return 0.0
+        lag = time.monotonic() - pending[0][0]
+        if not self._caught_up:
+            # Behind since before the first check; no replayed transaction
+            # at all means no idea how far
+            lag = max(lag, math.inf if replay_age is None else float(replay_age))
+        return lag
+
+    def check(self) -> Optional[float]:
+        """Measure the replica's lag now and update the routing decision."""
+        try:
+            lag = self._measure()
+        except Exception as e:
+            if self.healthy or self.lag is not None:
+                logger.warning(f"Replica lag check failed: {str(e)}")
+            lag = None
+        healthy = lag is not None and lag <= self.max_lag
+        if healthy != self.healthy:
+            logger.warning(
+                f"Replica reads {'enabled' if healthy else 'disabled'} (lag: {lag})"
+            )
+        self.lag, self.healthy = lag, healthy
+        return lag
+
+    def use_replica(self) -> bool:
+        if self.healthy:
+            self.replica_reads += 1
+        else:
+            self.primary_reads += 1
+        return self.healthy
+
+    async def run(self) -> None:
+        while not self._stopping.is_set():
+            await run_in_threadpool(self.check)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> asyncio.Task:
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "healthy": int(self.healthy),
+            "lag_seconds": self.lag,
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+        }
+
+
+replica_router = ReplicaRouter() if replica_engine is not None else None
+
+
+def read_session() -> Session:
+    """A sync session for read-only work: on the replica when allowed."""
+    if replica_router is not None and replica_router.use_replica():
+        return ReplicaSessionLocal()
+    return SessionLocal()
+
+
+async def run_db(
+    db: AnySession, fn: Callable[..., T], *args: Any, **kwargs: Any
+) -> T:
+    """
+    Run ``fn(session, *args, **kwargs)`` against whichever session get_db handed out.
+
+    With an AsyncSession the function runs through ``run_sync`` so every query goes
+    over asyncpg without blocking the event loop; with a plain Session it runs on
+    the threadpool, which is exactly what a sync ``def`` endpoint would do.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def set_local_timeouts(
+    db: Session,
+    statement_ms: Optional[int] = None,
+    idle_in_transaction_ms: Optional[int] = None,
+) -> None:
+    """
+    Override DB_STATEMENT_TIMEOUT_MS / DB_IDLE_IN_TRANSACTION_TIMEOUT_MS until
+    the end of the current transaction (0 disables the timeout).
+    """
+    for name, value in (
+        ("statement_timeout", statement_ms),
+        ("idle_in_transaction_session_timeout", idle_in_transaction_ms),
+    ):
+        if value is not None:
+            db.execute(
+                text("SELECT set_config(:name, :value, true)"),
+                {"name": name, "value": str(value)},
+            )
@@ -1,12 +1,83 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy import exc as sqlalchemy_exc
+from starlette.concurrency import run_in_threadpool
+from app.core import (
+    email_utils,
+    metrics,
+    otp_store,
+    rate_limit,
+    security,
+    smtp_pool,
+    usage,
+    warmup,
+)
+from app.core.cache_invalidation import invalidator
 from app.core.config import settings
-from app.api.endpoints import auth, otp, dashboard, password_reset
+from app.core.otp_maintenance import MaintenanceTask
+from app.core.outbox import OutboxWorker
+from app.db import session
+from app.api.endpoints import auth, otp, dashboard, health, password_reset
+from app.api.endpoints import metrics as metrics_endpoint
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Templates, DB connections, email client and hashing pool; the worker
+    # reports ready on /health/ready once this has succeeded
+    warmup_retry = await warmup.start()
+    invalidator.start()
+    if session.replica_router is not None:
+        session.replica_router.start()
+    if usage.usage_buffer is not None:
+        usage.usage_buffer.start()
+    outbox_worker = None
+    if settings.EMAIL_OUTBOX_ENABLED and settings.EMAIL_OUTBOX_IN_PROCESS_WORKER:
+        outbox_worker = OutboxWorker()
+        outbox_worker.start()
+    otp_maintenance = None
+    if settings.OTP_MAINTENANCE_INTERVAL_SECONDS > 0:
+        otp_maintenance = MaintenanceTask()
+        otp_maintenance.start()
+    yield
+    warmup.mark_not_ready()
+    if warmup_retry is not None:
+        warmup_retry.cancel()
+    if session.replica_router is not None:
+        await session.replica_router.stop()
+    if otp_maintenance is not None:
+        await otp_maintenance.stop()
+    if outbox_worker is not None:
+        await outbox_worker.stop()
+    if usage.usage_buffer is not None:
+        await run_in_threadpool(usage.usage_buffer.stop)
+    await email_utils.close_http_client()
+    await run_in_threadpool(smtp_pool.close_pools)
+    security.password_hasher.close()
+    await run_in_threadpool(otp_store.store.close)
+    await run_in_threadpool(invalidator.close)
+    if rate_limit.limiter is not None:
+        await run_in_threadpool(rate_limit.limiter.close)
+
 
 app = FastAPI(
-    title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    title=settings.PROJECT_NAME,
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
 )
 
+
+@app.exception_handler(sqlalchemy_exc.TimeoutError)
+async def database_busy(request: Request, exc: sqlalchemy_exc.TimeoutError):
+    # Every pooled connection stayed checked out for DB_POOL_TIMEOUT seconds
+    return JSONResponse(
+        {"detail": "Database busy, please retry"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
 # Set all CORS enabled origins
 if settings.BACKEND_CORS_ORIGINS:
     app.add_middleware(
@@ -15,8 +86,14 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # Read by the dashboard: the logs page cursor, and 429 / 503 backoff
+        expose_headers=["X-Next-Cursor", "Retry-After"],
     )
 
+# Added last so it wraps everything else, CORS preflights included
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.TimingMiddleware)
+
 app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
 app.include_router(otp.router, prefix=f"{settings.API_V1_STR}/otp", tags=["otp"])
 app.include_router(
@@ -25,6 +102,9 @@ app.include_router(
 app.include_router(
     password_reset.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"]
 )
+app.include_router(health.router, prefix="/health", tags=["health"])
+if settings.METRICS_ENABLED:
+    app.include_router(metrics_endpoint.router, tags=["metrics"])
 
 
 @app.get("/")
@@ -0,0 +1,25 @@
+"""
+OTP retention maintenance: creates upcoming daily partitions of otps and
+drops expired ones, or deletes expired rows in batches when otps is not
+partitioned. Meant to run daily from cron.
+
+    python -m app.workers.otp_maintenance
+"""
+import logging
+
+from app.core.otp_maintenance import run_maintenance
+from app.db.session import engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    with engine.connect() as connection:
+        report = run_maintenance(connection)
+    if report.skipped:
+        logger.info("Another maintenance run holds the lock, skipping")
+
+
+if __name__ == "__main__":
+    main()
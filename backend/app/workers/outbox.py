@@ -0,0 +1,27 @@
+"""
+Standalone email outbox sender, so delivery can be scaled separately from
+the API workers:
+
+    python -m app.workers.outbox
+"""
+import asyncio
+import signal
+
+from app.core import email_utils
+from app.core.outbox import OutboxWorker
+
+
+async def main() -> None:
+    await email_utils.open_http_client()
+    worker = OutboxWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: asyncio.ensure_future(worker.stop()))
+    try:
+        await worker.start()
+    finally:
+        await email_utils.close_http_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Usage rollup compactor. Rebuilds rollup buckets from usage_logs (backfills,
+repairs after manual edits) and prunes hourly buckets past their retention;
+daily buckets are kept forever.
+
+    python -m app.workers.usage_rollups [--rebuild-since 2026-01-01] [--prune-hourly]
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.core import usage
+from app.core.config import settings
+from app.db.session import SessionLocal, set_local_timeouts
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rebuild-since",
+        type=datetime.fromisoformat,
+        help="Recompute buckets from this date (UTC) onwards",
+    )
+    parser.add_argument(
+        "--prune-hourly",
+        action="store_true",
+        help="Drop hourly buckets older than USAGE_ROLLUP_HOURLY_RETENTION_DAYS",
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.rebuild_since:
+            since = args.rebuild_since
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            start = time.perf_counter()
+            # Scans usage_logs from ``since``: may outlast DB_STATEMENT_TIMEOUT_MS
+            set_local_timeouts(db, statement_ms=0)
+            written = usage.rebuild_rollups(db, since)
+            db.commit()
+            logger.info(
+                f"Rebuilt {written} rollup rows since {since.date()} "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        if args.prune_hourly:
+            before = datetime.now(timezone.utc) - timedelta(
+                days=settings.USAGE_ROLLUP_HOURLY_RETENTION_DAYS
+            )
+            start = time.perf_counter()
+            deleted = usage.prune_hourly_rollups(db, before)
+            db.commit()
+            logger.info(
+                f"Pruned {deleted} hourly rollup rows older than {before.date()} "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
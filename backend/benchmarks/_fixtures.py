@@ -0,0 +1,26 @@
+"""Database fixtures shared by the benchmarks that drive the API."""
+import secrets
+
+from app.core import security
+from app.db import models
+from app.db.session import SessionLocal
+
+
+def create_api_user(password: str = "benchmark-password") -> models.User:
+    """Create an active user with a fresh API key, directly in the database."""
+    db = SessionLocal()
+    try:
+        token = secrets.token_hex(6)
+        user = models.User(
+            email=f"bench-{token}@example.com",
+            name="Benchmark",
+            hashed_password=security.get_password_hash(password),
+            api_key=f"otp_{secrets.token_urlsafe(32)}",
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
@@ -0,0 +1,32 @@
+"""Small timing helpers shared by the benchmark scripts."""
+import statistics
+import time
+from typing import Callable, Dict
+
+
+def measure(fn: Callable[[], object], number: int, warmup: int = 3) -> Dict[str, float]:
+    """
+    Call ``fn`` ``number`` times and return per-call timings in microseconds.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(number):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        "calls": number,
+        "mean_us": statistics.fmean(samples),
+        "p50_us": samples[len(samples) // 2],
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "ops_per_sec": 1e6 / statistics.fmean(samples),
+    }
+
+
+def print_row(label: str, result: Dict[str, float]) -> None:
+    print(
+        f"{label:<32} {result['mean_us']:>12.1f} us/call"
+        f" {result['p99_us']:>12.1f} us p99 {result['ops_per_sec']:>12.0f} ops/s"
+    )
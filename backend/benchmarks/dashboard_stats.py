@@ -0,0 +1,88 @@
+"""
+/dashboard/stats cost over a large usage_logs table: the old ten COUNT(*)
+queries vs. the single grouped query in dashboard._get_stats.
+
+Seeds ``--rows`` usage_logs rows (spread over ``--users`` users and the last
+90 days) into the database at DATABASE_URL, so point it at a scratch database.
+
+    python -m benchmarks.dashboard_stats [--rows 2000000] [--users 50]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.api.endpoints import dashboard
+from app.db import models
+from app.db.session import SessionLocal
+from benchmarks._fixtures import create_api_user
+
+
+def legacy_stats(db, user_id: str) -> dict:
+    """The pre-aggregation implementation: 3 counts + 7 per-day counts."""
+    total = db.query(models.UsageLog).filter(models.UsageLog.user_id == user_id).count()
+    db.query(models.UsageLog).filter(
+        models.UsageLog.user_id == user_id, models.UsageLog.status == "success"
+    ).count()
+    db.query(models.User).filter(models.User.is_active.is_(True)).count()
+    today = datetime.now()
+    for i in range(6, -1, -1):
+        day = today - timedelta(days=i)
+        db.query(models.UsageLog).filter(
+            models.UsageLog.user_id == user_id,
+            models.UsageLog.timestamp >= day.replace(hour=0, minute=0, second=0),
+            models.UsageLog.timestamp <= day.replace(hour=23, minute=59, second=59),
+        ).count()
+    return {"total_requests": total}
+
+
+def seed(db, user_ids, rows: int) -> None:
+    db.execute(
+        text(
+            """
+            INSERT INTO usage_logs (id, user_id, endpoint, status, timestamp)
+            SELECT md5(random()::text || g),
+                   (:user_ids)[1 + (g % cardinality(:user_ids))],
+                   CASE WHEN g % 2 = 0 THEN '/api/otp/send' ELSE '/api/otp/verify' END,
+                   CASE WHEN g % 10 = 0 THEN 'failed' ELSE 'success' END,
+                   now() - (random() * interval '90 days')
+            FROM generate_series(1, :rows) AS g
+            """
+        ),
+        {"user_ids": user_ids, "rows": rows},
+    )
+    db.commit()
+    db.execute(text("ANALYZE usage_logs"))
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    user_ids = [create_api_user().id for _ in range(args.users)]
+    db = SessionLocal()
+    try:
+        print(f"Seeding {args.rows} usage_logs rows...")
+        seed(db, user_ids, args.rows)
+        user_id = user_ids[0]
+        legacy = timed(lambda: legacy_stats(db, user_id), args.repeat)
+        grouped = timed(lambda: dashboard._get_stats(db, user_id, "UTC"), args.repeat)
+        print(f"legacy (10 queries) {legacy:>10.1f} ms/call")
+        print(f"grouped (1 query)   {grouped:>10.1f} ms/call")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Connection pool behaviour: the cost of each pre-ping strategy per checkout,
+and checkout waits once more threads want a connection than the pool holds.
+
+1. One thread checks out a connection and runs ``SELECT 1``, ``--number``
+   times, with DB_POOL_PRE_PING always / idle / never. "always" pays an
+   extra round-trip per checkout; "idle" and "never" don't while the
+   connection is in steady use.
+2. ``--threads`` threads each run ``--queries`` short transactions holding
+   the connection for ``--hold-ms``, against a pool of DB_POOL_SIZE +
+   DB_MAX_OVERFLOW connections; reports checkout wait percentiles from the
+   pool instrumentation, timeouts and peak saturation.
+
+Needs a migrated database at DATABASE_URL.
+
+    python -m benchmarks.db_pool [--number 2000] [--threads 64]
+        [--queries 50] [--hold-ms 5]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import exc, text
+
+from app.core.config import settings
+from app.db import pool
+from benchmarks._timing import measure, print_row
+
+
+def checkout_cost(number: int) -> None:
+    for strategy in ("always", "idle", "never"):
+        engine = pool.make_engine(
+            str(settings.DATABASE_URL), name=f"bench-{strategy}", pre_ping=strategy
+        )
+
+        def query() -> None:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+
+        print_row(f"checkout + SELECT 1 ({strategy})", measure(query, number))
+        engine.dispose()
+
+
+def saturation(threads: int, queries: int, hold_ms: float) -> None:
+    engine = pool.make_engine(str(settings.DATABASE_URL), name="bench-saturation")
+    hold = f"SELECT pg_sleep({hold_ms / 1000})"
+
+    def worker() -> int:
+        timeouts = 0
+        for _ in range(queries):
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text(hold))
+            except exc.TimeoutError:
+                timeouts += 1
+        return timeouts
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        timeouts = sum(executor.map(lambda _: worker(), range(threads)))
+    elapsed = time.perf_counter() - started
+
+    stats = pool.pool_stats()["bench-saturation"]
+    wait = pool.wait_histograms()["bench-saturation"]
+    print(
+        f"{threads} threads on a pool of {stats['capacity']}:"
+        f" {stats['checkouts'] / elapsed:.0f} checkouts/s,"
+        f" {timeouts} timeouts, peak {stats['peak_checked_out']} checked out"
+    )
+    print(
+        "checkout wait"
+        + "".join(
+            f"   p{int(q * 100)} {wait.quantile(q) * 1000:8.2f} ms"
+            for q in (0.50, 0.95, 0.99)
+        )
+    )
+    engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--hold-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    checkout_cost(args.number)
+    saturation(args.threads, args.queries, args.hold_ms)
+
+
+if __name__ == "__main__":
+    main()
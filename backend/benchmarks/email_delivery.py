@@ -0,0 +1,69 @@
+"""
+Brevo delivery latency: a new httpx.Client per email (the old behaviour) vs.
+the shared pooled client in email_utils, against a local stub server.
+
+    python -m benchmarks.email_delivery [--emails 500]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.core import email_utils
+from app.core.config import settings
+from benchmarks.stub_servers import StubBrevoServer
+
+
+def per_email_client(count: int) -> None:
+    for i in range(count):
+        request = email_utils._brevo_request(f"user{i}@example.com", "Bench", "<p>x</p>")
+        with httpx.Client() as client:
+            client.post(**request, timeout=10.0)
+
+
+async def pooled_client(count: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            await email_utils.send_email_async(
+                f"user{i}@example.com", "Bench", "<p>x</p>"
+            )
+
+    await email_utils.open_http_client()
+    try:
+        await asyncio.gather(*(one(i) for i in range(count)))
+    finally:
+        await email_utils.close_http_client()
+
+
+def report(label: str, stub: StubBrevoServer, count: int, elapsed: float) -> None:
+    print(
+        f"{label:<22} {count} emails in {elapsed:.2f}s"
+        f" ({elapsed / count * 1000:.2f} ms/email), {stub.connections} connections"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    settings.BREVO_API_KEY = settings.BREVO_API_KEY or "stub"
+    with StubBrevoServer() as stub:
+        settings.BREVO_API_URL = stub.url
+
+        start = time.perf_counter()
+        per_email_client(args.emails)
+        report("client per email", stub, args.emails, time.perf_counter() - start)
+
+        stub.connections = 0
+        start = time.perf_counter()
+        asyncio.run(pooled_client(args.emails, args.concurrency))
+        report("shared pooled client", stub, args.emails, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Per-email render cost: Jinja rendering the whole template every time vs. the
+pre-rendered static shell in app.core.email_templates.
+
+    python -m benchmarks.email_render
+"""
+from app.api.endpoints import otp, password_reset
+from app.core import email_templates
+from benchmarks._timing import measure, print_row
+
+NUMBER = 20000
+
+
+def main() -> None:
+    email_templates.load_templates()
+    cases = (
+        ("otp.html", {"otp_code": "123456"}),
+        (
+            "password_reset.html",
+            {
+                "reset_link": "http://localhost:3000/reset-password?token=abc",
+                "user_name": "Benchmark",
+            },
+        ),
+    )
+    for name, values in cases:
+        template = email_templates.environment.get_template(name)
+        static_context = email_templates.get_template(name).static_context
+        print_row(
+            f"{name} jinja",
+            measure(lambda: template.render(**static_context, **values), NUMBER),
+        )
+        print_row(
+            f"{name} precompiled",
+            measure(lambda: email_templates.render(name, **values), NUMBER),
+        )
+
+    print_row(
+        "otp email (html + text)",
+        measure(lambda: otp.build_otp_email("123456"), NUMBER),
+    )
+    print_row(
+        "reset email (html + text)",
+        measure(lambda: password_reset.build_reset_email("abc", "Benchmark"), NUMBER),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Microbenchmarks of the code every request runs, with a regression gate.
+
+Each case runs in ``--rounds`` batches and keeps the fastest batch's mean per
+call, like ``timeit``. To make a baseline useful on another box (and to
+cancel out CPU frequency drift during a run), a fixed pure-Python
+calibration loop is timed between the cases, and every case is also stored
+relative to the faster calibration on either side of it; ``--check``
+compares those ratios (``--absolute``
+compares microseconds instead, for a baseline recorded on the same machine).
+Cases over the threshold are measured again, up to ``--retries`` times, and
+keep their best result, so a noisy neighbour doesn't fail the gate but a
+real slowdown does. For the same reason ``--save`` stores the median of
+``--retries`` + 1 runs rather than one lucky (or unlucky) run.
+
+Needs no database, network or email provider.
+
+    python -m benchmarks.hot_paths                 # run, compare to baseline
+    python -m benchmarks.hot_paths --save          # record a new baseline
+    python -m benchmarks.hot_paths --check         # exit 1 on a regression
+        [--threshold 25] [--only otp_,jwt_] [--baseline path.json]
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+from jose import jwt
+
+from app.api import deps
+from app.api.endpoints import otp, password_reset
+from app.core import otp_hashing, security
+from app.core.config import settings
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baselines" / "hot_paths.json"
+DEFAULT_THRESHOLD = 25.0
+
+EMAIL = "bench@example.com"
+PASSWORD = "benchmark-password"
+
+
+def calibration() -> int:
+    total = 0
+    for i in range(2000):
+        total += i * i % 7
+    return total
+
+
+def cases() -> Dict[str, Tuple[Callable[[], object], int]]:
+    """Name -> (function, calls per round)."""
+    password_hash = security.get_password_hash(PASSWORD)
+    code = otp.generate_otp_code()
+    hmac, bcrypt = (
+        otp_hashing.hashers[otp_hashing.HmacOtpHasher.name],
+        otp_hashing.hashers[otp_hashing.BcryptOtpHasher.name],
+    )
+    hmac_hash, bcrypt_hash = hmac.hash(EMAIL, code), bcrypt.hash(EMAIL, code)
+    token = security.create_access_token("user-id", timedelta(days=1))
+    deps._decode_token(token)
+
+    return {
+        "password_hash": (lambda: security.get_password_hash(PASSWORD), 3),
+        "password_verify": (
+            lambda: security.verify_password(PASSWORD, password_hash),
+            3,
+        ),
+        "otp_code_generate": (otp.generate_otp_code, 20000),
+        "otp_hmac_hash": (lambda: hmac.hash(EMAIL, code), 20000),
+        "otp_hmac_verify": (
+            lambda: otp_hashing.verify_code(EMAIL, code, hmac_hash),
+            20000,
+        ),
+        "otp_bcrypt_hash": (lambda: bcrypt.hash(EMAIL, code), 3),
+        "otp_bcrypt_verify": (
+            lambda: otp_hashing.verify_code(EMAIL, code, bcrypt_hash),
+            3,
+        ),
+        "jwt_create": (lambda: security.create_access_token("user-id"), 5000),
+        "jwt_decode": (
+            lambda: jwt.decode(
+                token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+            ),
+            5000,
+        ),
+        "jwt_decode_cached": (lambda: deps._decode_token(token), 20000),
+        "otp_email_build": (lambda: otp.build_otp_email(code), 20000),
+        "reset_email_build": (
+            lambda: password_reset.build_reset_email("token", "Bench User"),
+            20000,
+        ),
+    }
+
+
+def best_us(fn: Callable[[], object], number: int, rounds: int) -> float:
+    fn()
+    return min(timeit.repeat(fn, number=number, repeat=rounds)) / number * 1e6
+
+
+def run(include: Callable[[str], bool], rounds: int) -> dict:
+    calibrations = [best_us(calibration, 500, rounds)]
+    results = {}
+    for name, (fn, number) in cases().items():
+        if not include(name):
+            continue
+        per_call = best_us(fn, number, rounds)
+        calibrations.append(best_us(calibration, 500, rounds))
+        # The faster of the calibrations on either side of the case
+        local = min(calibrations[-2:])
+        results[name] = {"us": per_call, "relative": per_call / local}
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "machine": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+        },
+        "calibration_us": min(calibrations),
+        "cases": results,
+    }
+
+
+def median_report(reports: list) -> dict:
+    report = reports[0]
+    for name in report["cases"]:
+        report["cases"][name] = {
+            key: statistics.median(r["cases"][name][key] for r in reports)
+            for key in ("us", "relative")
+        }
+    report["calibration_us"] = min(r["calibration_us"] for r in reports)
+    return report
+
+
+def changes(report: dict, baseline: dict, absolute: bool) -> Dict[str, float]:
+    """Percent change of each case against the baseline."""
+    key = "us" if absolute else "relative"
+    return {
+        name: (result[key] / baseline["cases"][name][key] - 1) * 100
+        for name, result in report["cases"].items()
+        if name in baseline["cases"]
+    }
+
+
+def retry_regressions(
+    report: dict, baseline: dict, args, threshold: float
+) -> Dict[str, float]:
+    for _ in range(args.retries):
+        regressed = {
+            name
+            for name, change in changes(report, baseline, args.absolute).items()
+            if change > threshold
+        }
+        if not regressed:
+            break
+        again = run(regressed.__contains__, args.rounds)
+        key = "us" if args.absolute else "relative"
+        for name, result in again["cases"].items():
+            if result[key] < report["cases"][name][key]:
+                report["cases"][name] = result
+    return changes(report, baseline, args.absolute)
+
+
+def print_comparison(
+    report: dict, baseline: dict, change: Dict[str, float], threshold: float
+) -> None:
+    for name, result in report["cases"].items():
+        if name not in change:
+            print(f"{name:<22} {result['us']:>12.1f} us   (no baseline)")
+            continue
+        print(
+            f"{name:<22} {result['us']:>12.1f} us"
+            f"   baseline {baseline['cases'][name]['us']:>12.1f} us"
+            f"   {change[name]:>+7.1f}%"
+            f"{'   REGRESSION' if change[name] > threshold else ''}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--absolute", action="store_true")
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--only", default="")
+    args = parser.parse_args()
+
+    prefixes = tuple(prefix for prefix in args.only.split(",") if prefix)
+
+    def include(name: str) -> bool:
+        return name.startswith(prefixes or "")
+
+    if args.save:
+        report = median_report(
+            [run(include, args.rounds) for _ in range(args.retries + 1)]
+        )
+        report["threshold_percent"] = args.threshold or DEFAULT_THRESHOLD
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        for name, result in report["cases"].items():
+            print(f"{name:<22} {result['us']:>12.1f} us")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    report = run(include, args.rounds)
+    if not args.baseline.exists():
+        for name, result in report["cases"].items():
+            print(f"{name:<22} {result['us']:>12.1f} us")
+        print(f"No baseline at {args.baseline}; record one with --save")
+        sys.exit(1 if args.check else 0)
+
+    baseline = json.loads(args.baseline.read_text())
+    threshold = args.threshold or baseline.get("threshold_percent", DEFAULT_THRESHOLD)
+    if not args.absolute and baseline["machine"] != report["machine"]:
+        print("Baseline recorded on another machine; comparing relative timings")
+    change = retry_regressions(report, baseline, args, threshold)
+    print_comparison(report, baseline, change, threshold)
+    regressions = sum(1 for value in change.values() if value > threshold)
+    if regressions:
+        print(f"{regressions} hot path(s) slower than the baseline by >{threshold}%")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
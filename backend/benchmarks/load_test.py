@@ -0,0 +1,396 @@
+"""
+End-to-end load test: send -> deliver -> verify flows against a real server.
+
+Starts the app under gunicorn with gunicorn.conf.py (``--workers`` uvicorn
+workers) in a subprocess, pointed at the database at DATABASE_URL (a scratch
+PostgreSQL database, migrated with ``alembic upgrade head``; the app relies on
+PostgreSQL-only SQL, so SQLite can't stand in) and at a local email stand-in: the stub Brevo HTTP server, or an aiosmtpd sink
+(``--email smtp``, from ``requirements-dev.txt``). Each virtual user then loops:
+
+1. POST /api/otp/send for a fresh address
+2. wait for the email to reach the stand-in, read the code from it
+3. POST /api/otp/verify with that code
+
+Reports flow throughput, client-side latency percentiles per endpoint, email
+delivery lag (from the send request to arrival at the stand-in) and database
+work per flow from pg_stat_database (pg_stat_statements too, when installed),
+and writes it all as JSON to ``--output``. ``--compare`` prints the change
+against an earlier report.
+
+    python -m benchmarks.load_test [--flows 2000] [--concurrency 32]
+        [--workers 1] [--email brevo|smtp] [--output report.json]
+        [--compare previous.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from email import message_from_bytes, policy
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import text
+
+from app.db.session import SessionLocal
+from benchmarks._fixtures import create_api_user
+from benchmarks.stub_servers import StubBrevoServer, StubSMTPServer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+CODE_PATTERN = re.compile(r'otp-code">\s*(\d{6})')
+
+# Cumulative counters of the database, diffed around the run
+DB_COUNTERS = (
+    "xact_commit",
+    "xact_rollback",
+    "tup_returned",
+    "tup_fetched",
+    "tup_inserted",
+    "tup_updated",
+    "tup_deleted",
+    "blks_read",
+    "blks_hit",
+)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Exact percentiles of ``samples`` (seconds), in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": at(0.50),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def extract_code(message: dict) -> Optional[str]:
+    # A Brevo payload, or the raw MIME message received by the SMTP stand-in
+    html = message.get("htmlContent")
+    if html is None:
+        parsed = message_from_bytes(message["content"], policy=policy.default)
+        html = parsed.get_body(("html",)).get_content()
+    match = CODE_PATTERN.search(html)
+    return match.group(1) if match else None
+
+
+def db_counters() -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT pg_stat_clear_snapshot()"))
+        row = db.execute(
+            text(
+                f"SELECT {', '.join(DB_COUNTERS)} FROM pg_stat_database"
+                " WHERE datname = current_database()"
+            )
+        ).one()
+        counters = dict(row._mapping)
+        try:
+            with db.begin_nested():
+                counters["statements"] = db.execute(
+                    text("SELECT COALESCE(SUM(calls), 0) FROM pg_stat_statements")
+                ).scalar()
+        except Exception:
+            pass
+        return {name: int(value) for name, value in counters.items()}
+    finally:
+        db.close()
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class AppServer:
+    """
+    The app served the production way, by gunicorn with gunicorn.conf.py, in a
+    subprocess with ``env`` on top of ours and ``workers`` worker processes.
+    """
+
+    def __init__(self, env: Dict[str, str], workers: int):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._env = {
+            **os.environ,
+            **env,
+            "PORT": str(self.port),
+            "WEB_CONCURRENCY": str(workers),
+        }
+        self._process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "AppServer":
+        self._process = subprocess.Popen(
+            [
+                sys.executable, "-m", "gunicorn",
+                "-c", "gunicorn.conf.py",
+                "--bind", f"127.0.0.1:{self.port}",
+                "--log-level", "warning",
+                "--access-logfile", os.devnull,
+                "app.main:app",
+            ],
+            cwd=BACKEND_DIR,
+            env=self._env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError("The app exited during startup")
+            try:
+                if httpx.get(self.url + "/", timeout=1).status_code == 200:
+                    return self
+            except httpx.TransportError:
+                pass
+            time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("The app did not start within 30s")
+
+    def __exit__(self, *exc) -> None:
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+
+
+class LoadRun:
+    def __init__(self, url: str, api_key: str, inbox, args):
+        self.url = url
+        self.api_key = api_key
+        self.inbox = inbox
+        self.args = args
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.delivery_lag: List[float] = []
+        self.flow_seconds: List[float] = []
+        self.failures: Counter = Counter()
+        self._next = 0
+        self._run_id = os.urandom(4).hex()
+        # wait_for blocks; one thread per virtual user
+        self._waiters = ThreadPoolExecutor(args.concurrency)
+
+    async def _post(self, client: httpx.AsyncClient, path: str, body: dict):
+        start = time.perf_counter()
+        response = await client.post(path, json=body)
+        self.latency[path].append(time.perf_counter() - start)
+        self.statuses[path][str(response.status_code)] += 1
+        return start, response
+
+    async def _flow(self, client: httpx.AsyncClient, n: int) -> None:
+        flow_start = time.perf_counter()
+        email = f"load-{self._run_id}-{n}@example.com"
+        sent_at, response = await self._post(client, "/api/otp/send", {"email": email})
+        if response.status_code != 200:
+            self.failures["send"] += 1
+            return
+
+        delivery = await asyncio.get_running_loop().run_in_executor(
+            self._waiters, self.inbox.wait_for, email, self.args.delivery_timeout
+        )
+        if delivery is None:
+            self.failures["delivery_timeout"] += 1
+            return
+        received_at, message = delivery
+        self.delivery_lag.append(received_at - sent_at)
+        code = extract_code(message)
+        if code is None:
+            self.failures["no_code"] += 1
+            return
+
+        _, response = await self._post(
+            client, "/api/otp/verify", {"email": email, "otp": code}
+        )
+        if response.status_code != 200:
+            self.failures["verify"] += 1
+            return
+        self.flow_seconds.append(time.perf_counter() - flow_start)
+
+    async def _user(self, client: httpx.AsyncClient) -> None:
+        while self._next < self.args.flows:
+            n = self._next
+            self._next += 1
+            try:
+                await self._flow(client, n)
+            except httpx.HTTPError as e:
+                self.failures[type(e).__name__] += 1
+
+    async def run(self) -> float:
+        limits = httpx.Limits(max_connections=self.args.concurrency)
+        async with httpx.AsyncClient(
+            base_url=self.url,
+            headers={"X-API-KEY": self.api_key},
+            limits=limits,
+            timeout=30,
+        ) as client:
+            start = time.perf_counter()
+            await asyncio.gather(
+                *(self._user(client) for _ in range(self.args.concurrency))
+            )
+            elapsed = time.perf_counter() - start
+        self._waiters.shutdown()
+        return elapsed
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> dict:
+    env = {
+        # Each flow uses a fresh recipient; only the API key bucket matters
+        "RATE_LIMIT_PER_MINUTE": str(args.rate_limit),
+        "RATE_LIMIT_BURST": str(args.rate_limit),
+    }
+    with ExitStack() as stack:
+        if args.email == "smtp":
+            inbox = stack.enter_context(StubSMTPServer())
+            env.update(
+                BREVO_API_KEY="",
+                SMTP_HOST=inbox.host,
+                SMTP_PORT=str(inbox.port),
+                SMTP_USER="load-test",
+                SMTP_PASSWORD="load-test",
+                SMTP_TLS="False",
+            )
+        else:
+            inbox = stack.enter_context(StubBrevoServer())
+            env.update(BREVO_API_KEY="load-test", BREVO_API_URL=inbox.url)
+
+        api_key = create_api_user().api_key
+        server = stack.enter_context(AppServer(env, args.workers))
+
+        before = db_counters()
+        load = LoadRun(server.url, api_key, inbox, args)
+        elapsed = asyncio.run(load.run())
+        # Backends report their counters at transaction end, with some delay
+        time.sleep(1.0)
+        after = db_counters()
+
+    flows = len(load.flow_seconds)
+    per_flow = {
+        name: (after[name] - before[name]) / max(1, flows)
+        for name in after
+        if name in before
+    }
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "config": {
+            "flows": args.flows,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "email": args.email,
+        },
+        "elapsed_seconds": elapsed,
+        "flows_completed": flows,
+        "failures": dict(load.failures),
+        "throughput_flows_per_second": flows / elapsed,
+        "flow_latency": percentiles(load.flow_seconds),
+        "endpoints": {
+            path: {
+                **percentiles(samples),
+                "statuses": dict(load.statuses[path]),
+                "requests_per_second": len(samples) / elapsed,
+            }
+            for path, samples in load.latency.items()
+        },
+        "delivery_lag": percentiles(load.delivery_lag),
+        "db_per_flow": per_flow,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{report['flows_completed']} flows in {report['elapsed_seconds']:.1f}s:"
+        f" {report['throughput_flows_per_second']:.1f} flows/s,"
+        f" failures {report['failures'] or 'none'}"
+    )
+    rows = [("flow", report["flow_latency"]), ("delivery lag", report["delivery_lag"])]
+    rows += list(report["endpoints"].items())
+    for label, stats in rows:
+        if stats:
+            print(
+                f"  {label:<18} p50 {stats['p50_ms']:>8.1f} ms"
+                f"  p95 {stats['p95_ms']:>8.1f} ms  p99 {stats['p99_ms']:>8.1f} ms"
+            )
+    db = report["db_per_flow"]
+    print(
+        "  db per flow       "
+        + ", ".join(f"{name} {db[name]:.1f}" for name in sorted(db))
+    )
+
+
+def print_comparison(report: dict, previous: dict) -> None:
+    print(f"Compared with {previous.get('revision')} ({previous['created_at']}):")
+
+    def change(label: str, new: float, old: float) -> None:
+        if old:
+            print(f"  {label:<32} {old:>10.1f} -> {new:>10.1f} ({new / old - 1:+.1%})")
+
+    change(
+        "flows/s",
+        report["throughput_flows_per_second"],
+        previous["throughput_flows_per_second"],
+    )
+    for path, stats in report["endpoints"].items():
+        old = previous["endpoints"].get(path)
+        if old:
+            change(f"{path} p95 ms", stats["p95_ms"], old["p95_ms"])
+    if report["delivery_lag"] and previous["delivery_lag"]:
+        change(
+            "delivery lag p95 ms",
+            report["delivery_lag"]["p95_ms"],
+            previous["delivery_lag"]["p95_ms"],
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flows", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--email", choices=("brevo", "smtp"), default="brevo")
+    parser.add_argument("--delivery-timeout", type=float, default=30.0)
+    parser.add_argument("--rate-limit", type=int, default=1_000_000)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    if args.compare:
+        print_comparison(report, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Throughput of POST /otp/send called once per recipient vs. POST /otp/send-batch.
+
+Needs a migrated database at DATABASE_URL. Email delivery is disabled for the
+run so only the API and database work is measured.
+
+    python -m benchmarks.otp_batch [--recipients 2000] [--batch-size 500]
+"""
+import argparse
+import logging
+import time
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from benchmarks._fixtures import create_api_user
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=settings.OTP_BATCH_MAX_SIZE)
+    args = parser.parse_args()
+
+    # No provider calls: only API + database work is measured
+    settings.BREVO_API_KEY = ""
+    settings.SMTP_USER = ""
+    settings.EMAIL_OUTBOX_ENABLED = False
+    logging.getLogger("app.core.email_utils").setLevel(logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    user = create_api_user()
+    headers = {"X-API-KEY": user.api_key}
+    emails = [f"recipient{i}@example.com" for i in range(args.recipients)]
+
+    with TestClient(app) as client:
+        start = time.perf_counter()
+        for email in emails:
+            client.post("/api/otp/send", json={"email": email}, headers=headers)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(0, len(emails), args.batch_size):
+            response = client.post(
+                "/api/otp/send-batch",
+                json={"emails": emails[i : i + args.batch_size]},
+                headers=headers,
+            )
+            response.raise_for_status()
+        batch = time.perf_counter() - start
+
+    print(f"/otp/send       {args.recipients / single:>10.0f} OTPs/s ({single:.2f}s)")
+    print(f"/otp/send-batch {args.recipients / batch:>10.0f} OTPs/s ({batch:.2f}s)")
+    print(f"speedup         {single / batch:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Per-call cost of OTP hashing: legacy bcrypt vs. the keyed HMAC scheme.
+
+    python -m benchmarks.otp_hashing
+"""
+import secrets
+
+from app.core import otp_hashing
+from benchmarks._timing import measure, print_row
+
+EMAIL = "bench@example.com"
+
+
+def main() -> None:
+    code = "".join(str(secrets.randbelow(10)) for _ in range(6))
+
+    for name, number in (("bcrypt", 20), ("hmac-sha256", 20000)):
+        hasher = otp_hashing.hashers[name]
+        stored = hasher.hash(EMAIL, code)
+        print_row(f"{name} hash", measure(lambda: hasher.hash(EMAIL, code), number))
+        print_row(
+            f"{name} verify",
+            measure(lambda: otp_hashing.verify_code(EMAIL, code, stored), number),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Send + verify cost of each OtpStore backend.
+
+Each iteration stores a fresh code and verifies it, committing after every
+step like the endpoints do. The database store needs a migrated database at
+DATABASE_URL; the redis store uses REDIS_URL when a server answers there and
+an in-process fakeredis otherwise (which measures the client and script, not
+the network).
+
+    python -m benchmarks.otp_store [--number 2000] [--concurrency 16]
+"""
+import argparse
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from app.core import otp_hashing, otp_store
+from app.core.config import settings
+from app.db.session import SessionLocal
+from benchmarks._timing import measure, print_row
+
+
+def redis_store() -> otp_store.RedisOtpStore:
+    store = otp_store.RedisOtpStore.from_url(settings.REDIS_URL)
+    try:
+        store._client.ping()
+        return store
+    except Exception:
+        import fakeredis
+
+        print(f"No Redis at {settings.REDIS_URL}, using fakeredis")
+        return otp_store.RedisOtpStore(fakeredis.FakeRedis(decode_responses=True))
+
+
+def roundtrip(store: otp_store.OtpStore) -> None:
+    email = f"store-{uuid.uuid4().hex[:12]}@example.com"
+    record = otp_store.OtpRecord(
+        email,
+        otp_hashing.hash_code(email, "123456"),
+        datetime.now(timezone.utc) + timedelta(minutes=5),
+    )
+    db = SessionLocal() if store.uses_db else None
+    try:
+        store.put(db, record)
+        if db is not None:
+            db.commit()
+        result = store.verify(db, email, "123456")
+        if db is not None:
+            db.commit()
+    finally:
+        if db is not None:
+            db.close()
+    assert result == otp_store.VerifyResult.VERIFIED, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    stores = [
+        otp_store.DatabaseOtpStore(),
+        otp_store.MemoryOtpStore(settings.OTP_STORE_MEMORY_MAX_SIZE),
+        redis_store(),
+    ]
+    for store in stores:
+        result = measure(lambda: roundtrip(store), args.number)
+        print_row(f"{store.name} send+verify", result)
+
+    for store in stores:
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            start = time.perf_counter()
+            list(pool.map(lambda _: roundtrip(store), range(args.number)))
+            elapsed = time.perf_counter() - start
+        print(
+            f"{store.name + f' x{args.concurrency} threads':<32}"
+            f" {args.number / elapsed:>12.0f} send+verify/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+OTP verification under concurrency: the old read-check-commit sequence vs.
+the single UPDATE ... RETURNING statement of the database OTP store.
+
+Seeds ``--rows`` otps rows into the database at DATABASE_URL (point it at a
+scratch database), then verifies ``--codes`` fresh codes from ``--concurrency``
+threads, two wrong guesses and one right guess each. It also fires a burst of
+wrong guesses at a single code to count how many slip past the attempt limit.
+
+    python -m benchmarks.otp_verify [--rows 200000] [--codes 500] [--concurrency 16]
+"""
+import argparse
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import insert, text
+
+from app.api.endpoints import otp
+from app.core import otp_hashing, otp_store, usage
+from app.db import models
+from app.db.session import SessionLocal
+from benchmarks._fixtures import create_api_user
+
+
+def legacy_verify(db, user_id: str, email: str, code: str) -> None:
+    """The pre-CTE implementation: SELECT, checks in Python, then UPDATE."""
+    otp_obj = (
+        db.query(models.OTP)
+        .filter(models.OTP.email == email, models.OTP.is_verified.is_(False))
+        .order_by(models.OTP.created_at.desc())
+        .first()
+    )
+    if not otp_obj:
+        raise HTTPException(status_code=400, detail="No active OTP found")
+    if otp_obj.attempts >= 5:
+        raise HTTPException(status_code=400, detail="Too many attempts")
+    if datetime.now(timezone.utc) > otp_obj.expires_at:
+        raise HTTPException(status_code=400, detail="OTP expired")
+    if not otp_hashing.verify_code(email, code, otp_obj.otp_hash):
+        otp_obj.attempts += 1
+        usage.log_usage(db, user_id, "/api/otp/verify", "failed")
+        db.commit()
+        raise HTTPException(status_code=400, detail="Invalid OTP")
+    otp_obj.is_verified = True
+    usage.log_usage(db, user_id, "/api/otp/verify", "success")
+    db.commit()
+
+
+def atomic_verify(db, user_id: str, email: str, code: str) -> None:
+    """What POST /otp/verify does with the database store."""
+    result = otp_store.DatabaseOtpStore().verify(db, email, code)
+    if result in otp._REFUSED:
+        raise HTTPException(status_code=400, detail=otp._REFUSED[result])
+    verified = result == otp_store.VerifyResult.VERIFIED
+    otp._log_verify(db, user_id, verified)
+    if not verified:
+        raise HTTPException(status_code=400, detail="Invalid OTP")
+
+
+def seed(rows: int) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(
+            text(
+                """
+                INSERT INTO otps (id, email, otp_hash, expires_at, attempts,
+                                  created_at, is_verified)
+                SELECT md5(random()::text || g),
+                       'seed' || (g % (:rows / 3 + 1)) || '@example.com',
+                       '$otp-hmac-sha256$v1$' || md5(g::text),
+                       now() - interval '1 hour',
+                       0,
+                       now() - (random() * interval '1 day'),
+                       g % 4 = 0
+                FROM generate_series(1, :rows) AS g
+                """
+            ),
+            {"rows": rows},
+        )
+        db.commit()
+        db.execute(text("ANALYZE otps"))
+    finally:
+        db.close()
+
+
+def create_codes(count: int) -> list:
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=5)
+    codes = [
+        (f"verify-{uuid.uuid4().hex[:12]}@example.com", "123456") for _ in range(count)
+    ]
+    db = SessionLocal()
+    try:
+        db.execute(
+            insert(models.OTP),
+            [
+                {
+                    "email": email,
+                    "otp_hash": otp_hashing.hash_code(email, code),
+                    "expires_at": expires_at,
+                    "attempts": 0,
+                    "is_verified": False,
+                }
+                for email, code in codes
+            ],
+        )
+        db.commit()
+    finally:
+        db.close()
+    return codes
+
+
+def call(verify, user_id: str, email: str, code: str) -> tuple:
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        verify(db, user_id, email, code)
+        ok = True
+    except HTTPException as e:
+        db.rollback()
+        ok = e.detail == "Invalid OTP"
+    finally:
+        db.close()
+    return (time.perf_counter() - start) * 1000, ok
+
+
+def run(label: str, verify, user_id: str, args) -> None:
+    codes = create_codes(args.codes)
+    attempts = [
+        (email, guess) for email, code in codes for guess in ("000000", "999999", code)
+    ]
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda a: call(verify, user_id, *a), attempts))
+        elapsed = time.perf_counter() - start
+
+        # Wrong guesses that were judged (rather than refused) for one code
+        (email, _), = create_codes(1)
+        burst = list(
+            pool.map(
+                lambda i: call(verify, user_id, email, f"{i:06d}"),
+                range(1, args.concurrency * 2 + 1),
+            )
+        )
+
+    latencies = sorted(ms for ms, _ in results)
+    print(
+        f"{label:<8} {len(attempts) / elapsed:>8.0f} verifies/s"
+        f"  p50 {statistics.median(latencies):>6.1f} ms"
+        f"  p99 {latencies[int(len(latencies) * 0.99)]:>6.1f} ms"
+        f"  guesses judged on one code: {sum(ok for _, ok in burst)} (limit 5)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--codes", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    user_id = create_api_user().id
+    print(f"Seeding {args.rows} otps rows...")
+    seed(args.rows)
+    run("legacy", legacy_verify, user_id, args)
+    run("atomic", atomic_verify, user_id, args)
+
+
+if __name__ == "__main__":
+    main()
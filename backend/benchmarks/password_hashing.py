@@ -0,0 +1,127 @@
+"""
+How a login storm affects the OTP API on the same server.
+
+Starts the app under uvicorn (one worker, stub Brevo server for email) once
+per ``--hash-workers`` value, then runs ``--logins`` concurrent login loops
+for ``--seconds`` while a single client sends OTPs back to back. Reports
+login throughput, how many logins were turned away with 503 once the
+hashing queue was full, and the OTP send latency during the storm next to
+the same latency with no storm. ``0`` hash workers runs bcrypt on threads,
+the closest setting to hashing on the shared threadpool.
+
+    python -m benchmarks.password_hashing [--hash-workers 0,2]
+        [--logins 32] [--seconds 10] [--max-queue 16]
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List
+
+import httpx
+
+from benchmarks._fixtures import create_api_user
+from benchmarks.load_test import AppServer, percentiles
+from benchmarks.stub_servers import StubBrevoServer
+
+PASSWORD = "benchmark-password"
+
+
+async def send_otps(
+    client: httpx.AsyncClient, api_key: str, stop: asyncio.Event
+) -> List[float]:
+    samples = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.post(
+            "/api/otp/send",
+            json={"email": f"probe-{uuid.uuid4().hex[:12]}@example.com"},
+            headers={"X-API-KEY": api_key},
+        )
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def login_loop(
+    client: httpx.AsyncClient, email: str, stop: asyncio.Event, statuses: Counter
+) -> None:
+    while not stop.is_set():
+        response = await client.post(
+            "/api/auth/login", data={"username": email, "password": PASSWORD}
+        )
+        statuses[response.status_code] += 1
+        if response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+
+async def measure(url: str, api_key: str, email: str, args) -> Dict[str, object]:
+    limits = httpx.Limits(max_connections=args.logins + 4)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        stop = asyncio.Event()
+        probe = asyncio.create_task(send_otps(client, api_key, stop))
+        await asyncio.sleep(args.seconds / 2)
+        stop.set()
+        quiet = await probe
+
+        stop = asyncio.Event()
+        statuses: Counter = Counter()
+        storm = [
+            asyncio.create_task(login_loop(client, email, stop, statuses))
+            for _ in range(args.logins)
+        ]
+        probe = asyncio.create_task(send_otps(client, api_key, stop))
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        during = await probe
+        await asyncio.gather(*storm)
+
+    return {
+        "logins_per_second": statuses[200] / args.seconds,
+        "login_statuses": dict(statuses),
+        "otp_send_quiet": percentiles(quiet),
+        "otp_send_storm": percentiles(during),
+    }
+
+
+def print_result(workers: int, result: Dict[str, object]) -> None:
+    quiet, storm = result["otp_send_quiet"], result["otp_send_storm"]
+    print(
+        f"hash workers {workers}: {result['logins_per_second']:.1f} logins/s,"
+        f" statuses {result['login_statuses']}"
+    )
+    for label, stats in (("quiet", quiet), ("storm", storm)):
+        print(
+            f"  otp send ({label}) p50 {stats['p50_ms']:8.1f} ms"
+            f"   p95 {stats['p95_ms']:8.1f} ms   p99 {stats['p99_ms']:8.1f} ms"
+            f"   ({stats['count']} requests)"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hash-workers", default="0,2")
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--max-queue", type=int, default=16)
+    args = parser.parse_args()
+
+    user = create_api_user(PASSWORD)
+    for workers in (int(value) for value in args.hash_workers.split(",")):
+        with StubBrevoServer() as inbox:
+            env = {
+                "BREVO_API_KEY": "benchmark",
+                "BREVO_API_URL": inbox.url,
+                "RATE_LIMIT_PER_MINUTE": "100000",
+                "RATE_LIMIT_BURST": "100000",
+                "PASSWORD_HASH_WORKERS": str(workers),
+                "PASSWORD_HASH_MAX_QUEUE": str(args.max_queue),
+            }
+            with AppServer(env, workers=1) as server:
+                result = asyncio.run(measure(server.url, user.api_key, user.email, args))
+        print_result(workers, result)
+
+
+if __name__ == "__main__":
+    main()
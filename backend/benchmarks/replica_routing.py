@@ -0,0 +1,159 @@
+"""
+Read-replica routing, against two local PostgreSQL instances: the primary at
+DATABASE_URL and a streaming standby of it at DATABASE_REPLICA_URL (for
+example ``pg_basebackup -R`` of the primary, started on another port).
+
+1. Lag fallback (``--skip-lag-check`` to leave out): pauses WAL replay on
+   the standby (needs a superuser there), writes on the primary, and checks
+   that ReplicaRouter sends reads back to the primary once the lag exceeds
+   ``--max-lag``, then returns to the replica after replay resumes. Exits 1
+   if it doesn't.
+2. Load: one client sends OTPs back to back while ``--pollers`` clients poll
+   /dashboard/stats and /dashboard/logs, once with dashboard reads on the
+   replica and once with them kept on the primary; reports OTP send
+   latency and dashboard throughput for both.
+
+    python -m benchmarks.replica_routing [--pollers 16] [--seconds 10]
+        [--max-lag 1]
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from typing import Dict
+
+import httpx
+from sqlalchemy import text
+
+from app.db.session import ReplicaRouter, engine, replica_engine
+from benchmarks._fixtures import create_api_user
+from benchmarks.load_test import AppServer, percentiles
+from benchmarks.stub_servers import StubBrevoServer
+
+PASSWORD = "benchmark-password"
+
+
+def _wait_for(router: ReplicaRouter, healthy: bool, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        router.check()
+        if router.healthy == healthy:
+            return True
+        # Keep the primary producing WAL, or a paused standby looks caught up
+        with engine.begin() as connection:
+            connection.execute(text("SELECT txid_current()"))
+        time.sleep(0.2)
+    return False
+
+
+def lag_check(max_lag: float) -> bool:
+    router = ReplicaRouter(max_lag=max_lag)
+    if not _wait_for(router, True, 10):
+        print(f"replica not usable to begin with (lag: {router.lag})")
+        return False
+    print(f"replica in use, lag {router.lag:.2f}s")
+
+    with replica_engine.connect() as connection:
+        connection.execute(text("SELECT pg_wal_replay_pause()"))
+    try:
+        fell_back = _wait_for(router, False, max_lag + 10)
+        print(
+            f"replay paused: {'fell back to the primary' if fell_back else 'FAILED'}"
+            f" (lag: {router.lag})"
+        )
+    finally:
+        with replica_engine.connect() as connection:
+            connection.execute(text("SELECT pg_wal_replay_resume()"))
+    recovered = _wait_for(router, True, 10)
+    print(f"replay resumed: {'back on the replica' if recovered else 'FAILED'}")
+    return fell_back and recovered
+
+
+async def send_otps(client: httpx.AsyncClient, api_key: str, stop: asyncio.Event):
+    samples = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.post(
+            "/api/otp/send",
+            json={"email": f"probe-{uuid.uuid4().hex[:12]}@example.com"},
+            headers={"X-API-KEY": api_key},
+        )
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def poll_dashboard(client: httpx.AsyncClient, headers: dict, stop, counts):
+    while not stop.is_set():
+        for path in ("/api/dashboard/stats", "/api/dashboard/logs?limit=50"):
+            response = await client.get(path, headers=headers)
+            response.raise_for_status()
+            counts[path] = counts.get(path, 0) + 1
+
+
+async def measure(url: str, user, args) -> Dict[str, object]:
+    limits = httpx.Limits(max_connections=args.pollers + 4)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        response = await client.post(
+            "/api/auth/login", data={"username": user.email, "password": PASSWORD}
+        )
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        stop, counts = asyncio.Event(), {}
+        pollers = [
+            asyncio.create_task(poll_dashboard(client, headers, stop, counts))
+            for _ in range(args.pollers)
+        ]
+        probe = asyncio.create_task(send_otps(client, user.api_key, stop))
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        samples = await probe
+        await asyncio.gather(*pollers)
+    return {
+        "otp_send": percentiles(samples),
+        "dashboard_per_second": sum(counts.values()) / args.seconds,
+    }
+
+
+def load(args) -> None:
+    user = create_api_user(PASSWORD)
+    # A negative lag limit keeps the router on the primary, with the rest of
+    # the setup (replica checks included) unchanged
+    for label, max_lag in (("replica", args.max_lag), ("primary", -1)):
+        with StubBrevoServer() as inbox:
+            env = {
+                "BREVO_API_KEY": "benchmark",
+                "BREVO_API_URL": inbox.url,
+                "RATE_LIMIT_PER_MINUTE": "100000",
+                "RATE_LIMIT_BURST": "100000",
+                "DB_REPLICA_MAX_LAG_SECONDS": str(max_lag),
+            }
+            with AppServer(env, workers=1) as server:
+                result = asyncio.run(measure(server.url, user, args))
+        otp = result["otp_send"]
+        print(
+            f"dashboards on the {label:<8} {result['dashboard_per_second']:7.1f} reads/s"
+            f"   otp send p50 {otp['p50_ms']:7.1f} ms   p95 {otp['p95_ms']:7.1f} ms"
+            f"   p99 {otp['p99_ms']:7.1f} ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pollers", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--max-lag", type=float, default=1.0)
+    parser.add_argument("--skip-lag-check", action="store_true")
+    args = parser.parse_args()
+
+    if replica_engine is None:
+        sys.exit("Set DATABASE_REPLICA_URL to a streaming standby of DATABASE_URL")
+    if not args.skip_lag_check and not lag_check(args.max_lag):
+        sys.exit(1)
+    load(args)
+
+
+if __name__ == "__main__":
+    main()
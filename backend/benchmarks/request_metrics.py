@@ -0,0 +1,91 @@
+"""
+Per-request cost of TimingMiddleware: a trivial FastAPI route called straight
+through ASGI (no server, no network), with and without the middleware, plus
+the cost of recording one observation and of computing a user's percentiles.
+
+    python -m benchmarks.request_metrics [--requests 20000]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from fastapi import FastAPI
+
+from app.core import metrics
+from benchmarks._timing import measure, print_row
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping/{item}")
+    async def ping(item: str):
+        return {"item": item}
+
+    return app
+
+
+async def drive(app, requests: int) -> float:
+    """Mean microseconds per request through ``app``."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/ping/1",
+        "raw_path": b"/ping/1",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(500):
+        await app(dict(scope), receive, send)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    app = build_app()
+    registry = metrics.LatencyMetrics(max_users=10000)
+    timed = metrics.TimingMiddleware(app, registry)
+    # Interleave runs so drift affects both sides alike
+    plain_runs, timed_runs = [], []
+    for _ in range(3):
+        plain_runs.append(asyncio.run(drive(app, args.requests)))
+        timed_runs.append(asyncio.run(drive(timed, args.requests)))
+    plain, with_metrics = min(plain_runs), min(timed_runs)
+    print(f"{'route, no middleware':<32} {plain:>12.1f} us/request")
+    print(f"{'route, TimingMiddleware':<32} {with_metrics:>12.1f} us/request")
+    print(f"{'overhead':<32} {with_metrics - plain:>12.1f} us/request")
+
+    samples = [random.lognormvariate(-4, 1) for _ in range(1000)]
+    it = iter(samples * 1000)
+    print_row(
+        "observe()",
+        measure(
+            lambda: registry.observe("POST", "/api/otp/send", 200, next(it), "u1"),
+            100_000,
+        ),
+    )
+    print_row("user_summary()", measure(lambda: registry.user_summary("u1"), 10_000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+SMTP account selection under concurrency.
+
+Replaces the rows of ``smtp_configs`` in the database at DATABASE_URL (point it
+at a scratch database) with ``--accounts`` accounts of weight 1..3, then takes
+``--reservations`` quota units from ``--concurrency`` threads, as concurrent
+senders would. Reports reservations per second, how the traffic split against
+the weights, and whether any account went past its daily_limit.
+
+    python -m benchmarks.smtp_balancer [--accounts 10] [--reservations 5000]
+"""
+import argparse
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from app.core import smtp_balancer
+from app.db.session import SessionLocal
+
+
+def seed(accounts: int, daily_limit: int) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(text("DELETE FROM smtp_configs"))
+        db.execute(
+            text(
+                "INSERT INTO smtp_configs (id, smtp_email, smtp_host, smtp_port,"
+                " smtp_password, daily_limit, used_today, weight, last_reset)"
+                " VALUES (:id, :email, 'localhost', 587, 'x', :limit, 0, :weight,"
+                " now())"
+            ),
+            [
+                {
+                    "id": f"bench-{i}",
+                    "email": f"bench{i}@example.com",
+                    "limit": daily_limit,
+                    "weight": i % 3 + 1,
+                }
+                for i in range(accounts)
+            ],
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def used_today() -> dict:
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            text("SELECT id, weight, used_today, daily_limit FROM smtp_configs")
+        ).all()
+        return {row.id: row for row in rows}
+    finally:
+        db.close()
+
+
+def run(label: str, args, daily_limit: int) -> None:
+    seed(args.accounts, daily_limit)
+
+    def take(_):
+        reservation = smtp_balancer.reserve()
+        return reservation.id if reservation else None
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        start = time.perf_counter()
+        picked = Counter(pool.map(take, range(args.reservations)))
+        elapsed = time.perf_counter() - start
+
+    rows = used_today()
+    total_weight = sum(row.weight for row in rows.values())
+    over = sum(1 for row in rows.values() if row.used_today > row.daily_limit)
+    print(
+        f"{label:<12} {args.reservations / elapsed:>8.0f} reservations/s"
+        f" {picked.pop(None, 0):>6} refused {over:>3} accounts over limit"
+    )
+    for weight in sorted({row.weight for row in rows.values()}):
+        sent = sum(row.used_today for row in rows.values() if row.weight == weight)
+        expected = weight * sum(
+            1 for row in rows.values() if row.weight == weight
+        ) / total_weight
+        print(
+            f"  weight {weight}: {sent / max(1, sum(picked.values())):.1%}"
+            f" of traffic (weights say {expected:.1%})"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--reservations", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    run("spare quota", args, daily_limit=args.reservations)
+    # Less quota than demand: every account must stop exactly at its limit
+    run("exhausted", args, daily_limit=args.reservations // args.accounts // 2)
+
+    db = SessionLocal()
+    db.execute(text("DELETE FROM smtp_configs WHERE id LIKE 'bench-%'"))
+    db.commit()
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
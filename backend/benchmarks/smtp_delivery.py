@@ -0,0 +1,62 @@
+"""
+SMTP delivery throughput: a new SMTP session per email (the old behaviour)
+vs. the pooled connections in app.core.smtp_pool, against a local aiosmtpd
+sink (``pip install aiosmtpd``). The sink has no TLS or AUTH, so the real
+gap against a provider is larger than measured here.
+
+    python -m benchmarks.smtp_delivery [--emails 1000] [--threads 8]
+"""
+import argparse
+import logging
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import email_utils, smtp_pool
+from benchmarks.stub_servers import StubSMTPServer
+
+
+def message(i: int):
+    return email_utils._smtp_message(
+        f"user{i}@example.com", "Bench", "<p>123456</p>", "123456"
+    )
+
+
+def run(label: str, send, emails: int, threads: int, server: StubSMTPServer) -> None:
+    connections = server.connections
+    with ThreadPoolExecutor(threads) as pool:
+        start = time.perf_counter()
+        list(pool.map(send, range(emails)))
+        elapsed = time.perf_counter() - start
+    print(
+        f"{label:<24} {emails / elapsed:>8.0f} emails/s"
+        f" {server.connections - connections:>6} SMTP sessions"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--max-messages", type=int, default=100)
+    args = parser.parse_args()
+    logging.getLogger("mail.log").setLevel(logging.ERROR)
+
+    with StubSMTPServer() as server:
+        account = smtp_pool.SmtpAccount(server.host, server.port, use_tls=False)
+
+        def per_message(i: int) -> None:
+            with smtplib.SMTP(account.host, account.port, timeout=10) as smtp:
+                smtp.send_message(message(i))
+
+        pool = smtp_pool.SMTPPool(
+            account, size=args.pool_size, max_messages=args.max_messages
+        )
+        run("session per email", per_message, args.emails, args.threads, server)
+        run("pooled", lambda i: pool.send(message(i)), args.emails, args.threads, server)
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
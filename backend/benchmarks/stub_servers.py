@@ -0,0 +1,146 @@
+"""Local stand-ins for external email providers, used by the benchmarks."""
+import json
+import socket
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+
+class _Inbox:
+    """Latest delivery per recipient, with its arrival time (perf_counter)."""
+
+    def __init__(self):
+        self._deliveries: Dict[str, Tuple[float, object]] = {}
+        self._arrived = threading.Condition()
+
+    def deliver(self, recipient: str, message: object) -> None:
+        with self._arrived:
+            self._deliveries[recipient.lower()] = (time.perf_counter(), message)
+            self._arrived.notify_all()
+
+    def wait_for(
+        self, recipient: str, timeout: float
+    ) -> Optional[Tuple[float, object]]:
+        """Pop the delivery for ``recipient``, waiting up to ``timeout`` seconds."""
+        recipient = recipient.lower()
+        with self._arrived:
+            self._arrived.wait_for(lambda: recipient in self._deliveries, timeout)
+            return self._deliveries.pop(recipient, None)
+
+
+class StubBrevoServer(_Inbox):
+    """
+    Minimal HTTP/1.1 server that accepts Brevo ``/v3/smtp/email`` calls.
+
+    Counts accepted TCP connections and keeps the received payloads so callers
+    can check connection reuse and pull OTP codes out of delivered emails.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__()
+        stub = self
+        self.connections = 0
+        self.messages: List[dict] = []
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("content-length", 0)))
+                message = json.loads(body or b"{}")
+                with stub._lock:
+                    stub.messages.append(message)
+                for recipient in message.get("to", []):
+                    stub.deliver(recipient["email"], message)
+                reply = b'{"messageId": "stub"}'
+                self.send_response(201)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v3/smtp/email"
+
+    def __enter__(self) -> "StubBrevoServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class StubSMTPServer(_Inbox):
+    """
+    SMTP sink on aiosmtpd (``pip install aiosmtpd``), without TLS. AUTH
+    accepts any credentials.
+
+    Counts sessions and keeps every received message's envelope recipients
+    and raw body.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        from aiosmtpd.controller import Controller
+        from aiosmtpd.smtp import AuthResult
+
+        super().__init__()
+        stub = self
+        self.connections = 0
+        self.messages: List[dict] = []
+        self._lock = threading.Lock()
+        # Raised by aiosmtpd itself on every AUTH
+        warnings.filterwarnings("ignore", message="Session.login_data is deprecated")
+
+        class Handler:
+            async def handle_EHLO(self, server, session, envelope, hostname, responses):
+                session.host_name = hostname
+                with stub._lock:
+                    stub.connections += 1
+                return responses
+
+            async def handle_DATA(self, server, session, envelope):
+                message = {"to": envelope.rcpt_tos, "content": envelope.content}
+                with stub._lock:
+                    stub.messages.append(message)
+                for recipient in envelope.rcpt_tos:
+                    stub.deliver(recipient, message)
+                return "250 Message accepted for delivery"
+
+        if not port:
+            with socket.socket() as probe:
+                probe.bind((host, 0))
+                port = probe.getsockname()[1]
+        self.host, self.port = host, port
+        self._controller = Controller(
+            Handler(),
+            hostname=host,
+            port=port,
+            authenticator=lambda *args: AuthResult(success=True),
+            auth_require_tls=False,
+        )
+
+    def __enter__(self) -> "StubSMTPServer":
+        self._controller.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._controller.stop()
@@ -0,0 +1,81 @@
+"""
+Production serving: ``gunicorn -c gunicorn.conf.py app.main:app``.
+
+The master imports app.main once (preload_app) and forks WEB_CONCURRENCY
+uvicorn workers from it, so the import cost is paid once and the code pages
+are shared. Everything that holds sockets, threads or processes (database
+connections, email clients, the password hashing pool, background tasks) is
+opened per worker in the app's lifespan, which also warms it up before the
+worker accepts its first request.
+
+Per-process backends (OTP_STORE_BACKEND=memory, RATE_LIMIT_BACKEND=memory)
+don't survive being split over several workers: startup fails for the OTP
+store and warns for the rate limiter.
+"""
+import math
+import os
+
+from app.core.config import settings
+
+
+def _available_cpus() -> int:
+    """CPUs this process may use, including a container's CFS quota."""
+    cpus = len(os.sched_getaffinity(0))
+    try:
+        # cgroup v2, then v1
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = f.read().strip()
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = f.read().strip()
+        except OSError:
+            return cpus
+    if quota in ("max", "-1"):
+        return cpus
+    return max(1, min(cpus, math.ceil(int(quota) / int(period))))
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = settings.WEB_CONCURRENCY or _available_cpus()
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# Warmup runs inside the worker's boot, which the timeout also covers
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    if workers <= 1:
+        return
+    if settings.OTP_STORE_BACKEND == "memory":
+        raise RuntimeError(
+            f"OTP_STORE_BACKEND=memory with {workers} workers: codes stored by one "
+            "worker can't be verified by another. Use the database or redis "
+            "backend, or WEB_CONCURRENCY=1."
+        )
+    if settings.RATE_LIMIT_ENABLED and settings.RATE_LIMIT_BACKEND == "memory":
+        server.log.warning(
+            "RATE_LIMIT_BACKEND=memory with %d workers: every worker keeps its own "
+            "buckets, so the effective rate limits are %d times the configured "
+            "ones. Set RATE_LIMIT_BACKEND=redis to share them.",
+            workers,
+            workers,
+        )
+
+
+def post_fork(server, worker):
+    # Connections must never be shared across a fork. The master shouldn't
+    # have opened any, but drop whatever it may have without closing them
+    # (closing would also close the master's sockets).
+    from app.db import pool
+
+    for engine in pool.engines.values():
+        engine.dispose(close=False)
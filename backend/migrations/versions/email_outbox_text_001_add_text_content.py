@@ -0,0 +1,25 @@
+"""Add plain-text alternative to email_outbox
+
+Revision ID: email_outbox_text_001
+Revises: users_rate_limit_001
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "email_outbox_text_001"
+down_revision = "users_rate_limit_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("email_outbox", sa.Column("text_content", sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("email_outbox", "text_content")
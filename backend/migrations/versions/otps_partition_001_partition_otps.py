@@ -0,0 +1,127 @@
+"""Partition otps by created_at (when OTP_PARTITIONING_ENABLED)
+
+Converts otps into a table range-partitioned by day on created_at, so old
+codes are reclaimed by dropping whole partitions (see
+app.core.otp_maintenance). Only rows still inside the retention window are
+carried over. Deployments that leave OTP_PARTITIONING_ENABLED off keep the
+plain table and get an index on created_at for the batched DELETE sweeper.
+
+Revision ID: otps_partition_001
+Revises: usage_rollups_001
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from datetime import datetime, timedelta, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = "otps_partition_001"
+down_revision = "usage_rollups_001"
+branch_labels = None
+depends_on = None
+
+OTP_COLUMNS = "id, email, otp_hash, expires_at, attempts, created_at, is_verified"
+
+
+def _partition_sql(day):
+    name = f"otps_p{day:%Y%m%d}"
+    return (
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF otps "
+        f"FOR VALUES FROM ('{day:%Y-%m-%d}') TO ('{day + timedelta(days=1):%Y-%m-%d}')"
+    )
+
+
+def upgrade():
+    if not settings.OTP_PARTITIONING_ENABLED:
+        op.create_index("ix_otps_created_at", "otps", ["created_at"], unique=False)
+        return
+
+    op.execute("ALTER TABLE otps RENAME TO otps_unpartitioned")
+    op.execute("ALTER TABLE otps_unpartitioned RENAME CONSTRAINT otps_pkey TO otps_unpartitioned_pkey")
+    op.execute("ALTER INDEX ix_otps_email RENAME TO ix_otps_unpartitioned_email")
+    op.execute("ALTER INDEX ix_otps_id RENAME TO ix_otps_unpartitioned_id")
+
+    # The partition key has to be part of the primary key
+    op.execute(
+        """
+        CREATE TABLE otps (
+            id VARCHAR NOT NULL,
+            email VARCHAR NOT NULL,
+            otp_hash VARCHAR NOT NULL,
+            expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            attempts INTEGER,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            is_verified BOOLEAN,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.create_index("ix_otps_email", "otps", ["email"], unique=False)
+    op.create_index("ix_otps_id", "otps", ["id"], unique=False)
+    op.create_index("ix_otps_created_at", "otps", ["created_at"], unique=False)
+    # Safety net so inserts never fail if maintenance falls behind
+    op.execute("CREATE TABLE otps_default PARTITION OF otps DEFAULT")
+
+    today = datetime.now(timezone.utc).date()
+    first = today - timedelta(days=settings.OTP_RETENTION_DAYS)
+    last = today + timedelta(days=settings.OTP_PARTITION_PREMAKE_DAYS)
+    day = first
+    while day <= last:
+        op.execute(_partition_sql(day))
+        day += timedelta(days=1)
+
+    op.execute(
+        f"""
+        INSERT INTO otps ({OTP_COLUMNS})
+        SELECT id, email, otp_hash, expires_at, attempts,
+               COALESCE(created_at, now()), is_verified
+        FROM otps_unpartitioned
+        WHERE COALESCE(created_at, now()) >= '{first:%Y-%m-%d}'
+        """
+    )
+    op.execute("DROP TABLE otps_unpartitioned")
+
+
+def downgrade():
+    bind = op.get_bind()
+    partitioned = bind.execute(
+        sa.text(
+            "SELECT 1 FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'otps'"
+        )
+    ).scalar()
+    if not partitioned:
+        op.drop_index("ix_otps_created_at", table_name="otps")
+        return
+
+    op.execute("ALTER TABLE otps RENAME TO otps_partitioned")
+    op.execute("ALTER TABLE otps_partitioned RENAME CONSTRAINT otps_pkey TO otps_partitioned_pkey")
+    op.execute("ALTER INDEX ix_otps_email RENAME TO ix_otps_partitioned_email")
+    op.execute("ALTER INDEX ix_otps_id RENAME TO ix_otps_partitioned_id")
+    op.create_table(
+        "otps",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("otp_hash", sa.String(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column("is_verified", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_otps_email"), "otps", ["email"], unique=False)
+    op.create_index(op.f("ix_otps_id"), "otps", ["id"], unique=False)
+    op.execute(
+        f"INSERT INTO otps ({OTP_COLUMNS}) SELECT {OTP_COLUMNS} FROM otps_partitioned"
+    )
+    op.execute("DROP TABLE otps_partitioned CASCADE")
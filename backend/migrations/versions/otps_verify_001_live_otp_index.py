@@ -0,0 +1,61 @@
+"""Add partial covering index for OTP verification
+
+Revision ID: otps_verify_001
+Revises: otps_partition_001
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "otps_verify_001"
+down_revision = "otps_partition_001"
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = "ix_otps_email_created_at_live"
+
+
+def _is_partitioned():
+    return bool(
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT 1 FROM pg_partitioned_table p "
+                "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'otps'"
+            )
+        )
+        .scalar()
+    )
+
+
+def _create_index(concurrently):
+    op.create_index(
+        INDEX_NAME,
+        "otps",
+        ["email", sa.text("created_at DESC")],
+        unique=False,
+        postgresql_include=["otp_hash", "attempts", "expires_at"],
+        postgresql_where=sa.text("is_verified = false"),
+        postgresql_concurrently=concurrently,
+    )
+
+
+def upgrade():
+    # CONCURRENTLY is not supported on partitioned tables; there the index is
+    # built per partition, and partitions are small
+    if _is_partitioned():
+        _create_index(concurrently=False)
+        return
+    with op.get_context().autocommit_block():
+        _create_index(concurrently=True)
+
+
+def downgrade():
+    if _is_partitioned():
+        op.drop_index(INDEX_NAME, table_name="otps")
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index(INDEX_NAME, table_name="otps", postgresql_concurrently=True)
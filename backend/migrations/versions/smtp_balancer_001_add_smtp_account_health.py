@@ -0,0 +1,51 @@
+"""Add weight and health tracking to smtp_configs
+
+Revision ID: smtp_balancer_001
+Revises: email_outbox_text_001
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "smtp_balancer_001"
+down_revision = "email_outbox_text_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "smtp_configs",
+        sa.Column("weight", sa.Integer(), nullable=False, server_default="1"),
+    )
+    op.add_column(
+        "smtp_configs",
+        sa.Column("is_healthy", sa.Boolean(), nullable=False, server_default="true"),
+    )
+    op.add_column(
+        "smtp_configs",
+        sa.Column("unhealthy_until", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "smtp_configs",
+        sa.Column(
+            "consecutive_failures", sa.Integer(), nullable=False, server_default="0"
+        ),
+    )
+    op.add_column("smtp_configs", sa.Column("last_error", sa.Text(), nullable=True))
+    # The balancer does arithmetic on these, NULLs would exclude the account
+    op.execute("UPDATE smtp_configs SET used_today = 0 WHERE used_today IS NULL")
+    op.execute("UPDATE smtp_configs SET daily_limit = 100 WHERE daily_limit IS NULL")
+    op.execute("UPDATE smtp_configs SET last_reset = now() WHERE last_reset IS NULL")
+
+
+def downgrade():
+    op.drop_column("smtp_configs", "last_error")
+    op.drop_column("smtp_configs", "consecutive_failures")
+    op.drop_column("smtp_configs", "unhealthy_until")
+    op.drop_column("smtp_configs", "is_healthy")
+    op.drop_column("smtp_configs", "weight")
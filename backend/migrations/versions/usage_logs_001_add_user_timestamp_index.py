@@ -0,0 +1,37 @@
+"""Add (user_id, timestamp) index to usage_logs
+
+Revision ID: usage_logs_001
+Revises: email_outbox_001
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "usage_logs_001"
+down_revision = "email_outbox_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # usage_logs can be large; build the index without blocking writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_usage_logs_user_id_timestamp",
+            "usage_logs",
+            ["user_id", "timestamp"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_usage_logs_user_id_timestamp",
+            table_name="usage_logs",
+            postgresql_concurrently=True,
+        )
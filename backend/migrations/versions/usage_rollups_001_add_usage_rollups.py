@@ -0,0 +1,52 @@
+"""Add usage_rollups and backfill it from usage_logs
+
+Revision ID: usage_rollups_001
+Revises: usage_logs_001
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "usage_rollups_001"
+down_revision = "usage_logs_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "usage_rollups",
+        sa.Column("user_id", sa.String(), nullable=False),
+        sa.Column("granularity", sa.String(), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("endpoint", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("count", sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint(
+            "user_id", "granularity", "bucket_start", "endpoint", "status"
+        ),
+    )
+    # Backfill hourly and daily buckets (UTC) from the raw logs
+    for granularity in ("hour", "day"):
+        op.execute(
+            f"""
+            INSERT INTO usage_rollups
+                (user_id, granularity, bucket_start, endpoint, status, count)
+            SELECT user_id, '{granularity}',
+                   date_trunc('{granularity}', timestamp AT TIME ZONE 'UTC')
+                       AT TIME ZONE 'UTC',
+                   endpoint, status, count(*)
+            FROM usage_logs
+            WHERE user_id IS NOT NULL AND timestamp IS NOT NULL
+            GROUP BY 1, 2, 3, 4, 5
+            """
+        )
+
+
+def downgrade():
+    op.drop_table("usage_rollups")
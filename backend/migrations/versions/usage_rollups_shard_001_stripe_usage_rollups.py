@@ -0,0 +1,51 @@
+"""Stripe usage_rollups counters over a shard column
+
+Revision ID: usage_rollups_shard_001
+Revises: smtp_balancer_001
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "usage_rollups_shard_001"
+down_revision = "smtp_balancer_001"
+branch_labels = None
+depends_on = None
+
+COLUMNS = ["user_id", "granularity", "bucket_start", "endpoint", "status"]
+
+
+def upgrade():
+    # Existing counters become shard 0
+    op.add_column(
+        "usage_rollups",
+        sa.Column("shard", sa.SmallInteger(), nullable=False, server_default="0"),
+    )
+    op.drop_constraint("usage_rollups_pkey", "usage_rollups", type_="primary")
+    op.create_primary_key("usage_rollups_pkey", "usage_rollups", COLUMNS + ["shard"])
+
+
+def downgrade():
+    # Fold the stripes back into one row per bucket
+    op.execute(
+        f"""
+        CREATE TEMP TABLE usage_rollups_folded ON COMMIT DROP AS
+        SELECT {", ".join(COLUMNS)}, sum(count) AS count
+        FROM usage_rollups
+        GROUP BY {", ".join(COLUMNS)}
+        """
+    )
+    op.execute("DELETE FROM usage_rollups")
+    op.drop_constraint("usage_rollups_pkey", "usage_rollups", type_="primary")
+    op.drop_column("usage_rollups", "shard")
+    op.execute(
+        f"""
+        INSERT INTO usage_rollups ({", ".join(COLUMNS)}, count)
+        SELECT {", ".join(COLUMNS)}, count FROM usage_rollups_folded
+        """
+    )
+    op.create_primary_key("usage_rollups_pkey", "usage_rollups", COLUMNS)
@@ -0,0 +1,35 @@
+"""Add per-user rate limit overrides
+
+Revision ID: users_rate_limit_001
+Revises: otps_verify_001
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "users_rate_limit_001"
+down_revision = "otps_verify_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NULL means the RATE_LIMIT_* defaults apply
+    op.add_column(
+        "users", sa.Column("rate_limit_per_minute", sa.Integer(), nullable=True)
+    )
+    op.add_column("users", sa.Column("rate_limit_burst", sa.Integer(), nullable=True))
+    op.add_column(
+        "users",
+        sa.Column("recipient_rate_limit_per_hour", sa.Integer(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("users", "recipient_rate_limit_per_hour")
+    op.drop_column("users", "rate_limit_burst")
+    op.drop_column("users", "rate_limit_per_minute")
@@ -5,4 +5,5 @@ echo "Running database migrations..."
 alembic upgrade head
 
 echo "Starting application..."
-exec uvicorn app.main:app --host 0.0.0.0 --port ${PORT:-8000}
+# gunicorn.conf.py: WEB_CONCURRENCY uvicorn workers forked from a preloaded app
+exec gunicorn -c gunicorn.conf.py app.main:app
@@ -0,0 +1,103 @@
+import time
+import uuid
+
+import pytest
+
+from app.core.config import settings
+
+
+@pytest.fixture
+def override_settings(monkeypatch):
+    """Set attributes on the shared settings for the duration of a test."""
+
+    def override(**values):
+        for name, value in values.items():
+            monkeypatch.setattr(settings, name, value)
+
+    return override
+
+
+class FakeClock:
+    """
+    Stands in for time.time and time.monotonic: starts at the current time and
+    only moves when advanced.
+    """
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("time.time", clock)
+    monkeypatch.setattr("time.monotonic", clock)
+    return clock
+
+
+@pytest.fixture(scope="session")
+def client():
+    """The app behind a TestClient, against the database at DATABASE_URL."""
+    from fastapi.testclient import TestClient
+    from sqlalchemy import exc, text
+
+    from app.db import session
+    from app.main import app
+
+    try:
+        with session.engine.connect() as connection:
+            connection.execute(text("SELECT 1 FROM users LIMIT 1"))
+    except (exc.OperationalError, exc.ProgrammingError) as e:
+        pytest.skip(f"No migrated database at DATABASE_URL: {e}")
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def sent_emails(monkeypatch):
+    """Captures outgoing emails as {recipient: html_content} instead of sending."""
+    from app.core import email_utils
+
+    sent = {}
+
+    def send_email(recipient, subject, html_content, **kwargs):
+        sent[recipient] = html_content
+        return True
+
+    async def send_email_async(recipient, subject, html_content, **kwargs):
+        return send_email(recipient, subject, html_content)
+
+    monkeypatch.setattr(email_utils, "send_email", send_email)
+    monkeypatch.setattr(email_utils, "send_email_async", send_email_async)
+    return sent
+
+
+def _unique_email(prefix: str = "user") -> str:
+    return f"{prefix}-{uuid.uuid4().hex[:12]}@example.com"
+
+
+@pytest.fixture
+def unique_email():
+    """Makes addresses no other test or run has used, so buckets start full."""
+    return _unique_email
+
+
+@pytest.fixture
+def api_key(client, override_settings, sent_emails):
+    """
+    The API key of a freshly registered user. The outbox is off, so OTP emails
+    are sent straight away and land in sent_emails.
+    """
+    override_settings(EMAIL_OUTBOX_ENABLED=False)
+    response = client.post(
+        "/api/auth/register",
+        json={"email": _unique_email(), "password": "password123", "name": "Test"},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["api_key"]
@@ -0,0 +1,52 @@
+from app.core.cache import TTLCache
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=5)
+
+    clock.advance(10)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+
+    clock.advance(30)
+    assert cache.get("a") is None
+
+
+def test_per_entry_ttl_cannot_exceed_cache_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=30)
+    cache.set("a", 1, ttl=3600)
+
+    clock.advance(31)
+    assert cache.get("a") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_zero_ttl_disables_the_cache():
+    cache = TTLCache(maxsize=10, ttl=0)
+    cache.set("a", 1)
+
+    assert cache.get("a") is None
+
+
+def test_discard_where_and_stats():
+    cache = TTLCache(maxsize=10, ttl=30)
+    cache.set("a", {"sub": "1"})
+    cache.set("b", {"sub": "2"})
+
+    assert cache.discard_where(lambda _, value: value["sub"] == "1") == 1
+    assert cache.get("a") is None
+    assert cache.get("b") == {"sub": "2"}
+    assert cache.stats() == {"size": 1, "maxsize": 10, "hits": 1, "misses": 1}
@@ -0,0 +1,71 @@
+"""Auth cache invalidations reach every worker with the Redis backend."""
+import time
+
+import pytest
+
+from app.api import deps
+from app.core.cache import TTLCache
+from app.core.cache_invalidation import Invalidator, RedisInvalidator
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def _wait_until(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def workers():
+    """Two invalidators on one Redis server, each evicting its own cache."""
+    server = fakeredis.FakeServer()
+    workers = []
+    for _ in range(2):
+        invalidator = RedisInvalidator(fakeredis.FakeRedis(server=server))
+        cache = TTLCache(maxsize=10, ttl=60)
+        invalidator.register("api_key", lambda m, cache=cache: cache.pop(m["digest"]))
+        invalidator.start()
+        workers.append((invalidator, cache))
+    yield workers
+    for invalidator, _ in workers:
+        invalidator.close()
+
+
+def test_redis_invalidation_reaches_other_workers(workers):
+    (first, first_cache), (second, second_cache) = workers
+    for cache in (first_cache, second_cache):
+        cache.set("digest", "user")
+
+    first.publish("api_key", digest="digest")
+
+    assert first_cache.get("digest") is None
+    assert _wait_until(lambda: second_cache.get("digest") is None)
+    assert first.stats() == {"published": 1, "received": 0}
+    assert second.stats() == {"published": 0, "received": 1}
+
+
+def test_local_invalidation_evicts_this_process_only():
+    invalidator, cache = Invalidator(), TTLCache(maxsize=10, ttl=60)
+    invalidator.register("api_key", lambda m: cache.pop(m["digest"]))
+    cache.set("digest", "user")
+
+    invalidator.publish("api_key", digest="digest")
+
+    assert cache.get("digest") is None
+
+
+def test_invalidate_user_revokes_cached_tokens():
+    deps.current_user_cache.set("user-1", "snapshot")
+    deps.token_cache.set("token-1", {"sub": "user-1"})
+    deps.token_cache.set("token-2", {"sub": "user-2"})
+
+    deps.invalidate_user("user-1", revoke_tokens=True)
+
+    assert deps.current_user_cache.get("user-1") is None
+    assert deps.token_cache.get("token-1") is None
+    assert deps.token_cache.get("token-2") == {"sub": "user-2"}
+    deps.token_cache.clear()
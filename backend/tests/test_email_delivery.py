@@ -0,0 +1,69 @@
+"""Email is sent over shared, reused connections (Brevo client and SMTP pool)."""
+import asyncio
+
+import pytest
+
+from app.core import email_utils, smtp_pool
+from benchmarks.stub_servers import StubBrevoServer, StubSMTPServer
+
+EMAILS = 20
+
+
+@pytest.fixture
+def brevo(override_settings):
+    with StubBrevoServer() as stub:
+        override_settings(BREVO_API_KEY="test", BREVO_API_URL=stub.url)
+        yield stub
+
+
+def test_async_brevo_client_reuses_one_connection(brevo):
+    async def send_all():
+        await email_utils.open_http_client()
+        try:
+            return [
+                await email_utils.send_email_async(
+                    f"user{i}@example.com", "Code", "<p>1</p>"
+                )
+                for i in range(EMAILS)
+            ]
+        finally:
+            await email_utils.close_http_client()
+
+    assert all(asyncio.run(send_all()))
+    assert len(brevo.messages) == EMAILS
+    assert brevo.connections == 1
+
+
+def test_sync_brevo_client_reuses_one_connection(brevo):
+    try:
+        for i in range(EMAILS):
+            assert email_utils.send_email(f"user{i}@example.com", "Code", "<p>1</p>")
+    finally:
+        asyncio.run(email_utils.close_http_client())
+
+    assert len(brevo.messages) == EMAILS
+    assert brevo.connections == 1
+
+
+def test_smtp_pool_reuses_one_connection(override_settings):
+    pytest.importorskip("aiosmtpd")
+    with StubSMTPServer() as stub:
+        override_settings(
+            BREVO_API_KEY="",
+            SMTP_BALANCER_ENABLED=False,
+            SMTP_HOST=stub.host,
+            SMTP_PORT=stub.port,
+            SMTP_USER="user",
+            SMTP_PASSWORD="password",
+            SMTP_TLS=False,
+        )
+        try:
+            for i in range(EMAILS):
+                assert email_utils.send_email(f"user{i}@example.com", "Code", "<p>1</p>")
+            stats = smtp_pool.get_pool().stats()
+        finally:
+            smtp_pool.close_pools()
+
+    assert len(stub.messages) == EMAILS
+    assert stats["connections_opened"] == 1
+    assert stub.connections == 1
@@ -0,0 +1,55 @@
+"""Access to /metrics. TestClient requests come from the host "testclient"."""
+import os
+
+from starlette.requests import Request
+
+from app.api.endpoints import metrics
+from app.core import smtp_pool
+
+
+def test_metrics_refused_without_token(client, override_settings):
+    override_settings(METRICS_TOKEN="")
+
+    assert client.get("/metrics").status_code == 403
+    assert client.get(
+        "/metrics", headers={"Authorization": "Bearer "}
+    ).status_code == 403
+
+
+def test_metrics_with_token(client, override_settings):
+    override_settings(METRICS_TOKEN="scrape-secret")
+
+    assert client.get(
+        "/metrics", headers={"Authorization": "Bearer wrong"}
+    ).status_code == 403
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert "http_request_duration_seconds" in response.text
+    assert f'worker="{os.getpid()}"' in response.text
+
+
+def test_allowed_networks(override_settings):
+    override_settings(METRICS_ALLOWED_NETWORKS=["10.0.0.0/8", "::1"])
+
+    def request_from(host):
+        return Request({"type": "http", "client": (host, 50000) if host else None})
+
+    assert metrics._from_allowed_network(request_from("10.1.2.3"))
+    assert metrics._from_allowed_network(request_from("::1"))
+    assert not metrics._from_allowed_network(request_from("192.168.0.1"))
+    assert not metrics._from_allowed_network(request_from("testclient"))
+    assert not metrics._from_allowed_network(request_from(None))
+
+
+def test_smtp_accounts_are_labelled_opaquely():
+    account = smtp_pool.SmtpAccount(
+        host="smtp.example.com", port=587, username="sender@example.com"
+    )
+
+    assert account.label == smtp_pool.SmtpAccount(
+        host="smtp.example.com", port=587, username="sender@example.com"
+    ).label
+    assert "example" not in account.label
+    assert account.label != smtp_pool.SmtpAccount(
+        host="smtp.example.com", port=587, username="other@example.com"
+    ).label
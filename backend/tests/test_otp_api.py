@@ -0,0 +1,258 @@
+"""The OTP endpoints through the app, against the database at DATABASE_URL."""
+import re
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from app.api import deps
+from app.core import otp_store
+from app.db import models
+from app.db.session import SessionLocal
+
+
+def otp_code(sent_emails, email: str) -> str:
+    return re.search(r'otp-code">\s*(\d{6})', sent_emails[email]).group(1)
+
+
+def test_send_batch_reports_each_rejection(
+    client, api_key, sent_emails, override_settings, unique_email
+):
+    override_settings(RATE_LIMIT_RECIPIENT_BURST=1)
+    headers = {"X-API-KEY": api_key}
+    fresh, limited = unique_email("fresh"), unique_email("limited")
+    client.post("/api/otp/send", json={"email": limited}, headers=headers)
+    sent_emails.clear()
+
+    response = client.post(
+        "/api/otp/send-batch",
+        json={"emails": [fresh, "not-an-email", fresh, limited]},
+        headers=headers,
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [r["status"] for r in body["results"]] == [
+        "sent",
+        "invalid",
+        "duplicate",
+        "rate_limited",
+    ]
+    assert (body["sent"], body["failed"]) == (1, 3)
+    assert list(sent_emails) == [fresh]
+    response = client.post(
+        "/api/otp/verify",
+        json={"email": fresh, "otp": otp_code(sent_emails, fresh)},
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+
+def test_send_batch_queues_outbox_emails(
+    client, api_key, override_settings, unique_email
+):
+    override_settings(EMAIL_OUTBOX_ENABLED=True)
+    emails = [unique_email("outbox") for _ in range(3)]
+
+    response = client.post(
+        "/api/otp/send-batch", json={"emails": emails}, headers={"X-API-KEY": api_key}
+    )
+
+    assert response.json()["sent"] == 3
+    with SessionLocal() as db:
+        queued = db.scalars(
+            select(models.EmailOutbox).where(models.EmailOutbox.recipient.in_(emails))
+        ).all()
+        db.execute(
+            delete(models.EmailOutbox).where(models.EmailOutbox.recipient.in_(emails))
+        )
+        db.commit()
+    assert sorted(m.recipient for m in queued) == sorted(emails)
+    assert {m.status for m in queued} == {"pending"}
+    assert all(m.text_content for m in queued)
+
+
+def test_send_batch_over_api_key_limit(
+    client, api_key, override_settings, unique_email
+):
+    override_settings(RATE_LIMIT_PER_MINUTE=1, RATE_LIMIT_BURST=3)
+    headers = {"X-API-KEY": api_key}
+    emails = [unique_email("batch") for _ in range(2)]
+    assert client.post(
+        "/api/otp/send-batch", json={"emails": emails}, headers=headers
+    ).status_code == 200
+
+    response = client.post(
+        "/api/otp/send-batch", json={"emails": emails}, headers=headers
+    )
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_send_batch_too_large(
+    client, api_key, override_settings, unique_email
+):
+    override_settings(OTP_BATCH_MAX_SIZE=2)
+
+    response = client.post(
+        "/api/otp/send-batch",
+        json={"emails": [unique_email() for _ in range(3)]},
+        headers={"X-API-KEY": api_key},
+    )
+
+    assert response.status_code == 413
+
+
+def test_send_batch_empty(client, api_key):
+    response = client.post(
+        "/api/otp/send-batch", json={"emails": []}, headers={"X-API-KEY": api_key}
+    )
+
+    assert response.status_code == 400
+
+
+def _send(client, api_key, email):
+    response = client.post(
+        "/api/otp/send", json={"email": email}, headers={"X-API-KEY": api_key}
+    )
+    assert response.status_code == 200, response.text
+
+
+def _verify(client, api_key, email, otp):
+    return client.post(
+        "/api/otp/verify",
+        json={"email": email, "otp": otp},
+        headers={"X-API-KEY": api_key},
+    )
+
+
+def _wrong(code: str) -> str:
+    return "000000" if code != "000000" else "111111"
+
+
+def test_verify_once(client, api_key, sent_emails, unique_email):
+    email = unique_email()
+    _send(client, api_key, email)
+    code = otp_code(sent_emails, email)
+
+    assert _verify(client, api_key, email, _wrong(code)).json()["detail"] == (
+        "Invalid OTP"
+    )
+    assert _verify(client, api_key, email, code).status_code == 200
+    response = _verify(client, api_key, email, code)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "No active OTP found for this email"
+
+
+def test_verify_locks_after_max_attempts(
+    client, api_key, sent_emails, unique_email
+):
+    email = unique_email()
+    _send(client, api_key, email)
+    code = otp_code(sent_emails, email)
+
+    for _ in range(otp_store.MAX_VERIFY_ATTEMPTS):
+        assert _verify(client, api_key, email, _wrong(code)).status_code == 400
+
+    response = _verify(client, api_key, email, code)
+    assert response.json()["detail"] == "Too many attempts. Request a new OTP."
+
+
+def test_verify_expired(client, api_key, sent_emails, unique_email):
+    if not otp_store.store.uses_db:
+        pytest.skip("Expires the code through the otps table")
+    email = unique_email()
+    _send(client, api_key, email)
+    with SessionLocal() as db:
+        db.execute(
+            update(models.OTP)
+            .where(models.OTP.email == email)
+            .values(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        )
+        db.commit()
+
+    response = _verify(client, api_key, email, otp_code(sent_emails, email))
+    assert response.json()["detail"] == "OTP expired"
+
+
+def test_verify_legacy_bcrypt_code(
+    client, api_key, sent_emails, unique_email, override_settings
+):
+    if not otp_store.store.uses_db:
+        pytest.skip("Only the database store keeps codes across scheme changes")
+    email = unique_email()
+    override_settings(OTP_HASH_SCHEME="bcrypt")
+    _send(client, api_key, email)
+    override_settings(OTP_HASH_SCHEME="hmac-sha256")
+    code = otp_code(sent_emails, email)
+
+    assert _verify(client, api_key, email, _wrong(code)).status_code == 400
+    assert _verify(client, api_key, email, code).status_code == 200
+
+
+def test_send_over_recipient_limit(
+    client, api_key, override_settings, unique_email
+):
+    override_settings(RATE_LIMIT_RECIPIENT_BURST=1)
+    email = unique_email()
+    _send(client, api_key, email)
+
+    response = client.post(
+        "/api/otp/send", json={"email": email}, headers={"X-API-KEY": api_key}
+    )
+
+    assert response.status_code == 429
+    assert response.json()["detail"] == "Too many OTPs sent to this email"
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_send_over_api_key_limit(client, api_key, override_settings, unique_email):
+    override_settings(RATE_LIMIT_PER_MINUTE=1, RATE_LIMIT_BURST=1)
+    _send(client, api_key, unique_email())
+
+    response = client.post(
+        "/api/otp/send", json={"email": unique_email()}, headers={"X-API-KEY": api_key}
+    )
+
+    assert response.status_code == 429
+    assert response.json()["detail"] == "Rate limit exceeded for this API key"
+
+
+def test_zero_user_limit_blocks_sends(client, api_key, unique_email):
+    with SessionLocal() as db:
+        db.execute(
+            update(models.User)
+            .where(models.User.api_key == api_key)
+            .values(rate_limit_per_minute=0)
+        )
+        db.commit()
+    deps.invalidate_api_key(api_key)
+
+    response = client.post(
+        "/api/otp/send", json={"email": unique_email()}, headers={"X-API-KEY": api_key}
+    )
+
+    assert response.status_code == 429
+    assert "Retry-After" not in response.headers
+
+
+def test_rejected_recipients_are_refunded(
+    client, api_key, override_settings, unique_email
+):
+    override_settings(
+        RATE_LIMIT_PER_MINUTE=1, RATE_LIMIT_BURST=3, RATE_LIMIT_RECIPIENT_BURST=1
+    )
+    headers = {"X-API-KEY": api_key}
+    limited = unique_email("limited")
+    _send(client, api_key, limited)
+
+    response = client.post(
+        "/api/otp/send-batch",
+        json={"emails": [limited, unique_email()]},
+        headers=headers,
+    )
+    assert response.json()["sent"] == 1
+
+    # Without the refund the batch would have used up the last two tokens
+    _send(client, api_key, unique_email())
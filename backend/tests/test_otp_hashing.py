@@ -0,0 +1,37 @@
+from app.core import otp_hashing
+from app.core.otp_hashing import BcryptOtpHasher, HmacOtpHasher
+
+
+def test_hmac_hash_is_keyed_and_bound_to_the_email():
+    hasher = HmacOtpHasher("key")
+    otp_hash = hasher.hash("user@example.com", "123456")
+
+    assert otp_hash.startswith("$otp-hmac-sha256$v1$")
+    assert otp_hash == hasher.hash("user@example.com", "123456")
+    assert otp_hash != hasher.hash("other@example.com", "123456")
+    assert otp_hash != HmacOtpHasher("other key").hash("user@example.com", "123456")
+    assert hasher.verify("user@example.com", "123456", otp_hash)
+    assert not hasher.verify("user@example.com", "654321", otp_hash)
+
+
+def test_verify_code_picks_the_scheme_from_the_stored_hash():
+    hmac_hash = otp_hashing.hashers["hmac-sha256"].hash("user@example.com", "123456")
+    bcrypt_hash = BcryptOtpHasher().hash("user@example.com", "123456")
+
+    assert otp_hashing.verify_code("user@example.com", "123456", hmac_hash)
+    assert otp_hashing.verify_code("user@example.com", "123456", bcrypt_hash)
+    assert not otp_hashing.verify_code("user@example.com", "000000", bcrypt_hash)
+
+
+def test_unrecognized_hash_does_not_verify():
+    assert not otp_hashing.verify_code("user@example.com", "123456", "plaintext")
+
+
+def test_hash_code_uses_the_configured_scheme(override_settings):
+    override_settings(OTP_HASH_SCHEME="bcrypt")
+    assert otp_hashing.get_hasher(otp_hashing.hash_code("a@example.com", "1")).name == (
+        "bcrypt"
+    )
+
+    override_settings(OTP_HASH_SCHEME="hmac-sha256")
+    assert otp_hashing.hash_code("a@example.com", "1").startswith("$otp-hmac-sha256$")
@@ -0,0 +1,132 @@
+"""OTP partition maintenance against PostgreSQL at DATABASE_URL, in a scratch schema."""
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+
+import pytest
+import sqlalchemy
+from sqlalchemy import exc, text
+from sqlalchemy.pool import NullPool
+
+from app.core import otp_maintenance
+from app.core.config import settings
+
+SCHEMA = "test_otp_maintenance"
+
+
+@pytest.fixture
+def engine():
+    engine = sqlalchemy.create_engine(
+        str(settings.DATABASE_URL),
+        poolclass=NullPool,
+        connect_args={"options": f"-c search_path={SCHEMA}"},
+    )
+    try:
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    except exc.OperationalError as e:
+        pytest.skip(f"No database at DATABASE_URL: {e}")
+    yield engine
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    engine.dispose()
+
+
+@pytest.fixture
+def partitioned(engine):
+    """otps as left by the otps_partition_001 migration, with no day partitions."""
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                """
+                CREATE TABLE otps (
+                    id VARCHAR NOT NULL,
+                    email VARCHAR NOT NULL,
+                    otp_hash VARCHAR NOT NULL,
+                    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                    attempts INTEGER,
+                    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                    is_verified BOOLEAN,
+                    PRIMARY KEY (id, created_at)
+                ) PARTITION BY RANGE (created_at)
+                """
+            )
+        )
+        connection.execute(text("CREATE INDEX ix_otps_email ON otps (email)"))
+        connection.execute(text("CREATE TABLE otps_default PARTITION OF otps DEFAULT"))
+    return engine
+
+
+def _insert_otp(connection, created_at: datetime) -> None:
+    connection.execute(
+        text(
+            "INSERT INTO otps (id, email, otp_hash, expires_at, attempts, "
+            "created_at, is_verified) VALUES "
+            "(:id, 'user@example.com', 'hash', :created_at, 0, :created_at, false)"
+        ),
+        {"id": str(uuid.uuid4()), "created_at": created_at},
+    )
+
+
+def _rows_by_partition(connection):
+    return dict(
+        connection.execute(
+            text("SELECT tableoid::regclass::text, count(*) FROM otps GROUP BY 1")
+        ).all()
+    )
+
+
+def _at_noon(day: date) -> datetime:
+    return datetime.combine(day, time(12), timezone.utc)
+
+
+def test_rows_in_default_partition_are_moved_and_expired(partitioned):
+    today = datetime.now(timezone.utc).date()
+    tomorrow = today + timedelta(days=1)
+    expired = today - timedelta(days=settings.OTP_RETENTION_DAYS + 1)
+    with partitioned.begin() as connection:
+        connection.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+        _insert_otp(connection, _at_noon(tomorrow))
+        _insert_otp(connection, _at_noon(expired))
+
+    with partitioned.connect() as connection:
+        connection.execute(text("SET TIME ZONE 'UTC'"))
+        connection.commit()
+        report = otp_maintenance.run_maintenance(connection)
+
+    assert report.mode == "partitions"
+    assert otp_maintenance.partition_name(tomorrow) in report.partitions_created
+    assert report.rows_moved == 1
+    assert report.rows_reclaimed == 1
+    with partitioned.connect() as connection:
+        assert _rows_by_partition(connection) == {
+            otp_maintenance.partition_name(tomorrow): 1
+        }
+
+    # Later runs keep working and new rows go to the day's partition
+    with partitioned.begin() as connection:
+        _insert_otp(connection, _at_noon(tomorrow))
+    with partitioned.connect() as connection:
+        report = otp_maintenance.run_maintenance(connection)
+    assert not report.skipped
+    assert report.partitions_created == []
+
+
+def test_lock_is_released_on_the_same_connection(partitioned):
+    with partitioned.connect() as connection:
+        assert not otp_maintenance.run_maintenance(connection).skipped
+        held = connection.execute(
+            text(
+                "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' "
+                "AND objid = :key AND pid = pg_backend_pid()"
+            ),
+            {"key": otp_maintenance.ADVISORY_LOCK_KEY},
+        ).scalar()
+    assert held == 0
+
+    with partitioned.connect() as holder, partitioned.connect() as connection:
+        holder.execute(
+            text("SELECT pg_advisory_lock(:key)"),
+            {"key": otp_maintenance.ADVISORY_LOCK_KEY},
+        )
+        assert otp_maintenance.run_maintenance(connection).skipped
@@ -0,0 +1,112 @@
+"""The memory and Redis OTP stores (Redis through fakeredis)."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core import otp_hashing
+from app.core.otp_store import (
+    EXPIRED_GRACE_SECONDS,
+    MAX_VERIFY_ATTEMPTS,
+    MemoryOtpStore,
+    OtpRecord,
+    RedisOtpStore,
+    VerifyResult,
+)
+
+EMAIL = "user@example.com"
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request):
+    if request.param == "memory":
+        yield MemoryOtpStore(maxsize=100)
+        return
+    fakeredis = pytest.importorskip("fakeredis")
+    store = RedisOtpStore(fakeredis.FakeRedis(decode_responses=True))
+    yield store
+    store.close()
+
+
+def _record(code: str, expires_in: float = 300, email: str = EMAIL) -> OtpRecord:
+    return OtpRecord(
+        email=email,
+        otp_hash=otp_hashing.hash_code(email, code),
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=expires_in),
+    )
+
+
+def test_verify_once(store):
+    store.put(None, _record("123456"))
+
+    assert store.verify(None, EMAIL, "123456") == VerifyResult.VERIFIED
+    assert store.verify(None, EMAIL, "123456") == VerifyResult.NOT_FOUND
+
+
+def test_wrong_code_is_invalid(store):
+    store.put(None, _record("123456"))
+
+    assert store.verify(None, EMAIL, "000000") == VerifyResult.INVALID
+    assert store.verify(None, EMAIL, "123456") == VerifyResult.VERIFIED
+
+
+def test_unknown_email_is_not_found(store):
+    assert store.verify(None, "nobody@example.com", "123456") == VerifyResult.NOT_FOUND
+
+
+def test_newest_code_replaces_the_previous_one(store):
+    store.put(None, _record("111111"))
+    store.put(None, _record("222222"))
+
+    assert store.verify(None, EMAIL, "111111") == VerifyResult.INVALID
+    assert store.verify(None, EMAIL, "222222") == VerifyResult.VERIFIED
+
+
+def test_expired_code_is_reported_as_expired(store):
+    store.put(None, _record("123456", expires_in=-1))
+
+    assert store.verify(None, EMAIL, "123456") == VerifyResult.EXPIRED
+
+
+def test_attempt_limit(store):
+    store.put(None, _record("123456"))
+    for _ in range(MAX_VERIFY_ATTEMPTS):
+        assert store.verify(None, EMAIL, "000000") == VerifyResult.INVALID
+
+    assert store.verify(None, EMAIL, "123456") == VerifyResult.TOO_MANY_ATTEMPTS
+
+
+def test_put_many(store):
+    emails = [f"user{i}@example.com" for i in range(3)]
+    store.put_many(
+        None, [_record(str(i) * 6, email=email) for i, email in enumerate(emails)]
+    )
+
+    for i, email in enumerate(emails):
+        assert store.verify(None, email, str(i) * 6) == VerifyResult.VERIFIED
+
+
+def test_memory_entries_are_evicted_after_the_grace_period(clock):
+    store = MemoryOtpStore(maxsize=100)
+    store.put(None, _record("123456"))
+    assert len(store) == 1
+
+    clock.advance(300 + EXPIRED_GRACE_SECONDS + 1)
+    assert store.verify(None, EMAIL, "123456") == VerifyResult.NOT_FOUND
+    assert len(store) == 0
+
+
+def test_redis_keys_expire_after_the_grace_period():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    RedisOtpStore(client).put(None, _record("123456"))
+
+    ttl = client.ttl(RedisOtpStore.key_prefix + EMAIL)
+    assert 300 < ttl <= 300 + EXPIRED_GRACE_SECONDS + 1
+
+
+def test_redis_store_requires_a_deterministic_hash(override_settings):
+    fakeredis = pytest.importorskip("fakeredis")
+    override_settings(OTP_HASH_SCHEME="bcrypt")
+
+    with pytest.raises(ValueError):
+        RedisOtpStore(fakeredis.FakeRedis(decode_responses=True))
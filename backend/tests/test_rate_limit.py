@@ -0,0 +1,105 @@
+"""Token buckets of the memory and Redis rate limiters (Redis through fakeredis)."""
+import math
+
+import pytest
+
+from app.core import rate_limit
+from app.core.rate_limit import Limit, MemoryRateLimiter, RedisRateLimiter
+
+SCOPE = rate_limit.API_KEY_SCOPE
+
+
+@pytest.fixture(params=["memory", "redis"])
+def limiter(request, clock):
+    if request.param == "memory":
+        yield MemoryRateLimiter(maxsize=100)
+        return
+    fakeredis = pytest.importorskip("fakeredis")
+    limiter = RedisRateLimiter(fakeredis.FakeRedis(decode_responses=True))
+    yield limiter
+    limiter.close()
+
+
+def test_burst_then_wait_for_refill(limiter, clock):
+    limit = Limit(rate=1.0, burst=3)
+    assert [limiter.hit(SCOPE, "key", limit) for _ in range(3)] == [0.0] * 3
+
+    assert limiter.hit(SCOPE, "key", limit) == pytest.approx(1.0)
+
+    clock.advance(1.0)
+    assert limiter.hit(SCOPE, "key", limit) == 0.0
+
+
+def test_rejected_hits_take_no_tokens(limiter, clock):
+    limit = Limit(rate=0.5, burst=1)
+    assert limiter.hit(SCOPE, "key", limit) == 0.0
+    assert limiter.hit(SCOPE, "key", limit) == pytest.approx(2.0)
+
+    clock.advance(2.0)
+    assert limiter.hit(SCOPE, "key", limit) == 0.0
+
+
+def test_cost_counts_against_the_bucket(limiter):
+    limit = Limit(rate=1.0, burst=10)
+    assert limiter.hit(SCOPE, "key", limit, cost=8) == 0.0
+
+    assert limiter.hit(SCOPE, "key", limit, cost=5) == pytest.approx(3.0)
+    assert limiter.hit(SCOPE, "key", limit, cost=2) == 0.0
+
+
+def test_cost_above_burst_can_never_pass(limiter):
+    assert limiter.hit(SCOPE, "key", Limit(rate=1.0, burst=2), cost=3) == math.inf
+
+
+def test_keys_and_scopes_have_separate_buckets(limiter):
+    limit = Limit(rate=1.0, burst=1)
+    waits = limiter.hit_many(rate_limit.RECIPIENT_SCOPE, ["a", "b", "a"], limit)
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] > 0
+
+    assert limiter.hit(SCOPE, "a", limit) == 0.0
+
+
+def test_zero_rate_blocks_the_key(limiter):
+    assert limiter.hit(SCOPE, "key", Limit(rate=0.0, burst=10)) == math.inf
+
+
+def test_refund_returns_tokens_up_to_the_burst(limiter):
+    limit = Limit(rate=0.001, burst=3)
+    assert limiter.hit(SCOPE, "key", limit, cost=3) == 0.0
+
+    limiter.refund(SCOPE, "key", limit, cost=2)
+    assert limiter.hit(SCOPE, "key", limit, cost=2) == 0.0
+    assert limiter.hit(SCOPE, "key", limit) > 0
+
+    limiter.refund(SCOPE, "key", limit, cost=10)
+    assert limiter.hit(SCOPE, "key", limit, cost=3) == 0.0
+    assert limiter.hit(SCOPE, "key", limit) > 0
+
+
+def test_decisions_are_counted(limiter):
+    limit = Limit(rate=1.0, burst=1)
+    limiter.hit(SCOPE, "key", limit)
+    limiter.hit(SCOPE, "key", limit)
+
+    assert limiter.stats()[SCOPE] == {"allowed": 1, "rejected": 1}
+
+
+def test_user_overrides_replace_the_defaults(override_settings):
+    override_settings(
+        RATE_LIMIT_PER_MINUTE=60,
+        RATE_LIMIT_BURST=10,
+        RATE_LIMIT_RECIPIENT_PER_HOUR=36,
+    )
+
+    assert rate_limit.api_key_limit() == Limit(rate=1.0, burst=10)
+    assert rate_limit.api_key_limit(per_minute=120, burst=5) == Limit(rate=2.0, burst=5)
+    assert rate_limit.recipient_limit().rate == pytest.approx(0.01)
+    assert rate_limit.recipient_limit(per_hour=3600).rate == 1.0
+
+
+def test_zero_overrides_are_kept(override_settings):
+    override_settings(RATE_LIMIT_PER_MINUTE=60, RATE_LIMIT_BURST=10)
+
+    assert rate_limit.api_key_limit(per_minute=0, burst=0) == Limit(rate=0.0, burst=0)
+    assert rate_limit.recipient_limit(per_hour=0).rate == 0.0
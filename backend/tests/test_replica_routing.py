@@ -0,0 +1,92 @@
+"""
+Read-replica routing against a real standby. Runs only with
+DATABASE_REPLICA_URL set, pointing at a streaming replica of DATABASE_URL that
+the tests may pause replay on (pg_wal_replay_pause needs a superuser).
+"""
+import time
+
+import pytest
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db import session
+
+pytestmark = pytest.mark.skipif(
+    settings.DATABASE_REPLICA_URL is None, reason="DATABASE_REPLICA_URL is not set"
+)
+
+
+def _in_recovery(db) -> bool:
+    return db.execute(text("SELECT pg_is_in_recovery()")).scalar()
+
+
+def _write_on_primary() -> None:
+    # Assigning a transaction id makes the commit write WAL
+    with session.engine.begin() as connection:
+        connection.execute(text("SELECT txid_current()"))
+
+
+def _check_until(router, healthy: bool, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while router.check() is None or router.healthy != healthy:
+        assert time.monotonic() < deadline, f"lag stayed at {router.lag}"
+        time.sleep(0.1)
+
+
+@pytest.fixture
+def router(monkeypatch):
+    with session.replica_engine.connect() as connection:
+        if not _in_recovery(connection):
+            pytest.skip("DATABASE_REPLICA_URL is not a standby")
+    router = session.ReplicaRouter(max_lag=0.5)
+    monkeypatch.setattr(session, "replica_router", router)
+    yield router
+    with session.replica_engine.connect() as connection:
+        connection.execute(text("SELECT pg_wal_replay_resume()"))
+
+
+def test_reads_go_to_a_caught_up_replica(router):
+    _write_on_primary()
+    _check_until(router, healthy=True)
+
+    with session.read_session() as db:
+        assert _in_recovery(db)
+    assert router.replica_reads == 1
+
+
+def test_dashboard_reads_from_the_replica(client, router):
+    _check_until(router, healthy=True)
+    email = f"replica-{time.time_ns()}@example.com"
+    client.post(
+        "/api/auth/register",
+        json={"email": email, "password": "password123", "name": "Replica"},
+    )
+    token = client.post(
+        "/api/auth/login", data={"username": email, "password": "password123"}
+    ).json()["access_token"]
+
+    response = client.get(
+        "/api/dashboard/stats", headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 200
+    assert router.replica_reads == 1
+
+
+def test_falls_back_to_the_primary_when_replay_stops(router):
+    _check_until(router, healthy=True)
+    with session.replica_engine.connect() as connection:
+        connection.execute(text("SELECT pg_wal_replay_pause()"))
+
+    _write_on_primary()
+    router.check()
+    time.sleep(router.max_lag + 0.2)
+    _check_until(router, healthy=False)
+
+    with session.read_session() as db:
+        assert not _in_recovery(db)
+    assert router.primary_reads == 1
+
+    with session.replica_engine.connect() as connection:
+        connection.execute(text("SELECT pg_wal_replay_resume()"))
+    _check_until(router, healthy=True)
@@ -0,0 +1,87 @@
+"""Striped usage rollups against PostgreSQL at DATABASE_URL."""
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import delete, exc, select, text
+
+from app.core import usage
+from app.db import models
+from app.db.session import SessionLocal
+
+
+@pytest.fixture
+def user_id():
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        db.add(
+            models.User(
+                id=user_id,
+                email=f"rollups-{user_id}@example.com",
+                hashed_password="x",
+                api_key=f"rollups-{user_id}",
+            )
+        )
+        db.commit()
+    except (exc.OperationalError, exc.ProgrammingError) as e:
+        db.close()
+        pytest.skip(f"No migrated database at DATABASE_URL: {e}")
+    yield user_id
+    for model in (models.UsageRollup, models.UsageLog):
+        db.execute(delete(model).where(model.user_id == user_id))
+    db.execute(delete(models.User).where(models.User.id == user_id))
+    db.commit()
+    db.close()
+
+
+def _rollups(user_id):
+    with SessionLocal() as db:
+        return db.execute(
+            select(
+                models.UsageRollup.granularity,
+                models.UsageRollup.shard,
+                models.UsageRollup.count,
+            )
+            .where(models.UsageRollup.user_id == user_id)
+            .order_by(models.UsageRollup.granularity, models.UsageRollup.shard)
+        ).all()
+
+
+def test_concurrent_transactions_write_separate_stripes(user_id):
+    event = (user_id, "/api/otp/send", "success", datetime.now(timezone.utc), 1)
+    first, second = SessionLocal(), SessionLocal()
+    first.info["usage_rollup_shard"] = 0
+    second.info["usage_rollup_shard"] = 1
+    try:
+        usage.write_usage(first, [event])
+        # Would wait for the first transaction if both hit the same rows
+        second.execute(text("SET LOCAL lock_timeout = '1s'"))
+        usage.write_usage(second, [event])
+        second.commit()
+        first.commit()
+    finally:
+        first.close()
+        second.close()
+
+    assert _rollups(user_id) == [
+        ("day", 0, 1),
+        ("day", 1, 1),
+        ("hour", 0, 1),
+        ("hour", 1, 1),
+    ]
+
+
+def test_rebuild_folds_stripes(user_id):
+    now = datetime.now(timezone.utc)
+    for shard in (2, 5):
+        with SessionLocal() as db:
+            db.info["usage_rollup_shard"] = shard
+            usage.write_usage(db, [(user_id, "/api/otp/send", "success", now, 1)])
+            db.commit()
+
+    with SessionLocal() as db:
+        usage.rebuild_rollups(db, now)
+        db.commit()
+
+    assert _rollups(user_id) == [("day", 0, 2), ("hour", 0, 2)]
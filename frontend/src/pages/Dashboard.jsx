@@ -37,7 +37,7 @@ export const Dashboard = ({ user, onLogout }) => {
   const [stats, setStats] = useState([
     { label: 'Total Requests', value: '0', icon: <Activity className="w-5 h-5" />, change: 'Last 7 days', color: 'from-blue-500 to-indigo-500' },
     { label: 'Success Rate', value: '0%', icon: <CheckCircle className="w-5 h-5" />, change: 'Average', color: 'from-green-500 to-emerald-500' },
-    { label: 'Avg Latency', value: '0ms', icon: <Zap className="w-5 h-5" />, change: 'Global', color: 'from-orange-500 to-amber-500' },
+    { label: 'Avg Latency', value: '0ms', icon: <Zap className="w-5 h-5" />, change: 'This worker', color: 'from-orange-500 to-amber-500' },
     { label: 'Active Keys', value: '1', icon: <Settings className="w-5 h-5" />, change: 'Production', color: 'from-purple-500 to-pink-500' }
   ]);
   
@@ -55,7 +55,7 @@ export const Dashboard = ({ user, onLogout }) => {
         setStats([
           { label: 'Total Requests', value: s.total_requests.toString(), icon: <Activity className="w-5 h-5" />, change: 'Last 7 days', color: 'from-blue-500 to-indigo-500' },
           { label: 'Success Rate', value: s.success_rate, icon: <CheckCircle className="w-5 h-5" />, change: 'Average', color: 'from-green-500 to-emerald-500' },
-          { label: 'Avg Latency', value: s.avg_response, icon: <Zap className="w-5 h-5" />, change: 'Global', color: 'from-orange-500 to-amber-500' },
+          { label: 'Avg Latency', value: s.avg_response, icon: <Zap className="w-5 h-5" />, change: `This worker, ${s.latency_samples} requests`, color: 'from-orange-500 to-amber-500' },
           { label: 'Active Keys', value: '1', icon: <Settings className="w-5 h-5" />, change: 'Production', color: 'from-purple-500 to-pink-500' }
         ]);
 